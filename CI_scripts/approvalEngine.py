@@ -0,0 +1,78 @@
+"""Проверка апрувов на битовых масках.
+
+Каждому участнику команд при построении OwnershipModel назначается номер бита (model.user_bits),
+а каждой команде - маска ее участников (model.team_masks). Набор апрувов МР переводится в одну маску,
+после чего все правила проверки сводятся к операциям AND и подсчету единичных битов.
+"""
+
+# команда, двух апрувов от которой достаточно для влития независимо от остальных правил
+SUPER_APPROVAL_TEAM = 'Платформа ROnline'
+SUPER_APPROVALS = 2
+# минимальное число апрувов, если ни одна команда не отвечает за измененные файлы
+MIN_APPROVALS = 2
+
+
+class ApprovalEngine:
+    """Правила проверки апрувов для одной OwnershipModel.
+
+    evaluate возвращает то же, что validate_approvers_for_teams:
+    - True - апрувов достаточно;
+    - False - ответственных команд нет, а апрувов меньше MIN_APPROVALS;
+    - список команд, от которых не найдено ни одного апрува.
+    """
+
+    __slots__ = ('model', '_super_mask')
+
+    def __init__(self, model):
+        self.model = model
+        self._super_mask = model.team_masks.get(SUPER_APPROVAL_TEAM, 0)
+
+    def mask_of(self, usernames):
+        """Переводит usernames в битовую маску. Пользователи не из команд в маску не попадают."""
+        user_bits = self.model.user_bits
+        mask = 0
+        for username in usernames:
+            bit = user_bits.get(username)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def count_super_approvals(self, approvers):
+        """Считает апрувы от участников SUPER_APPROVAL_TEAM."""
+        return (self.mask_of(approvers) & self._super_mask).bit_count()
+
+    def evaluate(self, responsible_teams, provided_approvers, merge_author):
+        approved = self.mask_of(provided_approvers)
+        # если команда platform дала минимум 2 апрува, валидация успешна
+        if self._super_mask and (approved & self._super_mask).bit_count() >= SUPER_APPROVALS:
+            return True
+
+        author_bit = self.model.user_bits.get(merge_author)
+        without_author = ~(1 << author_bit) if author_bit is not None else -1
+        team_masks = self.model.team_masks
+        required = [(team, team_masks[team] & without_author) for team in responsible_teams if team in team_masks]
+
+        # если нет ответственных команд (или в них только автор), нужно не меньше MIN_APPROVALS апрувов
+        if not any(mask for _, mask in required):
+            return len(provided_approvers) >= MIN_APPROVALS
+
+        missing_approval = [team for team, mask in required if mask and not mask & approved]
+        return missing_approval if missing_approval else True
+
+
+def evaluate_many(contexts):
+    """Проверяет апрувы пачки МР за один вызов.
+
+    contexts - итерируемый объект EvaluationContext (собранных с with_approvals=True, не draft).
+    Для каждой модели конфига ApprovalEngine создается один раз, апрувы автора МР, как и в
+    checkCodeOwners, не учитываются. Возвращает список результатов ApprovalEngine.evaluate в порядке contexts.
+    """
+    engines = {}
+    results = []
+    for context in contexts:
+        engine = engines.get(id(context.model))
+        if engine is None:
+            engine = engines[id(context.model)] = ApprovalEngine(context.model)
+        approvers = [username for username in context.approvers if username != context.merge_author]
+        results.append(engine.evaluate(context.responsible_teams, approvers, context.merge_author))
+    return results
@@ -0,0 +1,217 @@
+"""Перенос коммитов (cherry-pick) во все релизные ветки с открытием МР и назначением ревьюверов.
+
+Для каждой ветки <prefix>-release* (все страницы списка веток) параллельно, но не более чем в --workers
+ветках одновременно:
+- от релизной ветки создается ветка backport-<sha первого коммита>-<релизная ветка>;
+- в нее по порядку переносятся коммиты; уже присутствующие в ветке коммиты пропускаются,
+  при конфликте ветка остается для ручного разрешения, МР не открывается;
+- открывается МР в релизную ветку, и ревьюверы назначаются той же логикой, что в setCodeOwners.py.
+Модели конфигов общие для всех веток (ConfigCache по blob SHA): ветки с одинаковым codeowners.json
+используют одну модель. Повторный запуск продолжает работу с уже созданными ветками и МР: если все коммиты
+уже есть в ветке бэкпорта, МР открывается (или переиспользуется), пока она опережает релизную ветку.
+В конце выводится сводка по всем веткам.
+
+Запуск: python CI_scripts/backportCodeOwners.py <prefix> <commit_sha> [<commit_sha> ...] [--workers 4]
+        [--skip-assign] [--dry-run]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sharedCodeOwners as shared
+import gitLabService as gitlab
+import matterMostNotificationSender as mm
+import mergeRequestProcessor as processor
+import notificationOutbox as outbox
+import setCodeOwners
+from configCache import ConfigCache
+
+RESULT_OPENED = "opened"
+RESULT_ALREADY_APPLIED = "already_applied"
+RESULT_CONFLICT = "conflict"
+RESULT_ERROR = "error"
+RESULT_PLANNED = "planned"
+
+# сколько секунд ждать, пока GitLab подготовит diff нового МР
+DIFF_WAIT_TIMEOUT = 30
+
+
+def _error_message(response):
+    try:
+        body = response.json()
+    except ValueError:
+        return response.text
+    return str(body.get('message', body)) if isinstance(body, dict) else str(body)
+
+
+class Backport:
+    """Перенос commit_shas во все релизные ветки проекта. run() возвращает список результатов по веткам:
+    {"branch", "backport_branch", "result", "merge_request" (web_url), "skipped" (уже перенесенные коммиты),
+    "message"}.
+    """
+
+    def __init__(self, prefix, commit_shas, workers=None, assign=True, dry_run=False):
+        self.prefix = prefix
+        self.commit_shas = list(commit_shas)
+        self.workers = workers or int(os.getenv("CODEOWNERS_BACKPORT_WORKERS", "4"))
+        self.assign = assign
+        self.dry_run = dry_run
+        self.job_name = os.getenv("CI_JOB_NAME", "backport")
+        self.gitlab_service = gitlab.create_service()
+        if assign and not dry_run:
+            self.team_excludes = setCodeOwners.read_team_excludes()
+            self.notification_sender = mm.MMNotificationSender()
+        self.config_cache = ConfigCache()
+
+    def backport_branch_name(self, branch):
+        return f"backport-{self.commit_shas[0][:8]}-{branch}"
+
+    def _create_branch(self, backport_branch, branch):
+        response = self.gitlab_service.create_new_branch(backport_branch, branch)
+        if response.ok:
+            return None
+        message = _error_message(response)
+        # ветка осталась от прошлого запуска: уже перенесенные коммиты будут пропущены
+        if "already exists" in message:
+            logging.info(f"Ветка {backport_branch} уже существует, используется она")
+            return None
+        return message
+
+    def _cherry_pick(self, backport_branch, result):
+        """Переносит коммиты по порядку. Возвращает заголовок первого перенесенного коммита или None при ошибке."""
+        title = None
+        for commit_sha in self.commit_shas:
+            response = self.gitlab_service.cherry_pick_commit_to_branch(commit_sha, backport_branch)
+            if response.ok:
+                title = title or response.json().get('title')
+                continue
+            try:
+                error_code = response.json().get('error_code')
+            except (ValueError, AttributeError):
+                error_code = None
+            if error_code == "empty":
+                # изменения коммита уже есть в ветке
+                result["skipped"].append(commit_sha[:8])
+                continue
+            result["result"] = RESULT_CONFLICT if error_code == "conflict" else RESULT_ERROR
+            result["message"] = f"{commit_sha[:8]}: {_error_message(response)}"
+            return None
+        return title or ""
+
+    def _open_merge_request(self, backport_branch, branch, title):
+        summary = f": {title}" if title else ""
+        if len(self.commit_shas) > 1:
+            summary += f" (+{len(self.commit_shas) - 1})"
+        response = self.gitlab_service.create_merge_request(backport_branch, branch,
+                                                            f"Backport to {branch}{summary}")
+        if response.ok:
+            return response.json()
+        if response.status_code == 409:
+            # МР из этой ветки уже открыт прошлым запуском; закрытые и слитые МР той же ветки не используются
+            merge_requests = [merge_request
+                              for merge_request in self.gitlab_service.get_merge_requests_by_branch(backport_branch)
+                              if merge_request['state'] == 'opened' and merge_request['target_branch'] == branch]
+            if merge_requests:
+                return merge_requests[0]
+        raise RuntimeError(_error_message(response))
+
+    def _wait_for_diff(self, merge_request):
+        """GitLab вычисляет diff нового МР асинхронно: пока diff_refs не заполнены, ответственных команд не найти."""
+        deadline = time.monotonic() + DIFF_WAIT_TIMEOUT
+        while not merge_request.get('diff_refs') and time.monotonic() < deadline:
+            time.sleep(1)
+            merge_request = self.gitlab_service.get_merge_request(merge_request['iid'])
+        return merge_request
+
+    def backport(self, branch):
+        backport_branch = self.backport_branch_name(branch)
+        result = {"branch": branch, "backport_branch": backport_branch, "result": RESULT_OPENED,
+                  "merge_request": None, "skipped": [], "message": ""}
+        if self.dry_run:
+            result["result"] = RESULT_PLANNED
+            return result
+
+        message = self._create_branch(backport_branch, branch)
+        if message:
+            result.update(result=RESULT_ERROR, message=f"ветка не создана: {message}")
+            return result
+        title = self._cherry_pick(backport_branch, result)
+        if title is None:
+            return result
+        if len(result["skipped"]) == len(self.commit_shas):
+            # "empty" означает лишь, что изменения уже есть в ветке бэкпорта: при повторном запуске они
+            # могли попасть туда прошлым запуском, а МР так и не открыться. Пустым МР будет, только если
+            # ветка бэкпорта не опережает релизную
+            commits = self.gitlab_service.get_commits_ahead(branch, backport_branch)
+            if not commits:
+                result["result"] = RESULT_ALREADY_APPLIED
+                return result
+            title = commits[0].get('title') or ""
+
+        merge_request = self._open_merge_request(backport_branch, branch, title)
+        result["merge_request"] = merge_request.get('web_url')
+        if self.assign:
+            merge_request = self._wait_for_diff(merge_request)
+            outcome = processor.process_merge_request(self.gitlab_service, self.notification_sender, merge_request,
+                                                      self.config_cache, self.team_excludes, self.job_name,
+                                                      assign=True, check=False)
+            if outcome == processor.RESULT_CONFIG_ERROR:
+                result["message"] = "ревьюверы не назначены: не удалось получить конфиг"
+        return result
+
+    def _safe_backport(self, branch):
+        try:
+            return self.backport(branch)
+        except Exception as e:
+            logging.exception(f"Ошибка переноса в ветку {branch}")
+            return {"branch": branch, "backport_branch": self.backport_branch_name(branch), "result": RESULT_ERROR,
+                    "merge_request": None, "skipped": [], "message": str(e)}
+
+    def run(self):
+        branches = sorted(branch['name'] for branch in self.gitlab_service.get_release_branches(self.prefix))
+        logging.info(f"Релизных веток {self.prefix}-release*: {len(branches)}")
+        if not branches:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(branches))) as executor:
+            return list(executor.map(self._safe_backport, branches))
+
+
+def print_summary(results):
+    for result in results:
+        line = f"{result['branch']:<30} {result['result']:<16} {result['merge_request'] or result['backport_branch']}"
+        if result["skipped"]:
+            line += f" (уже в ветке: {', '.join(result['skipped'])})"
+        if result["message"]:
+            line += f" - {result['message']}"
+        color = {RESULT_CONFLICT: "yellow", RESULT_ERROR: "red"}.get(result["result"], "green")
+        print(shared.color_text(line, color))
+    counts = {}
+    for result in results:
+        counts[result["result"]] = counts.get(result["result"], 0) + 1
+    print(", ".join(f"{name}: {count}" for name, count in sorted(counts.items())) or "Релизные ветки не найдены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prefix", help="префикс релизных веток (ветки <prefix>-release*)")
+    parser.add_argument("commit_shas", nargs="+", help="коммиты в порядке переноса")
+    parser.add_argument("--workers", type=int, help="максимум одновременно обрабатываемых веток")
+    parser.add_argument("--skip-assign", action="store_true", help="не назначать ревьюверов")
+    parser.add_argument("--dry-run", action="store_true", help="только показать ветки, ничего не создавать")
+    args = parser.parse_args()
+
+    backport = Backport(args.prefix, args.commit_shas, args.workers, not args.skip_assign, args.dry_run)
+    results = backport.run()
+    print_summary(results)
+    sys.exit(1 if any(result["result"] in (RESULT_CONFLICT, RESULT_ERROR) for result in results) else 0)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        # доставка уведомлений, поставленных в outbox (если он включен)
+        outbox.drain_pending()
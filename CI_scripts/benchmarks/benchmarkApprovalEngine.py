@@ -0,0 +1,94 @@
+"""Сравнение approvalEngine с прежней проверкой апрувов на множествах и списках.
+
+Запуск: python CI_scripts/benchmarks/benchmarkApprovalEngine.py --teams 200 --users 2000 --merge-requests 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import approvalEngine  # noqa: E402
+from evaluationContext import EvaluationContext  # noqa: E402
+from ownershipModel import OwnershipModel  # noqa: E402
+
+
+def legacy_validate_approvers_for_teams(responsible_teams, provided_approvers, model, merge_author):
+    """Прежняя реализация validate_approvers_for_teams (без отладочной печати), оставлена как эталон."""
+    owners = model.team_members.get(approvalEngine.SUPER_APPROVAL_TEAM)
+    if owners and sum(1 for item in provided_approvers if item in owners) >= 2:
+        return True
+
+    team_owners = {team: model.team_members[team] for team in responsible_teams if team in model.team_members}
+    all_approvers = set().union(*team_owners.values())
+    if merge_author in all_approvers:
+        all_approvers.remove(merge_author)
+    if not all_approvers:
+        return len(provided_approvers) >= 2
+
+    for team in team_owners:
+        team_owners[team] = [owner for owner in team_owners[team] if owner != merge_author]
+    missing_approval = [
+        team for team, owners in team_owners.items()
+        if owners and not any(approver in owners for approver in provided_approvers)
+    ]
+    return missing_approval if missing_approval else True
+
+
+def generate(teams_count, users_count, team_size, merge_requests_count, seed):
+    rng = random.Random(seed)
+    users = [f"user{n}" for n in range(users_count)]
+    teams = [{'name': approvalEngine.SUPER_APPROVAL_TEAM, 'team': rng.sample(users, team_size)}]
+    teams += [{'name': f"Команда {n}", 'team': rng.sample(users, team_size)} for n in range(teams_count)]
+    model = OwnershipModel({'paths': {}, 'teams': teams, 'users': []})
+
+    contexts = []
+    for n in range(merge_requests_count):
+        author = rng.choice(users)
+        responsible_teams = {f"Команда {rng.randrange(teams_count)}" for _ in range(rng.randint(0, 6))}
+        approvers = rng.sample(users, rng.randint(0, 8))
+        merge_request = {'iid': n, 'author': {'username': author}}
+        contexts.append(EvaluationContext(merge_request, approvers=approvers, model=model,
+                                          responsible_teams=responsible_teams))
+    return contexts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teams", type=int, default=200)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--team-size", type=int, default=30)
+    parser.add_argument("--merge-requests", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    contexts = generate(args.teams, args.users, args.team_size, args.merge_requests, args.seed)
+
+    started = time.perf_counter()
+    legacy_results = [
+        legacy_validate_approvers_for_teams(
+            context.responsible_teams,
+            [username for username in context.approvers if username != context.merge_author],
+            context.model, context.merge_author)
+        for context in contexts
+    ]
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    engine_results = approvalEngine.evaluate_many(contexts)
+    engine_time = time.perf_counter() - started
+
+    if legacy_results != engine_results:
+        print("Результаты approvalEngine и прежней проверки расходятся")
+        sys.exit(1)
+
+    print(f"teams={args.teams} users={args.users} merge_requests={args.merge_requests}")
+    print(f"legacy:            {legacy_time * 1000:10.2f} ms")
+    print(f"approvalEngine:    {engine_time * 1000:10.2f} ms ({args.merge_requests / engine_time:.0f} MR/s)")
+    print(f"speedup:           {legacy_time / engine_time:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Сквозной замер setCodeOwners.main и checkCodeOwners.main на локальной замене GitLab и MatterMost.
+
+Для каждого сценария (скрипт, API, размер конфига, число измененных файлов) генерируются синтетические
+конфиг и МР, скрипт запускается в отдельном процессе против fakeGitLabServer и записываются
+время выполнения, число запросов, переданные байты и пиковая память процесса.
+Результат сохраняется в JSON; если передан --baseline, сценарии сравниваются с ним и при регрессии
+скрипт завершается с кодом 1.
+
+Запуск: python CI_scripts/benchmarks/benchmarkEndToEnd.py --rules 10000 --teams 1000 --files 1,100,10000,100000
+        --output results.json [--baseline baseline.json --tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import fakeGitLabServer as fake
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = {"set": "setCodeOwners", "check": "checkCodeOwners"}
+RESULTS_VERSION = 1
+
+# переменные, которые меняют поведение скриптов и не должны попадать в замер из окружения
+ISOLATED_VARIABLES = ("CODEOWNERS_OUTBOX_PATH", "CODEOWNERS_VERDICT_STORE", "CODEOWNERS_INDEX_PATH",
+                      "CODEOWNERS_CONTEXT_PATH", "PROD_RO_CODEOWNERS_BOT_BULK_URL", "TEST_RO_CODEOWNERS_BOT_BULK_URL",
+                      "CI_MERGE_REQUEST_TARGET_BRANCH_NAME")
+
+# метрики, по которым ищутся регрессии: время и память сравниваются с допуском, запросы и байты - точно
+TOLERANT_METRICS = ("wall_time", "peak_memory_kb")
+EXACT_METRICS = ("requests", "bytes_sent", "bytes_received")
+
+
+def generate_config(rules_count, teams_count, team_size, seed):
+    """Генерирует конфиг: правила /Modules/ModuleN/Sources (каждое десятое - с вложенным правилом Generated),
+    команды из team_size участников и пользователей с gitlab_id.
+    """
+    rng = random.Random(seed)
+    users_count = max(team_size, teams_count * team_size // 2)
+    users = [f"user{n}" for n in range(users_count)]
+    teams = [{'name': f"Команда {n}", 'description': "", 'team': rng.sample(users, team_size)}
+             for n in range(teams_count)]
+    paths = {}
+    module = 0
+    while len(paths) < rules_count:
+        paths[f"/Modules/Module{module}/Sources"] = [teams[rng.randrange(teams_count)]['name']]
+        if module % 10 == 0 and len(paths) < rules_count:
+            paths[f"/Modules/Module{module}/Sources/Generated"] = [teams[rng.randrange(teams_count)]['name']]
+        module += 1
+    return {
+        'paths': paths,
+        'teams': teams,
+        'users': [{'username': username, 'gitlab_id': 1000 + n, 'name': username} for n, username in enumerate(users)],
+    }
+
+
+def generate_diff_paths(config, files_count, unowned_ratio, seed):
+    """Генерирует пути измененных файлов под правилами конфига, доля unowned_ratio - вне всех правил."""
+    rng = random.Random(seed)
+    rules = list(config['paths'])
+    diff_paths = []
+    for n in range(files_count):
+        if rng.random() < unowned_ratio:
+            diff_paths.append(f"Unowned/Folder{n % 97}/File{n}.swift")
+        else:
+            rule = rules[rng.randrange(len(rules))]
+            diff_paths.append(f"{rule[1:]}/Feature{n % 13}/File{n}.swift")
+    return diff_paths
+
+
+def pick_approvers(config, seed):
+    """Апрувы от одного участника каждой второй команды: часть ответственных команд остается без апрува."""
+    rng = random.Random(seed)
+    return sorted({rng.choice(team['team']) for team in config['teams'][::2]})
+
+
+#
+# ЗАПУСК
+#
+
+def run_child(module_name, repo_path, result_path):
+    """Выполняется в дочернем процессе: запускает main скрипта и записывает время и пиковую память."""
+    import resource
+
+    sys.path.insert(0, SCRIPTS_DIR)
+    started = time.perf_counter()
+    exit_code = 0
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            __import__(module_name).main(repo_path)
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        finally:
+            sys.stdout = stdout
+    wall_time = time.perf_counter() - started
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # на macOS ru_maxrss в байтах
+        peak_memory //= 1024
+    with open(result_path, 'w') as file:
+        json.dump({"exit_code": exit_code, "wall_time": wall_time, "peak_memory_kb": peak_memory}, file)
+
+
+def run_scenario(server, scenario, cache_dir):
+    """Запускает скрипт сценария в отдельном процессе и возвращает его метрики вместе с метриками сервера."""
+    environment = {name: value for name, value in os.environ.items() if name not in ISOLATED_VARIABLES}
+    environment.update({
+        "CI_SERVER_URL": server.url,
+        "CI_PROJECT_ID": "1",
+        "CI_MERGE_REQUEST_IID": "1",
+        "CI_MERGE_REQUEST_SOURCE_BRANCH_NAME": server.state.merge_request['source_branch'],
+        "CI_JOB_NAME": "benchmark",
+        "PRIVATE_TOKEN": "benchmark",
+        "RO_CODEOWNERS_BOT_DEV": "False",
+        "PROD_RO_CODEOWNERS_BOT_URL": server.url + fake.BOT_PATH,
+        "CODEOWNERS_TEAM_EXCLUDE": "[]",
+        "CODEOWNERS_DIFF_SOURCE": "api",
+        "CODEOWNERS_GITLAB_API": scenario["api"],
+        "CODEOWNERS_CACHE_DIR": cache_dir,
+        "LOG_LEVEL": "WARNING",
+    })
+    server.state.reset_stats()
+    with tempfile.TemporaryDirectory() as work_dir:
+        result_path = os.path.join(work_dir, "result.json")
+        command = [sys.executable, os.path.abspath(__file__), "--child", SCRIPTS[scenario["script"]],
+                   "--child-result", result_path]
+        process = subprocess.run(command, env=environment, cwd=work_dir, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0 or not os.path.exists(result_path):
+            raise RuntimeError(f"Сценарий {scenario['name']} завершился с ошибкой:\n{process.stderr[-2000:]}")
+        with open(result_path) as file:
+            metrics = json.load(file)
+    metrics.update(server.state.stats())
+    return dict(scenario, **metrics)
+
+
+def build_scenarios(args):
+    scenarios = []
+    for files_count in args.files:
+        for api in args.api:
+            for script in args.scripts:
+                name = f"{script}/{api}/rules={args.rules}/teams={args.teams}/files={files_count}"
+                scenarios.append({"name": name, "script": script, "api": api, "rules": args.rules,
+                                  "teams": args.teams, "files": files_count})
+    return scenarios
+
+
+def run(args):
+    config = generate_config(args.rules, args.teams, args.team_size, args.seed)
+    approvers = pick_approvers(config, args.seed)
+    state = fake.FakeGitLabState(config, [], approvers, latency=args.latency, error_rate=args.error_rate,
+                                 throttle_rate=args.throttle_rate, seed=args.seed)
+    server = fake.FakeGitLabServer(state).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as shared_cache_dir:
+            for scenario in build_scenarios(args):
+                state.diff_paths = generate_diff_paths(config, scenario["files"], args.unowned_ratio, args.seed)
+                samples = []
+                for _ in range(args.repeat):
+                    # без --warm-cache каждый запуск начинается с пустого кэша конфигов
+                    with tempfile.TemporaryDirectory() as cold_cache_dir:
+                        cache_dir = shared_cache_dir if args.warm_cache else cold_cache_dir
+                        samples.append(run_scenario(server, scenario, cache_dir))
+                # из повторов берется самый быстрый, как в остальных бенчмарках
+                result = min(samples, key=lambda sample: sample["wall_time"])
+                results.append(result)
+                print(f"{result['name']:<60} {result['wall_time'] * 1000:10.1f} ms {result['requests']:7} req "
+                      f"{(result['bytes_sent'] + result['bytes_received']) / 1024:10.1f} KiB "
+                      f"{result['peak_memory_kb'] / 1024:8.1f} MiB  exit={result['exit_code']}")
+    finally:
+        server.stop()
+    return results
+
+
+#
+# СРАВНЕНИЕ
+#
+
+def compare(results, baseline, tolerance):
+    """Возвращает список описаний регрессий относительно baseline (сценарии сопоставляются по name)."""
+    baseline_scenarios = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    regressions = []
+    for result in results:
+        previous = baseline_scenarios.get(result["name"])
+        if previous is None:
+            continue
+        for metric in TOLERANT_METRICS:
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{result['name']}: {metric} {previous[metric]:.3f} -> {result[metric]:.3f}")
+        for metric in EXACT_METRICS:
+            if result[metric] > previous[metric]:
+                regressions.append(f"{result['name']}: {metric} {previous[metric]} -> {result[metric]}")
+        if result["exit_code"] != previous["exit_code"]:
+            regressions.append(f"{result['name']}: exit code {previous['exit_code']} -> {result['exit_code']}")
+    return regressions
+
+
+def integers(value):
+    return [int(item) for item in value.split(",")]
+
+
+def names(choices):
+    def parse(value):
+        items = value.split(",")
+        unknown = set(items) - set(choices)
+        if unknown:
+            raise argparse.ArgumentTypeError(f"неизвестные значения: {', '.join(sorted(unknown))}")
+        return items
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--teams", type=int, default=1000)
+    parser.add_argument("--team-size", type=int, default=8)
+    parser.add_argument("--files", type=integers, default=[1, 100, 10000, 100000],
+                        help="число измененных файлов через запятую")
+    parser.add_argument("--unowned-ratio", type=float, default=0.05)
+    parser.add_argument("--scripts", type=names(SCRIPTS), default=list(SCRIPTS), help="set,check")
+    parser.add_argument("--api", type=names(("rest", "graphql")), default=["rest"], help="rest,graphql")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа сервера в секундах")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--warm-cache", action="store_true", help="не очищать кэш конфигов между запусками")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="результаты прошлого запуска для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="допустимый относительный рост времени и памяти (по умолчанию 0.2)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, os.getcwd(), args.child_result)
+        return
+
+    results = run(args)
+    report = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {"latency": args.latency, "error_rate": args.error_rate, "throttle_rate": args.throttle_rate,
+                       "team_size": args.team_size, "unowned_ratio": args.unowned_ratio,
+                       "warm_cache": args.warm_cache, "seed": args.seed},
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
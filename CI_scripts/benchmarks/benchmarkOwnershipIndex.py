@@ -0,0 +1,108 @@
+"""Сравнение OwnershipIndex с прежним линейным перебором правил.
+
+Запуск: python CI_scripts/benchmarks/benchmarkOwnershipIndex.py --rules 5000 --files 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ownershipIndex import OwnershipIndex  # noqa: E402
+
+
+def legacy_get_teams_owners_and_unowned_paths(diff_paths, codeowners_paths):
+    """Прежняя реализация get_teams_owners_and_unowned_paths, оставлена как эталон для сравнения."""
+    found_teams = set()
+    not_found_paths = []
+    for path in diff_paths:
+        components = path.split('/')
+        team_found = False
+        for owner_path in codeowners_paths.keys():
+            owner_path_items = owner_path[1:].split('/')
+            for module_item, owner_item in zip(components, owner_path_items):
+                if module_item != owner_item:
+                    break
+            else:
+                found_teams.update(codeowners_paths[owner_path])
+                team_found = True
+                break
+        if not team_found:
+            not_found_paths.append(path)
+    return found_teams, not_found_paths
+
+
+def generate_paths(rules_count, files_count, teams_count, unowned_ratio, seed):
+    """Генерирует непересекающиеся правила вида /Modules/ModuleN/Sources и файлы под ними.
+    На таких данных обе реализации обязаны давать одинаковый результат.
+    """
+    rng = random.Random(seed)
+    codeowners_paths = {
+        f"/Modules/Module{n}/Sources": [f"Команда {rng.randrange(teams_count)}"]
+        for n in range(rules_count)
+    }
+    diff_paths = []
+    for n in range(files_count):
+        if rng.random() < unowned_ratio:
+            diff_paths.append(f"Unowned/Folder{n % 97}/File{n}.swift")
+        else:
+            module = rng.randrange(rules_count)
+            diff_paths.append(f"Modules/Module{module}/Sources/Feature{n % 13}/File{n}.swift")
+    return codeowners_paths, diff_paths
+
+
+def measure(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--unowned-ratio", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--patterns", type=int, default=0,
+                        help="дополнительно замерить сопоставление с шаблонами вида Modules/ModuleN/**/*.swift")
+    args = parser.parse_args()
+
+    codeowners_paths, diff_paths = generate_paths(args.rules, args.files, args.teams, args.unowned_ratio, args.seed)
+
+    build_time, index = measure(lambda: OwnershipIndex(codeowners_paths), args.repeat)
+    index_time, index_result = measure(lambda: index.match_paths(diff_paths), args.repeat)
+    legacy_time, legacy_result = measure(
+        lambda: legacy_get_teams_owners_and_unowned_paths(diff_paths, codeowners_paths), args.repeat)
+
+    if index_result[0] != legacy_result[0] or sorted(index_result[1]) != sorted(legacy_result[1]):
+        print("Результаты OwnershipIndex и линейного перебора расходятся")
+        sys.exit(1)
+
+    print(f"rules={args.rules} files={args.files} teams={args.teams}")
+    print(f"legacy scan:       {legacy_time * 1000:10.2f} ms")
+    print(f"index build:       {build_time * 1000:10.2f} ms")
+    print(f"index match:       {index_time * 1000:10.2f} ms")
+    print(f"speedup (match):   {legacy_time / index_time:10.1f}x")
+    print(f"speedup (total):   {legacy_time / (build_time + index_time):10.1f}x")
+
+    if args.patterns:
+        pattern_paths = {f"Modules/Module{n}/**/*.swift": [f"Команда {n % args.teams}"] for n in range(args.patterns)}
+        pattern_build_time, pattern_index = measure(lambda: OwnershipIndex(pattern_paths), 1)
+        cold_time, _ = measure(lambda: pattern_index.match_paths(diff_paths), 1)
+        warm_time, _ = measure(lambda: pattern_index.match_paths(diff_paths), args.repeat)
+        print(f"patterns={args.patterns}")
+        print(f"pattern build:     {pattern_build_time * 1000:10.2f} ms")
+        print(f"pattern match:     {cold_time * 1000:10.2f} ms (cold), {warm_time * 1000:.2f} ms (warm)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Локальная замена GitLab и бота MatterMost для замеров без сети.
+
+Реализует endpoints, которые используют GitLabService (REST и GraphQL, включая поиск пользователей
+и нагрузку ревьюверов) и MMNotificationSender, для одного МР с заданными измененными файлами,
+апрувами и конфигом. Задержка ответа и доля ответов
+с ошибками (503) или ограничением частоты (429) настраиваются. Сервер считает запросы и переданные байты
+(тела запросов и ответов).
+
+Запуск отдельно: python CI_scripts/benchmarks/fakeGitLabServer.py --port 8080 --files 1000
+Затем скрипты запускаются с CI_SERVER_URL и PROD_RO_CODEOWNERS_BOT_URL, которые печатает сервер.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BOT_PATH = "/bot"
+BOT_BULK_PATH = "/bot/bulk"
+
+
+def git_blob_id(raw):
+    return hashlib.sha1(b"blob %d\0" % len(raw) + raw).hexdigest()
+
+
+class FakeGitLabState:
+    """Данные и счетчики сервера. Меняются между сценариями без перезапуска сервера."""
+
+    def __init__(self, config, diff_paths, approvers=(), author="author", latency=0.0, error_rate=0.0,
+                 throttle_rate=0.0, seed=42):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.set_config(config)
+        self.diff_paths = list(diff_paths)
+        self.approvers = list(approvers)
+        self.merge_request = {
+            'id': 1, 'iid': 1, 'project_id': 1, 'title': "Benchmark", 'web_url': "http://gitlab.local/mr/1",
+            'state': "opened", 'draft': False, 'sha': "0" * 40, 'source_branch': "feature",
+            'target_branch': "main", 'author': {'username': author}, 'reviewers': [],
+        }
+        self.reset_stats()
+
+    def set_config(self, config):
+        self.config = json.dumps(config, ensure_ascii=False).encode()
+        self.blob_id = git_blob_id(self.config)
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = Counter()
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.injected = Counter()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "requests_by_endpoint": dict(self.requests),
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+                "injected_errors": dict(self.injected),
+            }
+
+    def record(self, endpoint, received, sent):
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def injected_status(self):
+        """Возвращает код внедряемой ошибки (429, 503) или None."""
+        with self.lock:
+            roll = self.random.random()
+            if roll < self.throttle_rate:
+                self.injected[429] += 1
+                return 429
+            if roll < self.throttle_rate + self.error_rate:
+                self.injected[503] += 1
+                return 503
+        return None
+
+    #
+    # ОТВЕТЫ
+    #
+
+    def diff_page(self, page, per_page):
+        chunk = self.diff_paths[(page - 1) * per_page:page * per_page]
+        next_page = str(page + 1) if page * per_page < len(self.diff_paths) else ""
+        items = [{'old_path': path, 'new_path': path} for path in chunk]
+        return items, next_page
+
+    def approvals(self):
+        return {'approved_by': [{'user': {'username': username}} for username in self.approvers]}
+
+    @staticmethod
+    def open_reviews(username):
+        """Детерминированная нагрузка пользователя (число открытых ревью) для reviewerScheduler."""
+        return zlib.crc32(username.encode()) % 20
+
+    def graphql(self, request):
+        variables = request.get("variables") or {}
+        if "usernames" in variables:
+            nodes = [{'id': f"gid://gitlab/User/{zlib.crc32(username.encode()) % 100000}", 'username': username,
+                      'name': username, 'status': None,
+                      'reviewRequestedMergeRequests': {'count': self.open_reviews(username)}}
+                     for username in variables["usernames"]]
+            return {'data': {'users': {'nodes': nodes}}}
+        merge_request = self.merge_request
+        if "iids" in variables:
+            selected = ((variables.get("iids") is None or str(merge_request['iid']) in variables["iids"])
+                        and (variables.get("branches") is None
+                             or merge_request['source_branch'] in variables["branches"]))
+            nodes = [self._graphql_merge_request()] if selected else []
+            project = {'mergeRequests': {'pageInfo': {'hasNextPage': False, 'endCursor': None}, 'nodes': nodes}}
+            return {'data': {'projects': {'nodes': [project]}}}
+        repository = {name.replace("ref", "b", 1): {'nodes': [{'oid': self.blob_id}]}
+                      for name in variables if name.startswith("ref")}
+        return {'data': {'projects': {'nodes': [{'repository': repository}]}}}
+
+    def _graphql_merge_request(self):
+        merge_request = self.merge_request
+        return {
+            'iid': str(merge_request['iid']), 'title': merge_request['title'], 'webUrl': merge_request['web_url'],
+            'state': merge_request['state'], 'draft': merge_request['draft'], 'diffHeadSha': merge_request['sha'],
+            'sourceBranch': merge_request['source_branch'], 'targetBranch': merge_request['target_branch'],
+            'author': merge_request['author'],
+            'reviewers': {'nodes': [], 'pageInfo': {'hasNextPage': False}},
+            'approvedBy': {'nodes': [{'username': username} for username in self.approvers],
+                           'pageInfo': {'hasNextPage': False}},
+            'diffStats': [{'path': path} for path in self.diff_paths],
+        }
+
+
+class FakeGitLabHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело пишутся отдельно: без этого keep-alive клиенты ждут delayed ACK на каждом ответе
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, endpoint, received, status, body=b"", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        self.server.state.record(endpoint, received, len(body) if self.command != "HEAD" else 0)
+
+    def _handle(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        url = urlsplit(self.path)
+        path, query = url.path, parse_qs(url.query)
+        endpoint = self._endpoint(path)
+
+        if state.latency:
+            time.sleep(state.latency)
+        status = state.injected_status()
+        if status == 429:
+            return self._send(endpoint, len(data), 429, {'message': "Retry later"}, {'Retry-After': "0"})
+        if status == 503:
+            return self._send(endpoint, len(data), 503, {'message': "Unavailable"})
+
+        status, body, headers = self._respond(state, endpoint, path, query, data)
+        return self._send(endpoint, len(data), status, body, headers)
+
+    do_GET = do_HEAD = do_POST = do_PUT = _handle
+
+    @staticmethod
+    def _endpoint(path):
+        """Имя endpoint для статистики: путь без идентификаторов."""
+        if path.startswith(BOT_PATH):
+            return "mm_bulk" if path == BOT_BULK_PATH else "mm"
+        if path == "/api/graphql":
+            return "graphql"
+        path = re.sub(r"^/api/v4/projects/[^/]+", "", path)
+        path = re.sub(r"/merge_requests/\d+", "/merge_requests/:iid", path)
+        path = re.sub(r"/statuses/\w+", "/statuses/:sha", path)
+        path = re.sub(r"/commits/\w+", "/commits/:sha", path)
+        return path or "/"
+
+    def _respond(self, state, endpoint, path, query, data):
+        merge_request = state.merge_request
+        if endpoint in ("mm", "mm_bulk"):
+            return 200, {'ok': True}, None
+        if endpoint == "graphql":
+            return 200, state.graphql(json.loads(data)), None
+        if endpoint.endswith("/repository/files/codeowners.json"):
+            return 200, b"", {'X-Gitlab-Blob-Id': state.blob_id}
+        if endpoint.endswith("/repository/files/codeowners.json/raw"):
+            return 200, state.config, None
+        if endpoint == "/api/v4/merge_requests":
+            # открытые ревью пользователя во всех проектах: важен только X-Total
+            username = query.get('reviewer_username', [""])[0]
+            return 200, [], {'X-Total': str(state.open_reviews(username))}
+        if endpoint == "/merge_requests":
+            if self.command == "POST":
+                return 201, merge_request, None
+            return 200, [merge_request], {'X-Next-Page': ""}
+        if endpoint == "/merge_requests/:iid":
+            if self.command == "PUT":
+                reviewer_ids = json.loads(data or b"{}").get('reviewer_ids', [])
+                return 200, dict(merge_request, reviewers=[{'id': user_id} for user_id in reviewer_ids]), None
+            return 200, merge_request, None
+        if endpoint == "/merge_requests/:iid/diffs":
+            page = int(query.get('page', ["1"])[0])
+            per_page = int(query.get('per_page', ["20"])[0])
+            items, next_page = state.diff_page(page, per_page)
+            return 200, items, {'X-Next-Page': next_page}
+        if endpoint == "/merge_requests/:iid/changes":
+            items, _ = state.diff_page(1, len(state.diff_paths) or 1)
+            return 200, dict(merge_request, changes=items), None
+        if endpoint == "/merge_requests/:iid/approvals":
+            return 200, state.approvals(), None
+        if endpoint == "/users":
+            username = query.get('username', [""])[0]
+            return 200, [{'id': zlib.crc32(username.encode()) % 100000, 'username': username}], None
+        if endpoint == "/repository/branches" and self.command == "GET":
+            return 200, [], {'X-Next-Page': ""}
+        if self.command in ("POST", "PUT"):
+            # комментарии, статусы коммитов, ветки, cherry-pick
+            return 201, {'id': 1}, None
+        return 404, {'message': "404 Not Found"}, None
+
+
+class FakeGitLabServer:
+    """ThreadingHTTPServer с FakeGitLabState. url - адрес для CI_SERVER_URL."""
+
+    def __init__(self, state, host="127.0.0.1", port=0):
+        self.state = state
+        self.httpd = ThreadingHTTPServer((host, port), FakeGitLabHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = state
+        self.url = f"http://{host}:{self.httpd.server_port}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--config", help="путь к codeowners.json (по умолчанию - синтетический конфиг)")
+    parser.add_argument("--files", type=int, default=100, help="число измененных файлов МР")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа в секундах")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="доля ответов 429")
+    args = parser.parse_args()
+
+    import benchmarkEndToEnd
+    if args.config:
+        with open(args.config, encoding="utf-8") as file:
+            config = json.load(file)
+    else:
+        config = benchmarkEndToEnd.generate_config(1000, 100, 10, 42)
+    state = FakeGitLabState(config, benchmarkEndToEnd.generate_diff_paths(config, args.files, 0.05, 42),
+                            latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    server = FakeGitLabServer(state, port=args.port)
+    print(f"CI_SERVER_URL={server.url} PROD_RO_CODEOWNERS_BOT_URL={server.url}{BOT_PATH}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(state.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,159 @@
 import sharedCodeOwners as shared
 import gitLabService as gitlab
 import matterMostNotificationSender as mm
+import evaluationContext as evaluation
+import approvalEngine
+import contextArtifact
+import verdictStore
+import instrumentation
+import notificationOutbox as outbox
 # import json
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 
-def contains_at_least(amount, source, target):
+def contains_at_least(amount, model, target):
     """Проверяет, содержит ли target хотя бы указанное количество апруверов из команды platform."""
-    owners = list(map(lambda team: team['team'], filter(lambda team: team['name'] == 'Платформа ROnline', source)))
-    if owners:
-        count = sum(1 for item in target if item in owners[0])
-        return count >= amount
-    return False
+    if not model.team_masks.get(approvalEngine.SUPER_APPROVAL_TEAM):
+        return False
+    return approvalEngine.ApprovalEngine(model).count_super_approvals(target) >= amount
 
 
-def validate_approvers_for_diff(diff_paths, provided_approvers, codeowners_data, merge_author):
-    codeowners_paths = codeowners_data['paths']
-    codeowners_teams = codeowners_data['teams']
+def validate_approvers_for_diff(diff_paths, provided_approvers, model, merge_author):
+    responsible_teams, not_found_paths = shared.get_teams_owners_and_unowned_paths(diff_paths, model.index)
+    return validate_approvers_for_teams(responsible_teams, provided_approvers, model, merge_author)
 
-    responsible_teams, not_found_paths = shared.get_teams_owners_and_unowned_paths(diff_paths, codeowners_paths)
 
-    # Если команда platform дала минимум 2 апрува, валидация успешна.
-    if contains_at_least(2, codeowners_teams, provided_approvers):
-        return True
-
-    team_owners = shared.get_members_of_teams(responsible_teams, codeowners_teams)
-    all_approvers = set().union(*team_owners.values())
-
-    print(team_owners)
-    print(all_approvers)
-
-    if merge_author in all_approvers:
-        all_approvers.remove(merge_author)
-
-    print(all_approvers)
-
-    # Если нет ответственных команд для изменённых файлов, проверяет, что общее число апруверов равно или больше 2.
-    if not all_approvers:
-        return len(provided_approvers) >= 2
-
-    print(team_owners)
-
-    for team in team_owners:
-        team_owners[team] = [owner for owner in team_owners[team] if owner != merge_author]
-
-    print(team_owners)
-
-    # Если команды ответственны, проверяет, что для каждой команды есть хотя бы один апрувер из предоставленных.
-    missing_approval = [
-        team for team, owners in team_owners.items()
-        if owners and not any(approver in owners for approver in provided_approvers)
-    ]
-
-    return missing_approval if missing_approval else True
+def validate_approvers_for_teams(responsible_teams, provided_approvers, model, merge_author):
+    """Проверяет апрувы по правилам approvalEngine.ApprovalEngine:
+    - минимум 2 апрува от команды platform достаточно;
+    - если ответственных команд нет, нужно не меньше 2 апрувов (иначе возвращается False);
+    - иначе от каждой ответственной команды нужен хотя бы один апрув (автор МР не учитывается),
+      возвращается список команд без апрува.
+    """
+    return approvalEngine.ApprovalEngine(model).evaluate(responsible_teams, provided_approvers, merge_author)
 
 
 def main(repo_path):
-    gitlab_service = gitlab.GitLabService()
+    gitlab_service = gitlab.create_service()
     notification_sender = mm.MMNotificationSender()
     source_branch_name = os.getenv("CI_MERGE_REQUEST_SOURCE_BRANCH_NAME")
+    job_name = os.getenv("CI_JOB_NAME")
 
-    merge_request = gitlab_service.get_merge_requests_by_branch(source_branch_name)[0]
-    merge_author = merge_request['author']['username']
-
-    approval_users = gitlab_service.get_merge_request_approvals(merge_request['iid'])
-    approval_usersnames = [entry['user']['username'] for entry in approval_users['approved_by']]
+    # если джоба назначения ревьюверов сохранила контекст для этого же МР, коммита и конфига,
+    # запрашиваются только апрувы
+    artifact_context = None
+    merge_request = None
+    config_sha = None
+    context_path = os.getenv("CODEOWNERS_CONTEXT_PATH")
+    merge_request_iid = os.getenv("CI_MERGE_REQUEST_IID")
+    if context_path and merge_request_iid:
+        # МР мог стать draft без нового коммита, а конфиг целевой ветки - измениться, поэтому МР и blob SHA
+        # конфига запрашиваются заново (параллельно)
+        target_branch = os.getenv("CI_MERGE_REQUEST_TARGET_BRANCH_NAME")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            merge_request_future = executor.submit(gitlab_service.get_merge_request, merge_request_iid)
+            config_sha_future = None
+            if target_branch:
+                config_sha_future = executor.submit(gitlab_service.get_codeowners_conf_blob_id, target_branch)
+            merge_request = merge_request_future.result()
+            if merge_request['target_branch'] != target_branch:
+                config_sha_future = executor.submit(gitlab_service.get_codeowners_conf_blob_id,
+                                                    merge_request['target_branch'])
+            config_sha = config_sha_future.result()
+        if not merge_request['draft']:
+            # в merged results pipeline CI_COMMIT_SHA - коммит слияния, а головной коммит МР -
+            # CI_MERGE_REQUEST_SOURCE_BRANCH_SHA (в обычном pipeline МР она пуста)
+            head_sha = os.getenv("CI_MERGE_REQUEST_SOURCE_BRANCH_SHA") or os.getenv("CI_COMMIT_SHA")
+            artifact_context = contextArtifact.load_context(context_path, merge_request_iid, head_sha, config_sha)
+        if artifact_context is not None:
+            merge_request = artifact_context.merge_request
+    store = verdictStore.get_store()
+
+    def compute_context():
+        if artifact_context is not None:
+            print(shared.color_text("Используется контекст, сохраненный джобой назначения ревьюверов", "green"))
+            artifact_context.approvers = evaluation.get_approvers(gitlab_service, artifact_context.merge_request['iid'])
+            return artifact_context
+        # МР, апрувы, конфиг и diff запрашиваются параллельно
+        try:
+            return evaluation.prefetch_context(gitlab_service, source_branch_name, repo_path, with_approvals=True,
+                                               merge_request=merge_request, collect_paths=store is not None,
+                                               target_branch=os.getenv("CI_MERGE_REQUEST_TARGET_BRANCH_NAME"))
+        except KeyError:
+            print(shared.color_text("Не удалось получить конфиг", "red"))
+            exit(1)
+
+    if store is None:
+        sys.exit(check_approvals(gitlab_service, notification_sender, compute_context(), job_name))
+
+    if merge_request is None:
+        merge_request = gitlab_service.get_merge_requests_by_branch(source_branch_name)[0]
+    sys.exit(check_approvals_incremental(gitlab_service, notification_sender, merge_request, job_name, store,
+                                         compute_context, config_sha))
+
+
+def check_approvals_incremental(gitlab_service, notification_sender, merge_request, job_name, store, compute_context,
+                                config_sha=None):
+    """Проверяет апрувы МР, используя результаты прошлых проверок из verdictStore.VerdictStore.
+
+    - если для коммита, конфига и набора апрувов уже есть вердикт, он возвращается сразу, без уведомлений;
+    - если изменились только апрувы, покрытие команд пересчитывается по сохраненным ответственным командам;
+    - иначе compute_context() собирает полный EvaluationContext с апрувами, как при обычной проверке.
+    SHA конфига, если он уже известен, передается в config_sha. Возвращает код завершения, как check_approvals.
+    """
+    if merge_request['draft']:
+        return check_approvals(gitlab_service, notification_sender, compute_context(), job_name)
 
-    diff_paths = gitlab_service.get_merge_request_changes(merge_request['iid'])
-    job_name = os.getenv("CI_JOB_NAME")
+    merge_author = merge_request['author']['username']
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        approvers_future = executor.submit(evaluation.get_approvers, gitlab_service, merge_request['iid'])
+        config_sha = config_sha or gitlab_service.get_codeowners_conf_blob_id(merge_request['target_branch'])
+        approvers = [username for username in approvers_future.result() if username != merge_author]
+
+    key = (gitlab_service.project_id, merge_request['iid'], merge_request['sha'], config_sha)
+    evaluation_data = store.get_evaluation(key) if config_sha else None
+    if evaluation_data is not None:
+        changed = len(evaluation_data['changed_paths'] or ())
+        code = store.get_verdict(key, approvers)
+        if code is not None:
+            instrumentation.increment("verdict_store_hits")
+            print(shared.color_text(
+                f"Коммит, конфиг и апрувы не изменились с прошлой проверки, результат: {code}. Пропущено: "
+                f"загрузка diff ({changed} файлов) и конфига, сопоставление с командами, проверка апрувов, "
+                f"уведомления", "green"))
+            return code
+
+        instrumentation.increment("evaluation_store_hits")
+        context = contextArtifact.deserialize_context(evaluation_data)
+        context.approvers = approvers
+        code = check_approvals(gitlab_service, notification_sender, context, job_name)
+        store.put_verdict(key, approvers, code)
+        print(shared.color_text(
+            f"Изменились только апрувы: покрытие {len(context.responsible_teams)} команд пересчитано по "
+            f"сохраненным данным. Пропущено: загрузка diff ({changed} файлов) и конфига, сопоставление с командами",
+            "green"))
+        return code
+
+    context = compute_context()
+    code = check_approvals(gitlab_service, notification_sender, context, job_name)
+    if context.config_sha and not context.merge_request['draft']:
+        # ключ берется из самого контекста: коммит, конфиг и апрувы могли измениться с момента запроса выше
+        key = (gitlab_service.project_id, context.merge_request['iid'], context.merge_request['sha'],
+               context.config_sha)
+        store.put_evaluation(key, contextArtifact.serialize_context(context))
+        store.put_verdict(key, [username for username in context.approvers if username != merge_author], code)
+    print(shared.color_text("Полная проверка: коммит или конфиг изменились с прошлой проверки", "yellow"))
+    return code
+
+
+def check_approvals(gitlab_service, notification_sender, context, job_name):
+    """Проверяет апрувы МР по собранному EvaluationContext и уведомляет автора о недостающих.
+    Возвращает код завершения джобы: 0 - апрувов достаточно, 1 - нет.
+    """
+    merge_request = context.merge_request
+    merge_author = context.merge_author
 
     # для draft исключаем возможность назначения ревьюверов
     if merge_request['draft']:
@@ -79,41 +164,47 @@ def main(repo_path):
                 draft_message
             )
         print(shared.color_text(draft_message, "red"))
-        sys.exit(1)
-
-    try:
-        codeowners_data = gitlab_service.get_codeowners_conf(source_branch_name)
-    except KeyError:
-        print(shared.color_text("Не удалось получить конфиг", "red"))
-        exit(1)
-
-    result = validate_approvers_for_diff(
-        diff_paths,
-        [username for username in approval_usersnames if username != merge_author],  # if username != merge_author
-        codeowners_data,                                                             # исключает возможность апрува
-        merge_author                                                                 # самому себе
-    )
+        return 1
+
+    model = context.model
+    with instrumentation.span("approvals"):
+        result = validate_approvers_for_teams(
+            context.responsible_teams,
+            [username for username in context.approvers if username != merge_author],  # if username != merge_author
+            model,                                                                      # исключает возможность апрува
+            merge_author                                                                # самому себе
+        )
 
     if result is False:
-        notification_sender.send_message(merge_author,
-                                         "Не найдено достаточное колличество апрувов.\n" +
-                                         "Для влития нужно получить как минимум 2 апрува")
+        with instrumentation.span("notify"):
+            notification_sender.send_message(merge_author,
+                                             "Не найдено достаточное колличество апрувов.\n" +
+                                             "Для влития нужно получить как минимум 2 апрува",
+                                             merge_request['iid'])
         print(shared.color_text("😭 Не найдено достаточное колличество апрувов.\n" +
                                 "Для влития нужно получить как минимум 2 апрува", "yellow"))
-        sys.exit(1)
+        return 1
 
     elif result is not True:
-        codeowners_teams = codeowners_data['teams']
-        team_owners = shared.get_members_of_teams(result, codeowners_teams)
+        with instrumentation.span("membership"):
+            team_owners = shared.get_members_of_teams(result, model)
         formatted_teams = shared.format_teams_to_mm(team_owners)
-        gitlab_service.create_thread(
-            merge_request['iid'],
-            f"Не найден апрув от команд \n {formatted_teams}"
-        )
-        notification_sender.send_message(merge_author, f"Не найден апрув от команд \n {formatted_teams}")
+        with instrumentation.span("notify"):
+            gitlab_service.create_thread(
+                merge_request['iid'],
+                f"Не найден апрув от команд \n {formatted_teams}"
+            )
+            notification_sender.send_message(merge_author, f"Не найден апрув от команд \n {formatted_teams}",
+                                             merge_request['iid'])
         print(shared.color_text(f"😭 Не найден апрув от команд \n - {formatted_teams}", "yellow"))
-        sys.exit(1)
+        return 1
+
+    return 0
 
 
 if __name__ == "__main__":
-    main(sys.argv[1])
+    try:
+        main(sys.argv[1])
+    finally:
+        # доставка уведомлений, поставленных в outbox (если он включен)
+        outbox.drain_pending()
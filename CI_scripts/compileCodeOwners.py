@@ -0,0 +1,122 @@
+"""Проверяет codeowners.json и компилирует его в бинарный индекс для быстрой загрузки в CI-джобах.
+
+Запуск: python CI_scripts/compileCodeOwners.py codeowners.json [-o codeowners.idx] [--strict] [--lint-only]
+
+Находит правила, которые раньше молча допускались:
+- duplicate - правило записано несколько раз (в том числе как /A/B и /A/B/), действует только последнее;
+- shadowed - вложенное правило записано после родительского: при прежнем порядке "первое совпадение"
+  оно никогда не применялось, теперь оно переопределяет родительское - проверьте, что так и задумано;
+- redundant - вложенное правило с теми же командами, что и родительское, его можно удалить;
+- unreachable - правило (кроме отрицания) без команд или только с командами, которых нет в секции teams:
+  ревьюверы по нему никогда не назначаются.
+
+Ограничения:
+- шаблоны (*, **, ?, [...], '!') проверяются только на повторяющиеся ключи и unreachable: шаблоны, перекрытые
+  другими правилами или не совпадающие ни с одним файлом, не находятся (правила без совпадений с файлами
+  показывает coverageReport.py);
+- в индекс записываются только сами шаблоны: автомат для них строится заново после каждой загрузки индекса,
+  при первом сопоставлении (это время растет с числом шаблонов, литеральные правила читаются из индекса).
+
+Собранный индекс подключается в джобах через CODEOWNERS_INDEX_PATH.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import compiledIndex
+import sharedCodeOwners as shared
+from ownershipIndex import split_rule_path, is_pattern
+
+
+def load_config(raw):
+    """Разбирает codeowners.json, запоминая повторяющиеся ключи (json.loads молча оставляет последний)."""
+    duplicate_keys = []
+
+    def collect_pairs(pairs):
+        seen = set()
+        for key, _ in pairs:
+            if key in seen:
+                duplicate_keys.append(key)
+            seen.add(key)
+        return dict(pairs)
+
+    return json.loads(raw, object_pairs_hook=collect_pairs), duplicate_keys
+
+
+def lint_config(codeowners_data, duplicate_keys=()):
+    """Возвращает список найденных проблем (вид, правило, описание)."""
+    problems = [("duplicate", key, "ключ записан в JSON несколько раз, действует последнее значение")
+                for key in duplicate_keys]
+    defined_teams = {team['name'] for team in codeowners_data['teams']}
+
+    literal_rules = {}
+    for order, (owner_path, teams) in enumerate(codeowners_data['paths'].items()):
+        if not owner_path.startswith('!') and not set(teams) & defined_teams:
+            problems.append(("unreachable", owner_path, "нет ни одной команды из секции teams"))
+        if is_pattern(owner_path):
+            continue
+        components = tuple(split_rule_path(owner_path))
+        if components in literal_rules:
+            problems.append(("duplicate", owner_path,
+                             f"совпадает с правилом {literal_rules[components][0]}, действует последнее"))
+        literal_rules[components] = (owner_path, order, frozenset(teams))
+
+    for components, (owner_path, order, teams) in literal_rules.items():
+        for length in range(len(components) - 1, -1, -1):
+            parent = literal_rules.get(components[:length])
+            if parent is None:
+                continue
+            parent_path, parent_order, parent_teams = parent
+            if parent_teams == teams:
+                problems.append(("redundant", owner_path, f"те же команды, что у родительского {parent_path}"))
+            elif parent_order < order:
+                problems.append(("shadowed", owner_path,
+                                 f"записано после родительского {parent_path}: раньше не применялось, "
+                                 f"теперь переопределяет его"))
+            break
+    return problems
+
+
+def write_index(data, path):
+    """Атомарно записывает индекс: параллельно запущенные джобы не увидят недописанный файл."""
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("config", help="путь к codeowners.json")
+    parser.add_argument("-o", "--output", default="codeowners.idx", help="путь к бинарному индексу")
+    parser.add_argument("--strict", action="store_true", help="завершиться с ошибкой, если найдены проблемы")
+    parser.add_argument("--lint-only", action="store_true", help="только проверить конфиг, индекс не собирать")
+    args = parser.parse_args()
+
+    with open(args.config, 'rb') as file:
+        raw = file.read()
+    codeowners_data, duplicate_keys = load_config(raw)
+
+    problems = lint_config(codeowners_data, duplicate_keys)
+    for kind, owner_path, description in problems:
+        print(shared.color_text(f"{kind}: {owner_path} - {description}", "yellow"))
+    if not problems:
+        print(shared.color_text("Проблем в конфиге не найдено", "green"))
+
+    if not args.lint_only:
+        data = compiledIndex.compile_index(codeowners_data, compiledIndex.git_blob_id(raw))
+        write_index(data, args.output)
+        print(f"Индекс записан в {args.output}: {len(codeowners_data['paths'])} правил, {len(data)} байт")
+
+    sys.exit(1 if problems and args.strict else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""Бинарный индекс владельцев, скомпилированный заранее из codeowners.json (см. compileCodeOwners.py).
+
+Формат (little-endian), версия FORMAT_VERSION:
+- заголовок HEADER: сигнатура, версия, git blob SHA исходного конфига, размеры таблиц и число команд
+  из секции teams (они идут в таблице команд первыми);
+- строки: смещения u32[n_strings + 1] и общий блок UTF-8 (все имена хранятся один раз);
+- узлы префиксного дерева: (правило i32, первое ребро u32, число ребер u32);
+- ребра: (строка-компонент u32, дочерний узел u32), у каждого узла отсортированы по байтам компонента;
+- правила: (строка-путь u32, конкретность u32, флаги u32, первая команда u32, число команд u32);
+- команды правил: u32 - номера команд;
+- команды: (строка-имя u32, первый участник u32, число участников u32);
+- участники команд: u32 - номера пользователей;
+- пользователи: (строка-username u32, gitlab_id i64, -1 если неизвестен).
+
+Файл открывается через mmap, таблицы читаются по требованию, поэтому загрузка не зависит от размера конфига.
+"""
+import hashlib
+import mmap
+import struct
+from functools import cached_property
+
+from ownershipIndex import split_rule_path, is_pattern, pattern_specificity, PatternAutomaton
+from ownershipModel import OwnershipModel, build_bitmasks
+
+MAGIC = b"COIX"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sI40sIIIIIIIII")
+NODE = struct.Struct("<iII")
+EDGE = struct.Struct("<II")
+RULE = struct.Struct("<IIIII")
+TEAM = struct.Struct("<III")
+USER = struct.Struct("<Iq")
+U32 = struct.Struct("<I")
+
+RULE_PATTERN = 1
+RULE_NEGATED = 2
+
+
+def git_blob_id(raw):
+    """Вычисляет git blob SHA содержимого файла - тот же, что возвращает GitLab в X-Gitlab-Blob-Id."""
+    return hashlib.sha1(b"blob %d\0" % len(raw) + raw).hexdigest()
+
+
+#
+# ЗАПИСЬ
+#
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[value] = string_id
+            self.values.append(value)
+        return string_id
+
+
+def compile_index(codeowners_data, blob_id=""):
+    """Компилирует разобранный codeowners.json в байты бинарного индекса."""
+    strings = _StringTable()
+
+    # пользователи: сначала из секции users, затем участники команд, которых там нет
+    user_numbers = {}
+    users = []
+    for user in codeowners_data['users']:
+        if user['username'] not in user_numbers:
+            user_numbers[user['username']] = len(users)
+            users.append((strings.intern(user['username']), user['gitlab_id']))
+    for team in codeowners_data['teams']:
+        for member in team['team']:
+            if member not in user_numbers:
+                user_numbers[member] = len(users)
+                users.append((strings.intern(member), -1))
+
+    # команды (при повторе имени действует последнее описание, как в OwnershipModel)
+    team_definitions = {team['name']: team['team'] for team in codeowners_data['teams']}
+    team_numbers = {}
+    teams = []
+    team_members = []
+    for name, members in team_definitions.items():
+        team_numbers[name] = len(teams)
+        unique_members = sorted({user_numbers[member] for member in members})
+        teams.append((strings.intern(name), len(team_members), len(unique_members)))
+        team_members.extend(unique_members)
+
+    defined_teams = len(teams)
+
+    # правила и префиксное дерево литеральных правил
+    rules = []
+    rule_teams = []
+    root = [{}, -1]
+    for owner_path, owner_teams in codeowners_data['paths'].items():
+        rule_id = len(rules)
+        flags = 0
+        if is_pattern(owner_path):
+            flags |= RULE_PATTERN
+            if owner_path.startswith('!'):
+                flags |= RULE_NEGATED
+        else:
+            node = root
+            for item in split_rule_path(owner_path):
+                node = node[0].setdefault(item, [{}, -1])
+            node[1] = rule_id
+        # команды, не описанные в секции teams, сохраняются по имени, чтобы результат совпадал с OwnershipIndex
+        for team in owner_teams:
+            if team not in team_numbers:
+                team_numbers[team] = len(teams)
+                teams.append((strings.intern(team), 0, 0))
+        rules.append((strings.intern(owner_path), pattern_specificity(owner_path), flags,
+                      len(rule_teams), len(owner_teams)))
+        rule_teams.extend(team_numbers[team] for team in owner_teams)
+
+    # дерево раскладывается в плоские массивы обходом в ширину
+    nodes = []
+    edges = []
+    queue = [root]
+    position = 0
+    while position < len(queue):
+        node = queue[position]
+        position += 1
+        children = sorted(node[0].items(), key=lambda item: item[0].encode())
+        nodes.append((node[1], len(edges), len(children)))
+        for label, child in children:
+            edges.append((strings.intern(label), len(queue)))
+            queue.append(child)
+
+    encoded = [value.encode() for value in strings.values]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    blob = b"".join(encoded)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, blob_id.encode().ljust(40, b"\0"), len(encoded), len(nodes),
+                         len(edges), len(rules), len(rule_teams), len(teams), len(team_members), len(users),
+                         defined_teams)
+    parts = [header]
+    parts.append(b"".join(U32.pack(offset) for offset in offsets))
+    parts.append(blob + b"\0" * (-len(blob) % 4))
+    parts.append(b"".join(NODE.pack(*node) for node in nodes))
+    parts.append(b"".join(EDGE.pack(*edge) for edge in edges))
+    parts.append(b"".join(RULE.pack(*rule) for rule in rules))
+    parts.append(b"".join(U32.pack(team) for team in rule_teams))
+    parts.append(b"".join(TEAM.pack(*team) for team in teams))
+    parts.append(b"".join(U32.pack(member) for member in team_members))
+    parts.append(b"".join(USER.pack(*user) for user in users))
+    return b"".join(parts)
+
+
+#
+# ЧТЕНИЕ
+#
+
+class MappedIndex:
+    """Индекс владельцев поверх mmap бинарного файла. Интерфейс совпадает с OwnershipIndex."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, blob_id, self._n_strings, self._n_nodes, self._n_edges, self._n_rules,
+         self._n_rule_teams, self._n_teams, self._n_team_members, self._n_users, self._n_defined_teams) = \
+            HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path}: неподдерживаемый формат индекса (версия {version})")
+        self.blob_id = blob_id.rstrip(b"\0").decode()
+
+        self._strings_offset = HEADER.size
+        self._blob_offset = self._strings_offset + U32.size * (self._n_strings + 1)
+        blob_size = U32.unpack_from(self._buffer, self._blob_offset - U32.size)[0]
+        self._nodes_offset = self._blob_offset + blob_size + (-blob_size % 4)
+        self._edges_offset = self._nodes_offset + NODE.size * self._n_nodes
+        self._rules_offset = self._edges_offset + EDGE.size * self._n_edges
+        self._rule_teams_offset = self._rules_offset + RULE.size * self._n_rules
+        self._teams_offset = self._rule_teams_offset + U32.size * self._n_rule_teams
+        self._team_members_offset = self._teams_offset + TEAM.size * self._n_teams
+        self._users_offset = self._team_members_offset + U32.size * self._n_team_members
+
+    def close(self):
+        self._buffer.close()
+
+    def _string_bytes(self, string_id):
+        start, end = struct.unpack_from("<II", self._buffer, self._strings_offset + U32.size * string_id)
+        return self._buffer[self._blob_offset + start:self._blob_offset + end]
+
+    def string(self, string_id):
+        return self._string_bytes(string_id).decode()
+
+    def _rule(self, rule_id):
+        return RULE.unpack_from(self._buffer, self._rules_offset + RULE.size * rule_id)
+
+    def _rule_team_ids(self, rule_id):
+        _, _, _, first, count = self._rule(rule_id)
+        return struct.unpack_from(f"<{count}I", self._buffer, self._rule_teams_offset + U32.size * first)
+
+    def team(self, team_id):
+        """Возвращает (имя команды, номера участников)."""
+        name_id, first, count = TEAM.unpack_from(self._buffer, self._teams_offset + TEAM.size * team_id)
+        members = struct.unpack_from(f"<{count}I", self._buffer, self._team_members_offset + U32.size * first)
+        return self.string(name_id), members
+
+    def user(self, user_id):
+        """Возвращает (username, gitlab_id или -1)."""
+        name_id, gitlab_id = USER.unpack_from(self._buffer, self._users_offset + USER.size * user_id)
+        return self.string(name_id), gitlab_id
+
+    @cached_property
+    def rules(self):
+        return [
+            (self.string(self._rule(rule_id)[0]), self._rule_teams(rule_id))
+            for rule_id in range(self._n_rules)
+        ]
+
+    @cached_property
+    def _patterns(self):
+        patterns = []
+        specificity = []
+        for rule_id in range(self._n_rules):
+            path_id, rule_specificity, flags, _, _ = self._rule(rule_id)
+            specificity.append(rule_specificity)
+            if flags & RULE_PATTERN:
+                patterns.append((rule_id, self.string(path_id)))
+        return PatternAutomaton(patterns, specificity) if patterns else None
+
+    def _find_child(self, node_id, label):
+        _, first, count = NODE.unpack_from(self._buffer, self._nodes_offset + NODE.size * node_id)
+        low, high = first, first + count
+        while low < high:
+            middle = (low + high) // 2
+            label_id, child = EDGE.unpack_from(self._buffer, self._edges_offset + EDGE.size * middle)
+            middle_label = self._string_bytes(label_id)
+            if middle_label == label:
+                return child
+            if middle_label < label:
+                low = middle + 1
+            else:
+                high = middle
+        return -1
+
+    def _node_rule(self, node_id):
+        return NODE.unpack_from(self._buffer, self._nodes_offset + NODE.size * node_id)[0]
+
+    def _walk_literal(self, path):
+        """Возвращает (узел дерева для path или -1, если его нет, последнее правило на пути)."""
+        node_id = 0
+        rule_id = self._node_rule(0)
+        for item in path.encode().split(b'/'):
+            node_id = self._find_child(node_id, item)
+            if node_id == -1:
+                break
+            node_rule_id = self._node_rule(node_id)
+            if node_rule_id != -1:
+                rule_id = node_rule_id
+        return node_id, rule_id
+
+    def _lookup_literal(self, path):
+        return self._walk_literal(path)[1]
+
+    def _prefer_pattern(self, rule_id, pattern_rule_id):
+        return pattern_rule_id != -1 and (rule_id == -1 or (self._rule(pattern_rule_id)[1], pattern_rule_id) >
+                                          (self._rule(rule_id)[1], rule_id))
+
+    def match_rule(self, path):
+        """Возвращает идентификатор победившего для path правила, в том числе правила с отрицанием, или -1."""
+        rule_id = self._lookup_literal(path)
+        patterns = self._patterns
+        if patterns is not None:
+            pattern_rule_id = patterns.lookup(path)
+            if self._prefer_pattern(rule_id, pattern_rule_id):
+                rule_id = pattern_rule_id
+        return rule_id
+
+    def is_negated(self, rule_id):
+        """Проверяет, является ли правило отрицанием ('!шаблон')."""
+        return bool(self._rule(rule_id)[2] & RULE_NEGATED)
+
+    def lookup(self, path):
+        """Возвращает идентификатор правила, которому принадлежит path, или -1 (правила как в OwnershipIndex)."""
+        rule_id = self.match_rule(path)
+        if rule_id != -1 and self.is_negated(rule_id):
+            return -1
+        return rule_id
+
+    def _rule_teams(self, rule_id):
+        return tuple(self.team(team_id)[0] for team_id in self._rule_team_ids(rule_id))
+
+    def teams_for(self, path):
+        rule_id = self.lookup(path)
+        return self._rule_teams(rule_id) if rule_id != -1 else ()
+
+    def iter_matches(self, paths):
+        """Как OwnershipIndex.iter_matches: проход по папке, общей с предыдущим путем, не повторяется."""
+        patterns = self._patterns
+        pattern_cache = [None, None, 1]
+        cached_directory = None
+        directory_node_id = directory_rule_id = None
+        for path in paths:
+            directory, _, name = path.rpartition('/')
+            if directory != cached_directory:
+                cached_directory = directory
+                if directory:
+                    directory_node_id, directory_rule_id = self._walk_literal(directory)
+                else:
+                    directory_node_id, directory_rule_id = 0, self._node_rule(0)
+            rule_id = directory_rule_id
+            if directory_node_id != -1:
+                node_id = self._find_child(directory_node_id, name.encode())
+                if node_id != -1 and self._node_rule(node_id) != -1:
+                    rule_id = self._node_rule(node_id)
+            if patterns is not None:
+                pattern_rule_id = patterns.lookup_cached(directory, name, pattern_cache)
+                if self._prefer_pattern(rule_id, pattern_rule_id):
+                    rule_id = pattern_rule_id
+            yield path, rule_id
+
+    def match_paths(self, paths):
+        """Как OwnershipIndex.match_paths: пути сопоставляются через iter_matches, поэтому отсортированные пути
+        (diff, git ls-files) не проходят по общей папке заново.
+        """
+        found_teams = set()
+        not_found_paths = []
+        matched_rules = set()
+        for path, rule_id in self.iter_matches(paths):
+            if rule_id == -1 or self.is_negated(rule_id):
+                not_found_paths.append(path)
+            elif rule_id not in matched_rules:
+                matched_rules.add(rule_id)
+                found_teams.update(self._rule_teams(rule_id))
+        return found_teams, not_found_paths
+
+
+class MappedOwnershipModel:
+    """OwnershipModel поверх бинарного индекса. Таблицы команд и пользователей разбираются при первом обращении."""
+
+    members_of = OwnershipModel.members_of
+    members_outside_teams = OwnershipModel.members_outside_teams
+
+    def __init__(self, path):
+        self.index = MappedIndex(path)
+        self.blob_id = self.index.blob_id
+
+    @cached_property
+    def team_members(self):
+        index = self.index
+        usernames = [index.user(user_id)[0] for user_id in range(index._n_users)]
+        team_members = {}
+        # в таблице команд сначала идут команды из секции teams, затем упомянутые только в paths
+        for team_id in range(index._n_defined_teams):
+            name, members = index.team(team_id)
+            team_members[name] = frozenset(usernames[member] for member in members)
+        return team_members
+
+    @cached_property
+    def user_ids(self):
+        users = (self.index.user(user_id) for user_id in range(self.index._n_users))
+        return {username: gitlab_id for username, gitlab_id in users if gitlab_id != -1}
+
+    @cached_property
+    def user_teams(self):
+        user_teams = {}
+        for team_name, members in self.team_members.items():
+            for member in members:
+                user_teams.setdefault(member, set()).add(team_name)
+        return {member: frozenset(teams) for member, teams in user_teams.items()}
+
+    @cached_property
+    def all_members(self):
+        return frozenset(self.user_teams)
+
+    @cached_property
+    def _bitmasks(self):
+        return build_bitmasks(self.team_members)
+
+    @property
+    def user_bits(self):
+        return self._bitmasks[0]
+
+    @property
+    def team_masks(self):
+        return self._bitmasks[1]
+
+
+def load_model(path):
+    """Открывает бинарный индекс как модель владельцев."""
+    return MappedOwnershipModel(path)
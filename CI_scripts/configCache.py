@@ -0,0 +1,150 @@
+import os
+import json
+import logging
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+import instrumentation
+from compiledIndex import compile_index, git_blob_id, load_model
+from ownershipModel import OwnershipModel
+
+# Версия формата кэша. Увеличивается при изменении формата файлов кэша.
+CACHE_FORMAT_VERSION = 1
+
+
+class ConfigCache:
+    """Локальный кэш сodeowners.json, адресуемый по blob SHA файла.
+
+    На диске хранится скомпилированный бинарный индекс (формат compiledIndex), а не объекты Python:
+    при попадании файл открывается через mmap, и ни разбор JSON, ни построение модели не нужны.
+    Индекс содержит только таблицы, поэтому подмененный файл не может выполнить код. Запись используется,
+    только если blob SHA в ее заголовке совпадает с ключом - blob SHA конфига в целевой ветке.
+    Размер ограничен CODEOWNERS_CACHE_MAX_ENTRIES записями, при переполнении удаляются давно
+    не использованные (LRU по времени последнего доступа к файлу).
+    Последние открытые модели дополнительно держатся в памяти процесса, что важно для долгоживущего сервиса.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=None, memory_entries=None):
+        default_dir = os.path.join(os.path.expanduser("~"), ".cache", "codeowners")
+        self.cache_dir = cache_dir or os.getenv("CODEOWNERS_CACHE_DIR", default_dir)
+        self.max_entries = max_entries or int(os.getenv("CODEOWNERS_CACHE_MAX_ENTRIES", "16"))
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_size = memory_entries or int(os.getenv("CODEOWNERS_CACHE_MEMORY_ENTRIES", "4"))
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"v{CACHE_FORMAT_VERSION}-{key}.idx")
+
+    def _miss(self, key):
+        self.misses += 1
+        instrumentation.increment("config_cache_misses")
+        logging.info(f"Codeowners cache miss: {key} (hits={self.hits}, misses={self.misses})")
+
+    def get(self, key):
+        """Возвращает модель владельцев (MappedOwnershipModel) по blob SHA конфига или None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                instrumentation.increment("config_cache_hits")
+                logging.debug(f"Codeowners cache hit (memory): {key}")
+                return self._memory[key]
+        path = self._path(key)
+        try:
+            value = load_model(path)
+        except FileNotFoundError:
+            self._miss(key)
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f"Не удалось открыть индекс из кэша {path}: {e}")
+            self._miss(key)
+            return None
+        if value.blob_id != key:
+            logging.warning(f"Запись кэша {path} собрана из другого конфига ({value.blob_id}) и не используется")
+            value.index.close()
+            self._miss(key)
+            return None
+        try:
+            # обновляем время доступа для LRU
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        instrumentation.increment("config_cache_hits")
+        logging.info(f"Codeowners cache hit: {key} (hits={self.hits}, misses={self.misses})")
+        self._remember(key, value)
+        return value
+
+    def get_or_create(self, key, fetch_raw):
+        """Возвращает модель владельцев по ключу, при промахе скачивает конфиг вызовом fetch_raw() (байты файла),
+        компилирует и сохраняет индекс. Если ключ одновременно запрашивают несколько потоков,
+        fetch_raw() вызывается только одним из них.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                value = self.get(key)
+                if value is None:
+                    value = self.put(key, fetch_raw())
+        finally:
+            # блокировка нужна только на время загрузки: дальше ключ отдается из памяти,
+            # а словарь блокировок не растет в долгоживущем сервисе
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+        return value
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_size:
+                self._memory.popitem(last=False)
+        return value
+
+    def put(self, key, raw):
+        """Компилирует содержимое конфига raw в индекс, сохраняет его на диске и возвращает модель.
+        Конфиг, blob SHA которого не совпадает с ключом, на диск не записывается.
+        Ошибки записи не прерывают работу: кэш лишь не пополняется, модель строится в памяти.
+        """
+        codeowners_data = json.loads(raw)
+        if git_blob_id(raw) != key:
+            logging.warning(f"Скачанный конфиг не совпадает с blob SHA {key}, в кэш не сохраняется")
+            return self._remember(key, OwnershipModel(codeowners_data))
+        data = compile_index(codeowners_data, key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # пишем во временный файл и атомарно переименовываем, чтобы параллельные джобы не читали недописанный файл
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, self._path(key))
+            value = load_model(self._path(key))
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить кэш конфига: {e}")
+            return self._remember(key, OwnershipModel(codeowners_data))
+        self._evict()
+        return self._remember(key, value)
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not (name.startswith(f"v{CACHE_FORMAT_VERSION}-") and name.endswith(".idx")):
+                continue
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,97 @@
+"""EvaluationContext, сохраненный джобой назначения ревьюверов как артефакт CI для джобы проверки апрувов.
+
+Артефакт - JSON, ключом которого служат iid МР, SHA головного коммита и blob SHA конфига.
+Он содержит измененные файлы, ответственные команды с их составом, команды для ревью без автора МР
+и назначенных ревьюверов. Если джоба проверки запущена для того же МР и того же коммита, а blob SHA
+конфига в целевой ветке не изменился, она берет из артефакта все, кроме апрувов, которые запрашиваются заново.
+"""
+import json
+import logging
+import os
+import tempfile
+
+import approvalEngine
+from evaluationContext import EvaluationContext
+from ownershipModel import OwnershipModel
+
+ARTIFACT_VERSION = 1
+
+# поля МР, которые нужны джобе проверки апрувов
+MERGE_REQUEST_FIELDS = ('iid', 'title', 'web_url', 'draft', 'sha', 'author', 'source_branch', 'target_branch',
+                        'reviewers')
+
+
+def serialize_context(context):
+    """Переводит контекст не-draft МР (без апрувов) в словарь, пригодный для JSON."""
+    model = context.model
+    # состав ответственных команд и команды platform, достаточный для проверки апрувов
+    teams = set(context.responsible_teams) | {approvalEngine.SUPER_APPROVAL_TEAM}
+    return {
+        "version": ARTIFACT_VERSION,
+        "merge_request_iid": context.merge_request['iid'],
+        "head_sha": context.merge_request['sha'],
+        "config_sha": context.config_sha,
+        "merge_request": {field: context.merge_request.get(field) for field in MERGE_REQUEST_FIELDS},
+        "changed_paths": context.changed_paths,
+        "responsible_teams": sorted(context.responsible_teams),
+        "not_found_paths": context.not_found_paths,
+        "teams": {team: sorted(model.team_members[team]) for team in sorted(teams) if team in model.team_members},
+        "review_teams": {team: sorted(members) for team, members in (context.review_teams or {}).items()},
+        "reviewers": sorted(context.reviewers or ()),
+    }
+
+
+def deserialize_context(artifact):
+    """Восстанавливает контекст из словаря serialize_context.
+    Модель в контексте содержит только сохраненные команды, апрувы не заполняются.
+    """
+    model = OwnershipModel({
+        'paths': {},
+        'teams': [{'name': team, 'team': members} for team, members in artifact["teams"].items()],
+        'users': [],
+    })
+    context = EvaluationContext(
+        artifact["merge_request"],
+        model=model,
+        responsible_teams=set(artifact["responsible_teams"]),
+        not_found_paths=artifact["not_found_paths"],
+        changed_paths=artifact["changed_paths"],
+        config_sha=artifact["config_sha"],
+    )
+    context.review_teams = {team: set(members) for team, members in artifact["review_teams"].items()}
+    context.reviewers = set(artifact["reviewers"])
+    return context
+
+
+def save_context(context, path):
+    """Атомарно записывает контекст в path.
+    Draft МР не сохраняются: их состояние может измениться без нового коммита.
+    """
+    if context.merge_request['draft']:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+        json.dump(serialize_context(context), file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def load_context(path, merge_request_iid, head_sha, config_sha):
+    """Загружает контекст, если артефакт относится к МР merge_request_iid, коммиту head_sha и конфигу
+    с blob SHA config_sha (текущему конфигу целевой ветки), иначе возвращает None.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            artifact = json.load(file)
+    except (OSError, ValueError) as e:
+        logging.info(f"Артефакт контекста {path} не загружен: {e}")
+        return None
+    if artifact.get("version") != ARTIFACT_VERSION:
+        return None
+    if str(artifact["merge_request_iid"]) != str(merge_request_iid) or artifact["head_sha"] != head_sha:
+        logging.info(f"Артефакт контекста {path} относится к другому МР или коммиту и не используется")
+        return None
+    if not config_sha or artifact["config_sha"] != config_sha:
+        logging.info(f"Артефакт контекста {path} построен по другой версии конфига и не используется")
+        return None
+    return deserialize_context(artifact)
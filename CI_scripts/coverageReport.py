@@ -0,0 +1,241 @@
+"""Отчет о покрытии репозитория правилами codeowners.json.
+
+Запуск: python CI_scripts/coverageReport.py <repo_path> [--config codeowners.json | --index codeowners.idx]
+        [--json coverage.json] [--markdown coverage.md] [--depth 4] [--workers N]
+
+Список файлов читается потоком из `git ls-files -z` и пачками раздается пулу процессов, каждый из которых
+один раз строит (или открывает через mmap) индекс владельцев. Процессы возвращают только счетчики,
+а в обработке одновременно находится не больше двух пачек на процесс, поэтому память не зависит от числа файлов.
+
+В отчете:
+- teams - число файлов каждой команды;
+- unowned - папки с файлами без владельцев, свернутые по префиксу: полностью непокрытая папка
+  выводится одной строкой, частично покрытая раскрывается до глубины --depth;
+- unused_rules - правила, под которые не попал ни один файл.
+Если не задан ни --json, ни --markdown, отчет в формате Markdown печатается в stdout.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import compiledIndex
+from ownershipIndex import OwnershipIndex
+
+BATCH_SIZE = 20000
+READ_CHUNK_SIZE = 1 << 20
+
+# индекс владельцев процесса пула, создается в _init_worker
+_worker_index = None
+
+
+def iter_tracked_files(repo_path):
+    """Потоково читает `git ls-files -z`, не накапливая весь список файлов в памяти."""
+    process = subprocess.Popen(["git", "-C", repo_path, "ls-files", "-z", "--full-name"], stdout=subprocess.PIPE)
+    try:
+        remainder = b""
+        while True:
+            chunk = process.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            items = (remainder + chunk).split(b"\0")
+            remainder = items.pop()
+            for item in items:
+                yield item.decode("utf-8", "surrogateescape")
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"git ls-files завершился с кодом {process.returncode}")
+
+
+def iter_batches(paths, size):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_index(config_path=None, index_path=None):
+    """Открывает бинарный индекс или строит OwnershipIndex по codeowners.json."""
+    if index_path:
+        return compiledIndex.MappedIndex(index_path)
+    with open(config_path, encoding="utf-8") as file:
+        return OwnershipIndex(json.load(file)['paths'])
+
+
+def _init_worker(config_path, index_path):
+    global _worker_index
+    _worker_index = load_index(config_path, index_path)
+
+
+def classify_batch(paths, depth):
+    """Классифицирует пачку файлов в процессе пула.
+    Возвращает (число файлов по правилам, {папка, обрезанная до depth: [с владельцем, без владельца]}).
+    Правило с отрицанием тоже учитывается в счетчике правил, но его файлы считаются файлами без владельца.
+    """
+    index = _worker_index
+    rule_counts = Counter()
+    directories = {}
+    negated = {}
+    cached_directory = None
+    counts = None
+    for path, rule_id in index.iter_matches(paths):
+        owned = rule_id != -1
+        if owned:
+            rule_counts[rule_id] += 1
+            if rule_id not in negated:
+                negated[rule_id] = index.is_negated(rule_id)
+            owned = not negated[rule_id]
+        # git ls-files выдает пути отсортированными, поэтому папка обычно та же, что у предыдущего файла
+        directory = path.rpartition("/")[0]
+        if directory != cached_directory:
+            cached_directory = directory
+            key = "/".join(directory.split("/")[:depth]) if directory else ""
+            counts = directories.get(key)
+            if counts is None:
+                counts = directories[key] = [0, 0]
+        counts[0 if owned else 1] += 1
+    return rule_counts, directories
+
+
+def collect(repo_path, config_path=None, index_path=None, depth=4, workers=None):
+    """Классифицирует все отслеживаемые файлы репозитория и возвращает сырые счетчики."""
+    rule_counts = Counter()
+    directories = {}
+
+    def merge(future):
+        batch_rule_counts, batch_directories = future.result()
+        rule_counts.update(batch_rule_counts)
+        for directory, (owned, unowned) in batch_directories.items():
+            counts = directories.setdefault(directory, [0, 0])
+            counts[0] += owned
+            counts[1] += unowned
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(config_path, index_path)) as executor:
+        in_flight = set()
+        for batch in iter_batches(iter_tracked_files(repo_path), BATCH_SIZE):
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(future)
+            in_flight.add(executor.submit(classify_batch, batch, depth))
+        for future in in_flight:
+            merge(future)
+    return rule_counts, directories
+
+
+def _rollup_unowned(directories, depth):
+    """Сворачивает папки без владельцев по префиксу.
+    Полностью непокрытая папка выводится целиком, частично покрытая раскрывается дальше,
+    файлы без владельцев, лежащие прямо в частично покрытой папке, выводятся отдельной строкой.
+    """
+    totals = {}
+    children = {}
+    for directory, (owned, unowned) in directories.items():
+        components = directory.split("/") if directory else []
+        for length in range(len(components) + 1):
+            prefix = "/".join(components[:length])
+            counts = totals.setdefault(prefix, [0, 0])
+            counts[0] += owned
+            counts[1] += unowned
+            if length:
+                children.setdefault("/".join(components[:length - 1]), set()).add(prefix)
+
+    unowned_entries = []
+    stack = [""] if "" in totals else []
+    while stack:
+        prefix = stack.pop()
+        owned, unowned = totals[prefix]
+        if not unowned:
+            continue
+        prefix_depth = len(prefix.split("/")) if prefix else 0
+        if not owned or prefix_depth == depth:
+            unowned_entries.append({"path": prefix + "/", "unowned": unowned, "files": owned + unowned,
+                                    "direct_only": False})
+            continue
+        direct_owned, direct_unowned = directories.get(prefix, (0, 0))
+        if direct_unowned:
+            unowned_entries.append({"path": prefix + "/", "unowned": direct_unowned,
+                                    "files": direct_owned + direct_unowned, "direct_only": True})
+        stack.extend(sorted(children.get(prefix, ()), reverse=True))
+    return unowned_entries
+
+
+def build_report(index, rule_counts, directories, depth):
+    """Собирает отчет из счетчиков collect()."""
+    team_counts = Counter()
+    for rule_id, count in rule_counts.items():
+        if not index.is_negated(rule_id):
+            for team in index.rules[rule_id][1]:
+                team_counts[team] += count
+
+    total = sum(owned + unowned for owned, unowned in directories.values())
+    unowned = sum(unowned for _, unowned in directories.values())
+    return {
+        "files": total,
+        "owned": total - unowned,
+        "unowned": unowned,
+        "teams": dict(sorted(team_counts.items(), key=lambda item: (-item[1], item[0]))),
+        "unowned_directories": _rollup_unowned(directories, depth),
+        "unused_rules": [owner_path for rule_id, (owner_path, _) in enumerate(index.rules)
+                         if not rule_counts[rule_id]],
+    }
+
+
+def format_markdown(report):
+    lines = [
+        "# Покрытие codeowners.json",
+        "",
+        f"Файлов: {report['files']}, с владельцем: {report['owned']}, без владельца: {report['unowned']}",
+        "",
+        "## Файлы по командам",
+        "",
+        "| Команда | Файлов |",
+        "| --- | ---: |",
+    ]
+    lines += [f"| {team} | {count} |" for team, count in report['teams'].items()]
+    lines += ["", "## Файлы без владельцев", "", "| Папка | Без владельца | Всего |", "| --- | ---: | ---: |"]
+    for entry in report['unowned_directories']:
+        path = f"`{entry['path']}` (только файлы в самой папке)" if entry['direct_only'] else f"`{entry['path']}`"
+        lines.append(f"| {path} | {entry['unowned']} | {entry['files']} |")
+    lines += ["", "## Правила без файлов", ""]
+    lines += [f"- `{owner_path}`" for owner_path in report['unused_rules']] or ["Нет"]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("repo_path")
+    parser.add_argument("--config", help="путь к codeowners.json (по умолчанию - в корне repo_path)")
+    parser.add_argument("--index", help="бинарный индекс, собранный compileCodeOwners.py")
+    parser.add_argument("--json", help="куда записать отчет в формате JSON")
+    parser.add_argument("--markdown", help="куда записать отчет в формате Markdown")
+    parser.add_argument("--depth", type=int, default=4, help="максимальная глубина раскрытия папок")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию - число CPU)")
+    args = parser.parse_args()
+
+    config_path = args.config or os.path.join(args.repo_path, "codeowners.json")
+    rule_counts, directories = collect(args.repo_path, config_path, args.index, args.depth, args.workers)
+    report = build_report(load_index(config_path, args.index), rule_counts, directories, args.depth)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.markdown:
+        with open(args.markdown, "w", encoding="utf-8") as file:
+            file.write(format_markdown(report))
+    if not (args.json or args.markdown):
+        sys.stdout.write(format_markdown(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import sharedCodeOwners as shared
+import instrumentation
+
+
+class EvaluationContext:
+    """Все данные, необходимые для назначения ревьюверов и проверки апрувов одного МР.
+
+    - merge_request - МР из GitLab API;
+    - merge_author - username автора МР;
+    - approvers - usernames пользователей, давших апрув (None, если апрувы не запрашивались);
+    - model - OwnershipModel конфига;
+    - responsible_teams - команды, ответственные за измененные файлы;
+    - not_found_paths - измененные файлы без владельцев;
+    - changed_paths - все измененные файлы (только если они запрошены через collect_paths, иначе None);
+    - config_sha - blob SHA конфига, по которому построена model;
+    - review_teams - {команда: участники без автора МР} и reviewers - итоговые ревьюверы,
+      заполняются в setCodeOwners.assign_reviewers.
+    Для draft МР model, responsible_teams, not_found_paths и changed_paths не заполняются.
+    """
+
+    __slots__ = ('merge_request', 'merge_author', 'approvers', 'model', 'responsible_teams', 'not_found_paths',
+                 'changed_paths', 'config_sha', 'review_teams', 'reviewers')
+
+    def __init__(self, merge_request, approvers=None, model=None, responsible_teams=None, not_found_paths=None,
+                 changed_paths=None, config_sha=None):
+        self.merge_request = merge_request
+        self.merge_author = merge_request['author']['username']
+        self.approvers = approvers
+        self.model = model
+        self.responsible_teams = responsible_teams
+        self.not_found_paths = not_found_paths
+        self.changed_paths = changed_paths
+        self.config_sha = config_sha
+        self.review_teams = None
+        self.reviewers = None
+
+
+def _collect_paths(paths, paths_count, collected):
+    """Передает пути дальше, считая их в paths_count[0] и, если collected не None, сохраняя в нем."""
+    for path in paths:
+        paths_count[0] += 1
+        if collected is not None:
+            collected.append(path)
+        yield path
+
+
+def _match_diff(model_future, repo_path, gitlab_service, merge_request, print_diff, collect_paths):
+    # загрузка diff начинается до ожидания модели: первая страница приходит, пока скачивается и строится конфиг,
+    # а блокировка на модели происходит только перед сопоставлением
+    paths = iter(shared.iter_diff_paths(repo_path, gitlab_service, merge_request))
+    first_paths = list(itertools.islice(paths, 1))
+    model = model_future.result()
+    paths_count = [0]
+    changed_paths = [] if collect_paths else None
+    diff = _collect_paths(itertools.chain(first_paths, paths), paths_count, changed_paths)
+    if print_diff:
+        print(shared.color_text("В данном МР изменены следующие файлы: ", "yellow"))
+        diff = shared.print_paths(diff)
+    # пути приходят по мере загрузки diff, поэтому время сопоставления включает и ее
+    with instrumentation.span("match"):
+        responsible_teams, not_found_paths = shared.get_teams_owners_and_unowned_paths(diff, model.index)
+    instrumentation.increment("paths_matched", paths_count[0])
+    instrumentation.increment("paths_unowned", len(not_found_paths))
+    instrumentation.increment("responsible_teams", len(responsible_teams))
+    return responsible_teams, not_found_paths, changed_paths
+
+
+def _load_model(gitlab_service, target_branch, cache, config_sha_future):
+    config_sha = config_sha_future.result()
+    with instrumentation.span("config"):
+        return shared.load_ownership_model(gitlab_service, target_branch, cache, config_sha)
+
+
+def get_approvers(gitlab_service, merge_request_iid):
+    """Возвращает usernames пользователей, давших апрув МР."""
+    approval_users = gitlab_service.get_merge_request_approvals(merge_request_iid)
+    return [entry['user']['username'] for entry in approval_users['approved_by']]
+
+
+def prefetch_context(gitlab_service, source_branch, repo_path, with_approvals=False, print_diff=False,
+                     max_workers=None, merge_request=None, cache=None, collect_paths=False, target_branch=None):
+    """Собирает EvaluationContext для МР из source_branch, выполняя независимые запросы параллельно.
+
+    Конфиг берется из целевой ветки МР. Если она известна заранее (target_branch, например
+    CI_MERGE_REQUEST_TARGET_BRANCH_NAME, или из переданного merge_request), blob SHA конфига запрашивается
+    одновременно с поиском МР, иначе - после него. Для не-draft МР затем параллельно загружается
+    конфиг, запрашиваются апрувы и вычисляется diff, который сопоставляется с командами по мере получения путей.
+    Количество одновременных запросов ограничено max_workers (по умолчанию CODEOWNERS_PREFETCH_WORKERS или 4).
+    Если МР уже получен (например, из вебхука), он передается в merge_request и повторно не запрашивается.
+    cache - ConfigCache для загрузки модели (по умолчанию создается новый).
+    collect_paths - сохранить список измененных файлов в changed_paths (нужен только для артефакта контекста
+    и verdictStore, поэтому по умолчанию пути не накапливаются в памяти).
+    При ошибке получения конфига, как и раньше, выбрасывается KeyError.
+    """
+    max_workers = max_workers or int(os.getenv("CODEOWNERS_PREFETCH_WORKERS", "4"))
+    # для draft МР ни ревьюверы, ни апрувы не вычисляются, поэтому и конфиг не загружается
+    if merge_request is not None and merge_request['draft']:
+        return EvaluationContext(merge_request)
+
+    with instrumentation.span("fetch"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if merge_request is not None:
+            target_branch = merge_request['target_branch']
+        config_sha_future = None
+        if target_branch:
+            config_sha_future = executor.submit(gitlab_service.get_codeowners_conf_blob_id, target_branch)
+        if merge_request is None:
+            merge_request = gitlab_service.get_merge_requests_by_branch(source_branch)[0]
+            # загрузка конфига начинается только после проверки draft: отменить уже начатую загрузку нельзя,
+            # а выход из executor ждал бы ее завершения
+            if merge_request['draft']:
+                return EvaluationContext(merge_request)
+        if merge_request['target_branch'] != target_branch:
+            # целевая ветка не была известна или МР перенаправлен в другую ветку
+            target_branch = merge_request['target_branch']
+            config_sha_future = executor.submit(gitlab_service.get_codeowners_conf_blob_id, target_branch)
+        model_future = executor.submit(_load_model, gitlab_service, target_branch, cache, config_sha_future)
+
+        approvers_future = None
+        if with_approvals:
+            approvers_future = executor.submit(get_approvers, gitlab_service, merge_request['iid'])
+        match_future = executor.submit(_match_diff, model_future, repo_path, gitlab_service, merge_request,
+                                       print_diff, collect_paths)
+
+        responsible_teams, not_found_paths, changed_paths = match_future.result()
+        return EvaluationContext(
+            merge_request,
+            approvers=approvers_future.result() if approvers_future else None,
+            model=model_future.result(),
+            responsible_teams=responsible_teams,
+            not_found_paths=not_found_paths,
+            changed_paths=changed_paths,
+            config_sha=config_sha_future.result(),
+        )
@@ -0,0 +1,287 @@
+"""GitLabService, получающий данные МР через GitLab GraphQL API.
+
+Один запрос возвращает МР (автор, draft, ревьюверы) и апрувы,
+а МР из списка открытых или из get_merge_request_snapshots запрашиваются пачками по несколько штук.
+Полученные данные отдаются методами REST-интерфейса GitLabService (get_merge_requests_by_branch,
+get_merge_request_approvals, get_codeowners_conf_blob_id),
+поэтому остальные скрипты работают с этим классом так же, как с REST-клиентом.
+Конфиг читается из целевой ветки МР, поэтому в запрос МР он не входит и запрашивается через REST API
+параллельно с ним (см. evaluationContext.prefetch_context).
+Изменяющие запросы (ревьюверы, комментарии, статусы) и ветки по-прежнему выполняются через REST API.
+Пути diff также запрашиваются через REST API: diffStats в GraphQL содержит только текущие пути файлов,
+а для переименованного файла должен проверяться и его прежний путь (old_path).
+Пользователи (get_gitlab_users) и нагрузка ревьюверов (get_reviewer_loads) запрашиваются пачками до 100 имен.
+
+Включается переменной CODEOWNERS_GITLAB_API=graphql (см. gitLabService.create_service).
+"""
+import os
+import time
+import threading
+
+from gitLabService import GitLabService
+
+# Сколько секунд полученные апрувы и blob SHA конфигов считаются актуальными.
+# Апрувы отдаются один раз, повторный запрос снова обращается к GitLab,
+# а каждый новый ответ полностью заменяет сохраненные значения МР.
+SNAPSHOT_TTL = 60
+
+_MISSING = object()
+
+MERGE_REQUEST_FIELDS = """
+    iid title webUrl state draft diffHeadSha sourceBranch targetBranch
+    author { username }
+    reviewers(first: 100) { nodes { id username } pageInfo { hasNextPage } }
+    approvedBy(first: 100) { nodes { username } pageInfo { hasNextPage } }
+"""
+
+MERGE_REQUESTS_QUERY = """
+query($project: [ID!], $iids: [String!], $branches: [String!], $state: MergeRequestState, $first: Int,
+      $after: String) {
+  projects(ids: $project) {
+    nodes {
+      mergeRequests(iids: $iids, sourceBranches: $branches, state: $state, sort: CREATED_DESC, first: $first,
+                    after: $after) {
+        pageInfo { hasNextPage endCursor }
+        nodes { %s }
+      }
+    }
+  }
+}
+""" % MERGE_REQUEST_FIELDS
+
+
+USERS_QUERY = """
+query($usernames: [String!], $first: Int) {
+  users(usernames: $usernames, first: $first) { nodes { id username name } }
+}
+"""
+
+REVIEWER_LOADS_QUERY = """
+query($usernames: [String!], $first: Int) {
+  users(usernames: $usernames, first: $first) {
+    nodes { username status { availability } reviewRequestedMergeRequests(state: opened) { count } }
+  }
+}
+"""
+
+
+class GraphQLError(Exception):
+    pass
+
+
+def _rest_id(global_id):
+    """gid://gitlab/User/42 -> 42"""
+    return int(global_id.rsplit('/', 1)[-1])
+
+
+def _to_rest_merge_request(node):
+    """Приводит МР из GraphQL к виду, который возвращает REST API (только используемые скриптами поля)."""
+    return {
+        'iid': int(node['iid']),
+        'title': node['title'],
+        'web_url': node['webUrl'],
+        'state': node['state'],
+        'draft': node['draft'],
+        'sha': node['diffHeadSha'],
+        'source_branch': node['sourceBranch'],
+        'target_branch': node['targetBranch'],
+        'author': {'username': node['author']['username']},
+        'reviewers': [{'id': _rest_id(user['id']), 'username': user['username']}
+                      for user in node['reviewers']['nodes']],
+    }
+
+
+class GitLabGraphQLService(GitLabService):
+    """GitLabService, который собирает данные МР одним GraphQL-запросом.
+
+    Апрувы из ответа сохраняются и отдаются get_merge_request_approvals один раз в течение SNAPSHOT_TTL секунд.
+    Blob SHA конфигов целевых веток, полученные вместе со страницей открытых МР, используются всеми МР
+    этой страницы в течение SNAPSHOT_TTL секунд. Если у МР больше 100 ревьюверов или апрувов,
+    соответствующее значение запрашивается через REST API.
+    """
+
+    def __init__(self, project_id=None, batch_size=None):
+        super().__init__(project_id)
+        self.batch_size = batch_size or int(os.getenv("CODEOWNERS_GRAPHQL_BATCH_SIZE", "20"))
+        self.config_path = "codeowners.json"
+        self._lock = threading.Lock()
+        self._merge_requests = {}
+        self._config_blob_ids = {}
+
+    #
+    # GRAPHQL
+    #
+
+    def _query(self, query, variables):
+        response = self.session.post(f"{self.gitlab_url}/api/graphql", headers=self.headers,
+                                     json={"query": query, "variables": variables})
+        response.raise_for_status()
+        result = response.json()
+        if result.get("errors"):
+            raise GraphQLError("; ".join(error.get("message", str(error)) for error in result["errors"]))
+        return result["data"]
+
+    def _query_merge_requests(self, iids=None, source_branch=None, state=None, first=None, after=None):
+        """Запрашивает страницу МР проекта. Возвращает (узлы МР, pageInfo)."""
+        variables = {
+            "project": [f"gid://gitlab/Project/{self.project_id}"],
+            "iids": [str(iid) for iid in iids] if iids is not None else None,
+            "branches": [source_branch] if source_branch else None,
+            "state": state,
+            "first": first or self.batch_size,
+            "after": after,
+        }
+        projects = self._query(MERGE_REQUESTS_QUERY, variables)["projects"]["nodes"]
+        if not projects:
+            raise GraphQLError(f"Проект {self.project_id} не найден")
+        connection = projects[0]["mergeRequests"]
+        return connection["nodes"], connection["pageInfo"]
+
+    def _query_config_blob_ids(self, branches):
+        """Возвращает {ветка: blob SHA конфига или None} для нескольких веток одним запросом."""
+        branches = list(branches)
+        if not branches:
+            return {}
+        parameters = ", ".join(f"$ref{number}: String!" for number in range(len(branches)))
+        fields = " ".join(f"b{number}: blobs(ref: $ref{number}, paths: [$config]) {{ nodes {{ oid }} }}"
+                          for number in range(len(branches)))
+        query = (f"query($project: [ID!], $config: String!, {parameters}) "
+                 f"{{ projects(ids: $project) {{ nodes {{ repository {{ {fields} }} }} }} }}")
+        variables = {"project": [f"gid://gitlab/Project/{self.project_id}"], "config": self.config_path}
+        variables.update({f"ref{number}": branch for number, branch in enumerate(branches)})
+        repository = self._query(query, variables)["projects"]["nodes"][0]["repository"]
+        blob_ids = {}
+        for number, branch in enumerate(branches):
+            nodes = repository[f"b{number}"]["nodes"]
+            blob_ids[branch] = nodes[0]["oid"] if nodes else None
+        return blob_ids
+
+    #
+    # SNAPSHOTS
+    #
+
+    def _remember_merge_requests(self, nodes):
+        """Сохраняет апрувы из узлов МР и возвращает МР в формате REST API."""
+        now = time.monotonic()
+        merge_requests = []
+        for node in nodes:
+            merge_request = _to_rest_merge_request(node)
+            if node['reviewers']['pageInfo']['hasNextPage']:
+                # неполный список ревьюверов не отдается
+                merge_request = super().get_merge_request(merge_request['iid'])
+            entry = {'time': now}
+            if not node['approvedBy']['pageInfo']['hasNextPage']:
+                approved_by = [{'user': {'username': user['username']}} for user in node['approvedBy']['nodes']]
+                entry['approvals'] = {'approved_by': approved_by}
+            with self._lock:
+                self._merge_requests[merge_request['iid']] = entry
+            merge_requests.append(merge_request)
+        return merge_requests
+
+    def _take(self, entries, key, field):
+        """Возвращает и удаляет сохраненное значение, если оно получено не раньше SNAPSHOT_TTL секунд назад."""
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None or time.monotonic() - entry['time'] > SNAPSHOT_TTL:
+                return _MISSING
+            return entry.pop(field, _MISSING)
+
+    def _take_merge_request(self, merge_request_iid, field):
+        merge_request_iid = int(merge_request_iid)
+        value = self._take(self._merge_requests, merge_request_iid, field)
+        if value is _MISSING:
+            self.get_merge_request_snapshots([merge_request_iid])
+            value = self._take(self._merge_requests, merge_request_iid, field)
+        return value
+
+    def get_merge_request_snapshots(self, merge_request_iids):
+        """Запрашивает МР пачками по batch_size штук вместе с апрувами.
+        Возвращает МР в формате REST API, апрувы затем отдаются get_merge_request_approvals без запросов.
+        """
+        merge_request_iids = list(merge_request_iids)
+        merge_requests = []
+        for start in range(0, len(merge_request_iids), self.batch_size):
+            nodes, _ = self._query_merge_requests(iids=merge_request_iids[start:start + self.batch_size])
+            merge_requests.extend(self._remember_merge_requests(nodes))
+        return merge_requests
+
+    #
+    # MERGE REQUEST INFO
+    #
+
+    def get_merge_request(self, merge_request_iid):
+        # МР всегда запрашивается заново, апрувы из ответа используются следующими вызовами
+        merge_requests = self.get_merge_request_snapshots([merge_request_iid])
+        if not merge_requests:
+            return super().get_merge_request(merge_request_iid)
+        return merge_requests[0]
+
+    def get_merge_requests_by_branch(self, source_branch):
+        nodes, _ = self._query_merge_requests(source_branch=source_branch, first=1)
+        return self._remember_merge_requests(nodes)
+
+    def iter_open_merge_requests(self, per_page=None):
+        """Постранично обходит открытые МР проекта. Вместе с каждой страницей одним дополнительным запросом
+        получаются blob SHA конфигов всех ее целевых веток.
+        """
+        after = None
+        while True:
+            nodes, page_info = self._query_merge_requests(state="opened", first=per_page, after=after)
+            merge_requests = self._remember_merge_requests(nodes)
+            branches = {merge_request['target_branch'] for merge_request in merge_requests}
+            blob_ids = self._query_config_blob_ids(sorted(branches))
+            now = time.monotonic()
+            with self._lock:
+                self._config_blob_ids.update((branch, (now, blob_id)) for branch, blob_id in blob_ids.items())
+            yield from merge_requests
+            if not page_info["hasNextPage"]:
+                return
+            after = page_info["endCursor"]
+
+    def get_merge_request_approvals(self, merge_request_id):
+        approvals = self._take_merge_request(merge_request_id, 'approvals')
+        if approvals is _MISSING:
+            return super().get_merge_request_approvals(merge_request_id)
+        return approvals
+
+    #
+    # USERS
+    #
+
+    def get_gitlab_users(self, usernames, max_workers=8):
+        """Находит пользователей пачками по 100 имен за запрос."""
+        usernames = list(usernames)
+        users = dict.fromkeys(usernames)
+        for start in range(0, len(usernames), 100):
+            batch = usernames[start:start + 100]
+            data = self._query(USERS_QUERY, {"usernames": batch, "first": len(batch)})
+            for node in data['users']['nodes']:
+                if node['username'] in users:
+                    users[node['username']] = {'id': _rest_id(node['id']), 'username': node['username'],
+                                               'name': node['name']}
+        return users
+
+    def get_reviewer_loads(self, usernames, max_workers=8):
+        """Число открытых ревью и статус занятости (availability BUSY) пачками по 100 пользователей."""
+        usernames = list(usernames)
+        loads = {username: {'open_reviews': None, 'busy': False} for username in usernames}
+        for start in range(0, len(usernames), 100):
+            batch = usernames[start:start + 100]
+            data = self._query(REVIEWER_LOADS_QUERY, {"usernames": batch, "first": len(batch)})
+            for node in data['users']['nodes']:
+                if node['username'] in loads:
+                    loads[node['username']] = {'open_reviews': node['reviewRequestedMergeRequests']['count'],
+                                               'busy': (node.get('status') or {}).get('availability') == "BUSY"}
+        return loads
+
+    #
+    # CONFIGS
+    #
+
+    def get_codeowners_conf_blob_id(self, ref, config="codeowners.json"):
+        if config == self.config_path:
+            with self._lock:
+                fetched_at, blob_id = self._config_blob_ids.get(ref, (None, None))
+            if fetched_at is not None and time.monotonic() - fetched_at <= SNAPSHOT_TTL:
+                return blob_id
+        return super().get_codeowners_conf_blob_id(ref, config)
@@ -1,18 +1,22 @@
 # import subprocess
-import requests
 # import json
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import httpSession
+import requestScheduler
+import notificationOutbox as outbox
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 
 class GitLabService:
-    def __init__(self):
+    def __init__(self, project_id=None):
         logging.getLogger().setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
         self.gitlab_url = os.getenv("CI_SERVER_URL", "https://URL_TO_GITLAB")
-        self.project_id = os.getenv("CI_PROJECT_ID")
+        self.project_id = project_id or os.getenv("CI_PROJECT_ID")
         self.private_token = os.getenv("PRIVATE_TOKEN")
 
         logging.info(f"Gitlab Url: {self.gitlab_url}")
@@ -22,21 +26,56 @@ class GitLabService:
             'Private-Token': self.private_token
         }
 
+        self.session = httpSession.get_session()
+        self.outbox = outbox.get_outbox()
+
     #
     # COMMONS
     #
 
-    def _get(self, endpoint, params=None):
+    def _get(self, endpoint, params=None, priority=requestScheduler.PRIORITY_DEFAULT):
         url = f"{self.gitlab_url}/api/v4/{endpoint}"
-        return requests.get(url, headers=self.headers, params=params)
+        return self.session.get(url, headers=self.headers, params=params, priority=priority)
+
+    def _head(self, endpoint, params=None):
+        url = f"{self.gitlab_url}/api/v4/{endpoint}"
+        return self.session.head(url, headers=self.headers, params=params)
 
     def _put(self, endpoint, data=None):
         url = f"{self.gitlab_url}/api/v4/{endpoint}"
-        return requests.put(url, headers=self.headers, json=data)
+        return self.session.put(url, headers=self.headers, json=data)
 
-    def _post(self, endpoint, data=None):
+    def _post(self, endpoint, data=None, priority=requestScheduler.PRIORITY_DEFAULT):
         url = f"{self.gitlab_url}/api/v4/{endpoint}"
-        return requests.post(url, headers=self.headers, json=data)
+        return self.session.post(url, headers=self.headers, json=data, priority=priority)
+
+    def _iter_pages(self, endpoint, params=None, per_page=100):
+        """Обходит постраничный endpoint, отдавая элементы каждой страницы.
+        Номер следующей страницы берется из заголовка X-Next-Page.
+        """
+        params = dict(params or {})
+        params['per_page'] = per_page
+        page = "1"
+        while page:
+            params['page'] = page
+            response = self._get(endpoint, params)
+            response.raise_for_status()
+            yield from response.json()
+            page = response.headers.get('X-Next-Page')
+
+    def _post_or_enqueue(self, merge_request_iid, endpoint, data=None):
+        """Отправляет POST сразу или, если включен outbox, ставит его в очередь (возвращает None)."""
+        if self.outbox is None:
+            return self._post(endpoint, data, requestScheduler.PRIORITY_NOTIFICATIONS)
+        self.outbox.enqueue(outbox.CHANNEL_GITLAB, self.project_id, merge_request_iid,
+                            {"method": "POST", "endpoint": endpoint, "data": data})
+        return None
+
+    def deliver(self, method, endpoint, data=None):
+        """Выполняет запрос, ранее поставленный в outbox."""
+        if method == "PUT":
+            return self._put(endpoint, data)
+        return self._post(endpoint, data, requestScheduler.PRIORITY_NOTIFICATIONS)
 
     #
     # MERGE REQUEST INFO
@@ -51,20 +90,33 @@ class GitLabService:
         }
         return self._post(endpoint, data)
 
+    def get_merge_request(self, merge_request_iid):
+        endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_iid}"
+        return self._get(endpoint).json()
+
     def get_merge_requests_by_branch(self, source_branch):
         endpoint = f"projects/{self.project_id}/merge_requests"
         params = {'source_branch': source_branch}
         return self._get(endpoint, params).json()
 
+    def iter_open_merge_requests(self, per_page=100):
+        """Постранично обходит все открытые МР проекта."""
+        return self._iter_pages(f"projects/{self.project_id}/merge_requests", {"state": "opened"}, per_page)
+
     def get_merge_request_diffs(self, merge_request_id):
+        return list(self.iter_merge_request_diff_paths(merge_request_id))
+
+    def iter_merge_request_diff_paths(self, merge_request_id, per_page=100):
+        """Постранично обходит diffs API и отдает уникальные пути измененных файлов по мере получения страниц.
+        В памяти одновременно находится только одна страница ответа, независимо от размера МР.
+        """
         endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_id}/diffs"
-        diffs = self._get(endpoint).json()
-        unique_paths = set()
-        for item in diffs:
-            unique_paths.add(item["old_path"])
-            unique_paths.add(item["new_path"])
-        diff_paths = list(unique_paths)
-        return diff_paths
+        seen_paths = set()
+        for item in self._iter_pages(endpoint, per_page=per_page):
+            for path in (item["old_path"], item["new_path"]):
+                if path not in seen_paths:
+                    seen_paths.add(path)
+                    yield path
 
     def get_merge_request_changes(self, merge_request_id):
         endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_id}/changes"
@@ -78,7 +130,7 @@ class GitLabService:
 
     def get_merge_request_approvals(self, merge_request_id):
         endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_id}/approvals"
-        return self._get(endpoint).json()
+        return self._get(endpoint, priority=requestScheduler.PRIORITY_APPROVALS).json()
 
     def set_approvers(self, merge_request_iid, reviewer_ids):
         endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_iid}"
@@ -93,13 +145,30 @@ class GitLabService:
 
     def create_thread(self, merge_request_iid, body):
         endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_iid}/discussions?body={body}"
-        return self._post(endpoint)
+        return self._post_or_enqueue(merge_request_iid, endpoint)
 
     def create_comment(self, merge_request_iid, body):
         endpoint = f"projects/{self.project_id}/merge_requests/{merge_request_iid}/notes"
         data = {
             "body": body
         }
+        return self._post_or_enqueue(merge_request_iid, endpoint, data)
+
+    #
+    # COMMIT STATUSES
+    #
+
+    def set_commit_status(self, commit_sha, state, name="codeowners", description=None, target_url=None):
+        """Публикует статус коммита (state: pending, running, success, failed, canceled)."""
+        endpoint = f"projects/{self.project_id}/statuses/{commit_sha}"
+        data = {
+            "state": state,
+            "name": name,
+        }
+        if description:
+            data["description"] = description
+        if target_url:
+            data["target_url"] = target_url
         return self._post(endpoint, data)
 
     #
@@ -107,17 +176,53 @@ class GitLabService:
     #
 
     def get_gitlab_user(self, username):
-        endpoint = "/users"
+        endpoint = "users"
         params = {'username': username}
         return self._get(endpoint, params).json()
 
+    def get_gitlab_users(self, usernames, max_workers=8):
+        """Находит пользователей GitLab по именам. Возвращает {username: {'id', 'username', 'name'} или None}.
+        REST API ищет по одному имени за запрос, поэтому запросы выполняются параллельно.
+        """
+        usernames = list(usernames)
+        if not usernames:
+            return {}
+
+        def find_user(username):
+            response = self._get("users", {'username': username})
+            response.raise_for_status()
+            return next(iter(response.json()), None)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(usernames))) as executor:
+            return dict(zip(usernames, executor.map(find_user, usernames)))
+
+    def get_reviewer_loads(self, usernames, max_workers=8):
+        """Возвращает {username: {'open_reviews': число открытых МР, где пользователь ревьювер, 'busy': False}}.
+        Число берется из заголовка X-Total (по всем проектам), если его нет - open_reviews равно None.
+        REST API не отдает статус занятости, поэтому busy всегда False.
+        """
+        usernames = list(usernames)
+        if not usernames:
+            return {}
+
+        def count_reviews(username):
+            params = {'scope': "all", 'state': "opened", 'reviewer_username': username, 'per_page': 1}
+            response = self._get("merge_requests", params)
+            response.raise_for_status()
+            total = response.headers.get('X-Total')
+            return {'open_reviews': int(total) if total else None, 'busy': False}
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(usernames))) as executor:
+            return dict(zip(usernames, executor.map(count_reviews, usernames)))
+
     #
     # BRANCHES
     #
 
     def get_release_branches(self, prefix):
-        endpoint = f"projects/{self.project_id}/repository/branches?regex=^{prefix}-release.*&per_page=100"
-        return self._get(endpoint).json()
+        """Возвращает все ветки <prefix>-release* (постранично, а не только первые 100)."""
+        endpoint = f"projects/{self.project_id}/repository/branches"
+        return list(self._iter_pages(endpoint, {'regex': f"^{prefix}-release.*"}))
 
     def create_new_branch(self, newBranch, fromBranch):
         endpoint = f"projects/{self.project_id}/repository/branches"
@@ -134,11 +239,45 @@ class GitLabService:
         }
         return self._post(endpoint, data)
 
+    def get_commits_ahead(self, base_branch, branch):
+        """Коммиты ветки branch, которых нет в base_branch (compare API), от старых к новым."""
+        endpoint = f"projects/{self.project_id}/repository/compare"
+        response = self._get(endpoint, {'from': base_branch, 'to': branch})
+        response.raise_for_status()
+        return response.json()['commits']
+
     #
     # CONFIGS
     #
 
-    def get_codeowners_conf(self, source_branch, config="codeowners.json"):
+    # конфиг читается из целевой ветки МР (ref), а не из исходной: иначе автор МР мог бы изменить
+    # codeowners.json в том же МР и назначить владельцем себя или убрать правила
+
+    def get_codeowners_conf(self, ref, config="codeowners.json"):
         endpoint = f"projects/{self.project_id}/repository/files/{config}/raw"
-        params = {'source_branch': source_branch}
+        params = {'ref': ref}
         return self._get(endpoint, params).json()
+
+    def get_codeowners_conf_raw(self, ref, config="codeowners.json"):
+        """Возвращает содержимое конфига в ref байтами, без разбора (для проверки по blob SHA)."""
+        endpoint = f"projects/{self.project_id}/repository/files/{config}/raw"
+        params = {'ref': ref}
+        return self._get(endpoint, params).content
+
+    def get_codeowners_conf_blob_id(self, ref, config="codeowners.json"):
+        """Возвращает blob SHA конфига в ref без скачивания его содержимого (None, если файл не найден)."""
+        endpoint = f"projects/{self.project_id}/repository/files/{config}"
+        params = {'ref': ref}
+        response = self._head(endpoint, params)
+        if not response.ok:
+            return None
+        return response.headers.get('X-Gitlab-Blob-Id')
+
+
+def create_service(project_id=None):
+    """Создает клиент GitLab: REST (по умолчанию) или GraphQL, если CODEOWNERS_GITLAB_API=graphql."""
+    if os.getenv("CODEOWNERS_GITLAB_API", "rest") == "graphql":
+        # импорт здесь: gitLabGraphQLService сам импортирует этот модуль
+        import gitLabGraphQLService
+        return gitLabGraphQLService.GitLabGraphQLService(project_id)
+    return GitLabService(project_id)
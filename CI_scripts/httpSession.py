@@ -0,0 +1,142 @@
+import os
+import atexit
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import instrumentation
+import requestScheduler
+
+# Повторяются только идемпотентные запросы, POST (комментарии, сообщения в ММ) не повторяется никогда.
+# Исключение - ответ 429: сервер запрос не выполнял, его повторяет PooledSession после паузы планировщика.
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'OPTIONS', 'DELETE'})
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """requests.Session с таймаутом по умолчанию для каждого запроса.
+
+    Если передан scheduler (requestScheduler.RequestScheduler), каждый запрос ждет разрешения планировщика
+    с приоритетом из аргумента priority, а на ответ 429 повторяется до rate_limit_retries раз.
+    Если включен instrumentation, для каждого запроса учитываются время, код ответа и размеры тел.
+    """
+
+    def __init__(self, timeout, scheduler=None, rate_limit_retries=0):
+        super().__init__()
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.rate_limit_retries = rate_limit_retries
+
+    def request(self, method, url, priority=requestScheduler.PRIORITY_DEFAULT, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.scheduler is None:
+            return self._send(method, url, **kwargs)
+        host = urlsplit(url).netloc
+        for attempt in range(self.rate_limit_retries + 1):
+            waited = self.scheduler.acquire(host, priority)
+            if waited:
+                instrumentation.add_span_time("http_queue_wait", waited)
+            response = self._send(method, url, **kwargs)
+            self.scheduler.observe(host, response)
+            if response.status_code != 429:
+                break
+        return response
+
+    def _send(self, method, url, **kwargs):
+        if not instrumentation.enabled:
+            return super().request(method, url, **kwargs)
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            instrumentation.record_request(method, url, None, time.perf_counter() - started, 0, 0)
+            raise
+        body = response.request.body or b""
+        if isinstance(body, str):
+            body = body.encode()
+        instrumentation.record_request(method, url, response.status_code, time.perf_counter() - started,
+                                       len(body), len(response.content or b""))
+        return response
+
+
+def _build_retry(retries, backoff_factor):
+    options = dict(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        # иначе urllib3 сам повторяет 429 (и 413/503) с Retry-After в обход планировщика: троттлинг
+        # обрабатывают только RequestScheduler и цикл повторов 429 в PooledSession
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=backoff_factor, **options)
+    except TypeError:
+        # urllib3 < 2.0 не поддерживает jitter, повторяем с обычным экспоненциальным backoff
+        return Retry(**options)
+
+
+def create_session():
+    """Создает сессию с пулом keep-alive соединений, таймаутами, повторами и планировщиком запросов.
+    Параметры берутся из переменных окружения CODEOWNERS_HTTP_*.
+    """
+    pool_size = int(os.getenv("CODEOWNERS_HTTP_POOL_SIZE", "10"))
+    retries = int(os.getenv("CODEOWNERS_HTTP_RETRIES", "3"))
+    backoff_factor = float(os.getenv("CODEOWNERS_HTTP_BACKOFF", "0.5"))
+    timeout = (float(os.getenv("CODEOWNERS_HTTP_CONNECT_TIMEOUT", "5")),
+               float(os.getenv("CODEOWNERS_HTTP_READ_TIMEOUT", "30")))
+    compression = os.getenv("CODEOWNERS_HTTP_COMPRESSION", "True").capitalize() == "True"
+    rate_limit_retries = int(os.getenv("CODEOWNERS_HTTP_RATE_LIMIT_RETRIES", "5"))
+
+    session = PooledSession(timeout, requestScheduler.get_scheduler(), rate_limit_retries)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=_build_retry(retries, backoff_factor))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate' if compression else 'identity'
+    return session
+
+
+def get_session():
+    """Возвращает общую для всех клиентов сессию, создавая ее при первом обращении."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+            atexit.register(log_connection_stats)
+            atexit.register(requestScheduler.log_scheduler_stats)
+        return _session
+
+
+def connection_stats(session=None):
+    """Возвращает {хост: (запросов, открыто соединений, переиспользовано соединений)} для сессии."""
+    session = session or _session
+    stats = {}
+    if session is None:
+        return stats
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count = pool.num_requests
+            connections_count = pool.num_connections
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = (
+                requests_count, connections_count, max(0, requests_count - connections_count))
+    return stats
+
+
+def log_connection_stats():
+    for host, (requests_count, connections_count, reused_count) in connection_stats().items():
+        logging.info(f"HTTP {host}: requests={requests_count}, connections={connections_count}, "
+                     f"reused={reused_count}")
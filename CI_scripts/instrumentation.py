@@ -0,0 +1,245 @@
+"""Замеры фаз, HTTP-запросов и счетчики событий джобы.
+
+Включается, если задана хотя бы одна из переменных:
+- CODEOWNERS_METRICS_PATH - файл для JSON-сводки (`-` - вывод сводки в лог);
+- CODEOWNERS_METRICS_PROMETHEUS_PATH - файл в текстовом формате Prometheus (например, для textfile collector);
+- CODEOWNERS_METRICS_STATSD - адрес host:port, на который сводка отправляется по UDP в формате StatsD.
+Сводка выводится при завершении процесса. Если ни одна переменная не задана, span() возвращает
+общий пустой контекстный менеджер, а остальные функции сразу выходят.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import atexit
+import logging
+import threading
+from urllib.parse import urlsplit
+
+METRICS_PATH = os.getenv("CODEOWNERS_METRICS_PATH")
+PROMETHEUS_PATH = os.getenv("CODEOWNERS_METRICS_PROMETHEUS_PATH")
+STATSD_ADDRESS = os.getenv("CODEOWNERS_METRICS_STATSD")
+STATSD_PREFIX = os.getenv("CODEOWNERS_METRICS_STATSD_PREFIX", "codeowners")
+
+enabled = bool(METRICS_PATH or PROMETHEUS_PATH or STATSD_ADDRESS)
+
+_lock = threading.Lock()
+_started = time.monotonic()
+# {фаза: [число, суммарное время, максимальное время]}
+_spans = {}
+# {(метод, хост, endpoint): {"count", "errors", "time", "max_time", "request_bytes", "response_bytes", "statuses"}}
+_requests = {}
+_counters = {}
+
+_ID_SEGMENT = re.compile(r"^\d+$")
+_SHA_SEGMENT = re.compile(r"^[0-9a-f]{7,64}$")
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        add_span_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name):
+    """Контекстный менеджер замера фазы name. Время повторных и параллельных фаз с одним именем суммируется."""
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def add_span_time(name, elapsed):
+    """Учитывает фазу name, длительность которой измерена без span() (например, ожидание в очереди запросов)."""
+    if not enabled:
+        return
+    with _lock:
+        stats = _spans.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+
+def increment(name, value=1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def endpoint_template(url):
+    """Путь запроса без идентификаторов, SHA и длинных токенов (например, ключа вебхука бота) и без query."""
+    segments = []
+    for segment in urlsplit(url).path.split('/'):
+        if _ID_SEGMENT.match(segment):
+            segment = ":id"
+        elif _SHA_SEGMENT.match(segment):
+            segment = ":sha"
+        elif len(segment) > 24:
+            segment = ":key"
+        segments.append(segment)
+    return "/".join(segments) or "/"
+
+
+def record_request(method, url, status, elapsed, request_bytes, response_bytes):
+    """Учитывает один HTTP-запрос. status - код ответа или None, если ответ не получен."""
+    if not enabled:
+        return
+    key = (method, urlsplit(url).netloc, endpoint_template(url))
+    with _lock:
+        stats = _requests.get(key)
+        if stats is None:
+            stats = _requests[key] = {"count": 0, "errors": 0, "time": 0.0, "max_time": 0.0, "request_bytes": 0,
+                                      "response_bytes": 0, "statuses": {}}
+        stats["count"] += 1
+        stats["time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+        stats["request_bytes"] += request_bytes
+        stats["response_bytes"] += response_bytes
+        status_key = str(status) if status is not None else "error"
+        stats["statuses"][status_key] = stats["statuses"].get(status_key, 0) + 1
+        if status is None or status >= 400:
+            stats["errors"] += 1
+
+
+#
+# ВЫВОД
+#
+
+def summary():
+    """Возвращает сводку в виде словаря, пригодного для JSON."""
+    with _lock:
+        return {
+            "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            "job": os.getenv("CI_JOB_NAME"),
+            "wall_time": time.monotonic() - _started,
+            "spans": {name: {"count": count, "time": total, "max_time": longest}
+                      for name, (count, total, longest) in sorted(_spans.items())},
+            "requests": [{"method": method, "host": host, "endpoint": endpoint, **stats,
+                          "statuses": dict(stats["statuses"])}
+                         for (method, host, endpoint), stats in sorted(_requests.items())],
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def _prometheus_labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_prometheus(data):
+    lines = [
+        "# TYPE codeowners_wall_time_seconds gauge",
+        f"codeowners_wall_time_seconds {data['wall_time']:.6f}",
+        "# TYPE codeowners_span_seconds_total counter",
+    ]
+    for name, stats in data["spans"].items():
+        lines.append(f"codeowners_span_seconds_total{_prometheus_labels(span=name)} {stats['time']:.6f}")
+    lines.append("# TYPE codeowners_span_count_total counter")
+    for name, stats in data["spans"].items():
+        lines.append(f"codeowners_span_count_total{_prometheus_labels(span=name)} {stats['count']}")
+
+    lines.append("# TYPE codeowners_http_requests_total counter")
+    for request in data["requests"]:
+        for status, count in request["statuses"].items():
+            labels = _prometheus_labels(method=request["method"], host=request["host"], endpoint=request["endpoint"],
+                                        status=status)
+            lines.append(f"codeowners_http_requests_total{labels} {count}")
+    for metric, field in (("codeowners_http_request_seconds_total", "time"),
+                          ("codeowners_http_request_bytes_total", "request_bytes"),
+                          ("codeowners_http_response_bytes_total", "response_bytes")):
+        lines.append(f"# TYPE {metric} counter")
+        for request in data["requests"]:
+            labels = _prometheus_labels(method=request["method"], host=request["host"], endpoint=request["endpoint"])
+            lines.append(f"{metric}{labels} {request[field]}")
+
+    lines.append("# TYPE codeowners_events_total counter")
+    for name, value in data["counters"].items():
+        lines.append(f"codeowners_events_total{_prometheus_labels(event=name)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _statsd_name(*parts):
+    return ".".join(re.sub(r"[^A-Za-z0-9_-]+", "_", part).strip("_") or "root" for part in parts)
+
+
+def format_statsd(data, prefix=STATSD_PREFIX):
+    lines = [f"{prefix}.wall_time:{data['wall_time'] * 1000:.0f}|ms"]
+    for name, stats in data["spans"].items():
+        lines.append(f"{prefix}.span.{_statsd_name(name)}:{stats['time'] * 1000:.0f}|ms")
+    for request in data["requests"]:
+        name = _statsd_name(request["method"], request["host"], request["endpoint"])
+        lines.append(f"{prefix}.http.{name}.count:{request['count']}|c")
+        lines.append(f"{prefix}.http.{name}.errors:{request['errors']}|c")
+        lines.append(f"{prefix}.http.{name}.time:{request['time'] * 1000:.0f}|ms")
+        lines.append(f"{prefix}.http.{name}.bytes:{request['request_bytes'] + request['response_bytes']}|c")
+    for name, value in data["counters"].items():
+        lines.append(f"{prefix}.events.{_statsd_name(name)}:{value}|c")
+    return lines
+
+
+def _send_statsd(lines, address):
+    host, _, port = address.rpartition(":")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as connection:
+        # пакеты до 512 байт доходят без фрагментации
+        packet = []
+        for line in lines:
+            if packet and sum(len(item) + 1 for item in packet) + len(line) > 512:
+                connection.sendto("\n".join(packet).encode(), (host, int(port)))
+                packet = []
+            packet.append(line)
+        if packet:
+            connection.sendto("\n".join(packet).encode(), (host, int(port)))
+
+
+def _write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def emit():
+    """Выводит сводку во все включенные приемники. Ошибки вывода не прерывают джобу."""
+    if not enabled:
+        return
+    data = summary()
+    try:
+        if METRICS_PATH == "-":
+            logging.info(f"Метрики: {json.dumps(data, ensure_ascii=False)}")
+        elif METRICS_PATH:
+            _write(METRICS_PATH, json.dumps(data, ensure_ascii=False, indent=2))
+        if PROMETHEUS_PATH:
+            _write(PROMETHEUS_PATH, format_prometheus(data))
+        if STATSD_ADDRESS:
+            _send_statsd(format_statsd(data), STATSD_ADDRESS)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось вывести метрики: {e}")
+
+
+if enabled:
+    atexit.register(emit)
@@ -0,0 +1,84 @@
+import subprocess
+import tempfile
+
+
+class LocalDiffUnavailable(Exception):
+    """Изменения МР нельзя вычислить по локальному репозиторию (shallow clone, нет целевой ветки или коммита)."""
+
+
+def _git(repo_path, *args):
+    result = subprocess.run(["git", "-C", repo_path, *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise LocalDiffUnavailable(result.stderr.strip() or f"git {args[0]} завершился с кодом {result.returncode}")
+    return result.stdout.strip()
+
+
+def iter_changed_paths(repo_path, target_branch, head="HEAD"):
+    """Возвращает генератор путей, измененных между merge base с target_branch и head.
+
+    Используется `git diff --name-status -M -z`: для переименованных файлов отдаются и старый, и новый путь,
+    как и в GitLab API. Проверки и сам git diff выполняются сразу при вызове (вывод пишется во временный
+    файл и затем читается по частям), поэтому LocalDiffUnavailable выбрасывается до получения первого пути
+    и вызывающий код может перейти на GitLab API, а не получить diff, оборванный на середине.
+    """
+    if _git(repo_path, "rev-parse", "--is-shallow-repository") == "true":
+        raise LocalDiffUnavailable("репозиторий склонирован с ограниченной глубиной (shallow clone)")
+    _git(repo_path, "rev-parse", "--verify", "--quiet", f"{head}^{{commit}}")
+
+    target_ref = None
+    for candidate in (f"origin/{target_branch}", target_branch):
+        try:
+            _git(repo_path, "rev-parse", "--verify", "--quiet", f"{candidate}^{{commit}}")
+        except LocalDiffUnavailable:
+            continue
+        target_ref = candidate
+        break
+    if target_ref is None:
+        raise LocalDiffUnavailable(f"целевая ветка '{target_branch}' отсутствует в локальном репозитории")
+
+    merge_base = _git(repo_path, "merge-base", target_ref, head)
+    return _iter_diff_paths(_run_diff(repo_path, merge_base, head))
+
+
+def _iter_nul_separated(stream, chunk_size=65536):
+    rest = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        items = (rest + chunk).split(b"\0")
+        rest = items.pop()
+        for item in items:
+            yield item.decode("utf-8", errors="surrogateescape")
+    if rest:
+        yield rest.decode("utf-8", errors="surrogateescape")
+
+
+def _run_diff(repo_path, base, head):
+    """Выполняет git diff до конца и возвращает временный файл с его выводом (позиция - в начале файла)."""
+    output = tempfile.TemporaryFile()
+    result = subprocess.run(
+        ["git", "-C", repo_path, "diff", "--name-status", "-M", "-z", "--no-color", base, head],
+        stdout=output,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        output.close()
+        message = result.stderr.decode("utf-8", errors="replace").strip()
+        raise LocalDiffUnavailable(message or f"git diff завершился с кодом {result.returncode}")
+    output.seek(0)
+    return output
+
+
+def _iter_diff_paths(output):
+    seen_paths = set()
+    with output:
+        tokens = _iter_nul_separated(output)
+        for status in tokens:
+            # для переименований (R) и копий (C) за статусом следуют два пути, для остальных - один
+            paths_count = 2 if status[:1] in ("R", "C") else 1
+            for _ in range(paths_count):
+                path = next(tokens, None)
+                if path is not None and path not in seen_paths:
+                    seen_paths.add(path)
+                    yield path
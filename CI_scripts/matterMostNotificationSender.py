@@ -1,8 +1,13 @@
 # import subprocess
-import requests
 import json
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import httpSession
+import instrumentation
+import requestScheduler
+import notificationOutbox as outbox
 
 
 class MMNotificationSender:
@@ -12,9 +17,11 @@ class MMNotificationSender:
         self.bot_dev_enable = eval(os.getenv("RO_CODEOWNERS_BOT_DEV", "False").capitalize())
         if self.bot_dev_enable is not True:
             self.url = os.getenv("PROD_RO_CODEOWNERS_BOT_URL")
+            self.bulk_url = os.getenv("PROD_RO_CODEOWNERS_BOT_BULK_URL")
             logging.debug(f"RO_CodeOwnersBot DEV: {self.bot_dev_enable}")
         else:
             self.url = os.getenv("TEST_RO_CODEOWNERS_BOT_URL")
+            self.bulk_url = os.getenv("TEST_RO_CODEOWNERS_BOT_BULK_URL")
             logging.debug(f"RO_CodeOwnersBot DEV: {self.bot_dev_enable}")
 
         self.headers = {
@@ -23,18 +30,41 @@ class MMNotificationSender:
 
         logging.debug(f"RO_CodeOwnersBot Url: {self.url}")
 
-    def send_message(self, username, message):
+        self.session = httpSession.get_session()
+        self.outbox = outbox.get_outbox()
+
+        # ограничения для пакетной отправки
+        self.max_concurrency = int(os.getenv("CODEOWNERS_MM_CONCURRENCY", "8"))
+        self.timeout = float(os.getenv("CODEOWNERS_MM_TIMEOUT", "10"))
+
+    def send_message(self, username, message, merge_request_iid=None):
         data = {
             "username": username,
             "message": message
         }
+        if self.outbox is not None:
+            self.outbox.enqueue(outbox.CHANNEL_MM, username, merge_request_iid, data)
+            return None
         logging.debug("Отправка в ММ сообщения с содержимым")
         logging.debug(data)
-        response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
+        response = self.session.post(self.url, headers=self.headers, data=json.dumps(data),
+                                     priority=requestScheduler.PRIORITY_NOTIFICATIONS)
         return response
 
-    def send_interactive_message(self, username, mr_title, mr_link, color, message):
-        data = {
+    def send_interactive_message(self, username, mr_title, mr_link, color, message, merge_request_iid=None):
+        data = self.interactive_message_payload(username, mr_title, mr_link, color, message)
+        if self.outbox is not None:
+            self.outbox.enqueue(outbox.CHANNEL_MM, username, merge_request_iid, data)
+            return None
+        logging.debug("Отправка в ММ сообщения с содержимым")
+        logging.debug(data)
+        response = self.session.post(self.url, headers=self.headers, data=json.dumps(data),
+                                     priority=requestScheduler.PRIORITY_NOTIFICATIONS)
+        return response
+
+    @staticmethod
+    def interactive_message_payload(username, mr_title, mr_link, color, message):
+        return {
             "username": username,
             "message": "",
             "props": {
@@ -49,7 +79,45 @@ class MMNotificationSender:
                 ]
             }
         }
-        logging.debug("Отправка в ММ сообщения с содержимым")
-        logging.debug(data)
-        response = requests.post(self.url, headers=self.headers, data=json.dumps(data))
-        return response
+
+    def send_batch(self, payloads, max_concurrency=None, timeout=None, merge_request_iid=None, use_outbox=True):
+        """Отправляет пачку сообщений (payload'ы send_message/interactive_message_payload).
+
+        Если задан bulk endpoint бота (*_RO_CODEOWNERS_BOT_BULK_URL), вся пачка уходит одним запросом,
+        иначе сообщения отправляются параллельно, не более max_concurrency одновременно, с таймаутом на каждое.
+        Ошибка отправки одного сообщения не прерывает остальные.
+        Возвращает {username: response или исключение}.
+        Если включен outbox, сообщения только ставятся в очередь и возвращается пустой словарь.
+        """
+        max_concurrency = max_concurrency or self.max_concurrency
+        timeout = timeout or self.timeout
+        if not payloads:
+            return {}
+        instrumentation.increment("mm_messages", len(payloads))
+
+        if use_outbox and self.outbox is not None:
+            for payload in payloads:
+                self.outbox.enqueue(outbox.CHANNEL_MM, payload["username"], merge_request_iid, payload)
+            return {}
+
+        if self.bulk_url:
+            logging.debug(f"Отправка в ММ пачки из {len(payloads)} сообщений через bulk endpoint")
+            try:
+                result = self.session.post(self.bulk_url, headers=self.headers, data=json.dumps(payloads),
+                                           timeout=timeout, priority=requestScheduler.PRIORITY_NOTIFICATIONS)
+            except Exception as e:
+                result = e
+            return {payload["username"]: result for payload in payloads}
+
+        def send(payload):
+            logging.debug("Отправка в ММ сообщения с содержимым")
+            logging.debug(payload)
+            try:
+                return self.session.post(self.url, headers=self.headers, data=json.dumps(payload), timeout=timeout,
+                                         priority=requestScheduler.PRIORITY_NOTIFICATIONS)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(payloads))) as executor:
+            results = executor.map(send, payloads)
+            return {payload["username"]: result for payload, result in zip(payloads, results)}
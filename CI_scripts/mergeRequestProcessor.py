@@ -0,0 +1,95 @@
+"""Обработка одного МР вне CI-джобы (сервис вебхуков, проверка всех открытых МР нескольких проектов).
+
+Назначение ревьюверов и проверка апрувов выполняются той же логикой, что в setCodeOwners.py и checkCodeOwners.py,
+а результат проверки публикуется статусом коммита.
+"""
+import logging
+import os
+
+import evaluationContext as evaluation
+import setCodeOwners
+import checkCodeOwners
+import verdictStore
+
+COMMIT_STATUS_NAME = os.getenv("CODEOWNERS_COMMIT_STATUS_NAME", "codeowners")
+
+# результаты process_merge_request
+RESULT_ASSIGNED = "assigned"
+RESULT_APPROVED = "approved"
+RESULT_NOT_APPROVED = "not_approved"
+RESULT_CONFIG_ERROR = "config_error"
+
+
+class ConfigUnavailable(Exception):
+    """Конфиг для МР получить не удалось."""
+
+
+def _prefetch_context(gitlab_service, merge_request, config_cache, with_approvals, collect_paths):
+    """evaluation.prefetch_context для МР вне CI. KeyError при получении конфига превращается в ConfigUnavailable,
+    чтобы не путать его с KeyError из остальной обработки МР.
+    """
+    try:
+        return evaluation.prefetch_context(gitlab_service, merge_request['source_branch'], None,
+                                           with_approvals=with_approvals, merge_request=merge_request,
+                                           cache=config_cache, collect_paths=collect_paths)
+    except KeyError as e:
+        raise ConfigUnavailable() from e
+
+
+def process_merge_request(gitlab_service, notification_sender, merge_request, config_cache, team_excludes, job_name,
+                          assign=True, check=True, repeat_comment=True):
+    """Назначает ревьюверов (assign) и/или проверяет апрувы (check) открытого МР.
+    repeat_comment передается в setCodeOwners.assign_reviewers.
+    Возвращает RESULT_APPROVED/RESULT_NOT_APPROVED, если апрувы проверялись, иначе RESULT_ASSIGNED.
+    Если конфиг получить не удалось, возвращает RESULT_CONFIG_ERROR. При любой другой ошибке статус коммита
+    переводится в failed (а не остается running), и исключение выбрасывается дальше.
+    """
+    if check:
+        gitlab_service.set_commit_status(merge_request['sha'], "running", COMMIT_STATUS_NAME)
+    store = verdictStore.get_store() if check else None
+    context = None
+    try:
+        # при включенном verdictStore для одной лишь проверки апрувов контекст собирается, только если он нужен
+        if assign or store is None:
+            context = _prefetch_context(gitlab_service, merge_request, config_cache, with_approvals=check,
+                                        collect_paths=store is not None)
+
+        if assign:
+            setCodeOwners.assign_reviewers(gitlab_service, notification_sender, context, team_excludes, job_name,
+                                           repeat_comment)
+        if not check:
+            return RESULT_ASSIGNED
+        if merge_request['draft']:
+            # комментарий о draft МР публикует только назначение ревьюверов (при открытии МР или переводе
+            # в draft), иначе он повторялся бы на каждый апрув и коммит
+            gitlab_service.set_commit_status(merge_request['sha'], "failed", COMMIT_STATUS_NAME, "Draft МР")
+            return RESULT_NOT_APPROVED
+
+        if store is None:
+            code = checkCodeOwners.check_approvals(gitlab_service, notification_sender, context, job_name)
+        else:
+            def compute_context():
+                return context or _prefetch_context(gitlab_service, merge_request, config_cache, with_approvals=True,
+                                                    collect_paths=True)
+            code = checkCodeOwners.check_approvals_incremental(gitlab_service, notification_sender, merge_request,
+                                                               job_name, store, compute_context,
+                                                               context.config_sha if context else None)
+    except ConfigUnavailable:
+        logging.error(f"Не удалось получить конфиг для МР {gitlab_service.project_id}!{merge_request['iid']}")
+        if check:
+            gitlab_service.set_commit_status(merge_request['sha'], "failed", COMMIT_STATUS_NAME,
+                                             "Не удалось получить конфиг")
+        return RESULT_CONFIG_ERROR
+    except Exception:
+        if check:
+            try:
+                gitlab_service.set_commit_status(merge_request['sha'], "failed", COMMIT_STATUS_NAME,
+                                                 "Ошибка проверки апрувов")
+            except Exception:
+                # исходная ошибка важнее, ее и выбрасываем
+                logging.exception(f"Не удалось обновить статус МР {gitlab_service.project_id}!{merge_request['iid']}")
+        raise
+
+    state, description = ("success", "Апрувов достаточно") if code == 0 else ("failed", "Недостаточно апрувов")
+    gitlab_service.set_commit_status(merge_request['sha'], state, COMMIT_STATUS_NAME, description)
+    return RESULT_APPROVED if code == 0 else RESULT_NOT_APPROVED
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+# Каналы доставки
+CHANNEL_MM = "mm"
+CHANNEL_GITLAB = "gitlab"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    merge_request TEXT NOT NULL,
+    message_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    delivered_at REAL,
+    UNIQUE (channel, recipient, merge_request, message_hash)
+)
+"""
+
+
+class NotificationOutbox:
+    """Локальная очередь исходящих уведомлений (сообщения в ММ, комментарии и треды в МР) на SQLite.
+
+    Сообщения дедуплицируются по (получатель, МР, хэш сообщения): повторный запуск джобы не создает
+    повторных уведомлений, пока доставленная запись хранится (CODEOWNERS_OUTBOX_RETENTION часов).
+    Доставка выполняется пачками в drain. Сообщения в ММ одному пользователю, накопившиеся за окно
+    CODEOWNERS_OUTBOX_DIGEST_WINDOW секунд, отправляются одним сообщением-дайджестом.
+    """
+
+    def __init__(self, path, digest_window=None, retention_hours=None):
+        self.path = path
+        self.digest_window = digest_window if digest_window is not None else \
+            float(os.getenv("CODEOWNERS_OUTBOX_DIGEST_WINDOW", "0"))
+        self.retention = 3600 * (retention_hours if retention_hours is not None else
+                                 float(os.getenv("CODEOWNERS_OUTBOX_RETENTION", "24")))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def enqueue(self, channel, recipient, merge_request, payload):
+        """Ставит сообщение в очередь. Возвращает False, если такое сообщение уже было поставлено ранее."""
+        serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        message_hash = hashlib.sha256(serialized.encode()).hexdigest()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO outbox (channel, recipient, merge_request, message_hash, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (channel, str(recipient), str(merge_request or ""), message_hash, serialized, time.time()))
+            enqueued = cursor.rowcount == 1
+        if not enqueued:
+            logging.info(f"Уведомление для {recipient} (МР {merge_request}) уже было отправлено ранее, пропускаем")
+        return enqueued
+
+    def _pending(self, channel):
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT id, recipient, payload, created_at FROM outbox "
+                "WHERE channel = ? AND delivered_at IS NULL ORDER BY id", (channel,)).fetchall()
+
+    def _mark_delivered(self, ids):
+        if not ids:
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany("UPDATE outbox SET delivered_at = ? WHERE id = ?", [(now, i) for i in ids])
+
+    def _purge(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM outbox WHERE delivered_at IS NOT NULL AND delivered_at < ?",
+                               (time.time() - self.retention,))
+
+    def drain(self, gitlab_service, notification_sender, force=False):
+        """Доставляет накопившиеся уведомления. Неотправленные сообщения остаются в очереди до следующего drain.
+        force - не дожидаться окончания окна дайджеста.
+        Возвращает количество доставленных записей.
+        """
+        delivered = []
+
+        # комментарии и треды в МР не объединяются, доставляются по порядку постановки в очередь
+        for row_id, _, payload, _ in self._pending(CHANNEL_GITLAB):
+            payload = json.loads(payload)
+            try:
+                response = gitlab_service.deliver(payload["method"], payload["endpoint"], payload.get("data"))
+            except Exception as e:
+                logging.warning(f"Не удалось доставить комментарий в МР: {e}")
+                continue
+            if response.ok:
+                delivered.append(row_id)
+
+        # сообщения в ММ группируются по получателю
+        messages_by_recipient = {}
+        for row_id, recipient, payload, created_at in self._pending(CHANNEL_MM):
+            messages_by_recipient.setdefault(recipient, []).append((row_id, json.loads(payload), created_at))
+
+        now = time.time()
+        batch = []
+        batch_ids = {}
+        for recipient, messages in messages_by_recipient.items():
+            oldest = min(created_at for _, _, created_at in messages)
+            if not force and now - oldest < self.digest_window:
+                continue
+            payloads = [payload for _, payload, _ in messages]
+            batch.append(payloads[0] if len(payloads) == 1 else _digest(recipient, payloads))
+            batch_ids[recipient] = [row_id for row_id, _, _ in messages]
+
+        if batch:
+            results = notification_sender.send_batch(batch, use_outbox=False)
+            for recipient, result in results.items():
+                if not isinstance(result, Exception) and result.ok:
+                    delivered.extend(batch_ids[recipient])
+                else:
+                    logging.warning(f"Не удалось доставить сообщение в ММ для {recipient}: {result}")
+
+        self._mark_delivered(delivered)
+        self._purge()
+        logging.info(f"Outbox: доставлено {len(delivered)} уведомлений")
+        return len(delivered)
+
+
+def _digest(recipient, payloads):
+    """Объединяет несколько сообщений одному получателю в одно сообщение с несколькими вложениями."""
+    attachments = []
+    for payload in payloads:
+        attachments.extend(payload.get("props", {}).get("attachments", []))
+        if payload.get("message"):
+            attachments.append({"fallback": "MR_info", "text": payload["message"]})
+    return {
+        "username": recipient,
+        "message": f"Уведомления CodeOwners: {len(payloads)}",
+        "props": {"attachments": attachments}
+    }
+
+
+_outbox = None
+
+
+def get_outbox():
+    """Возвращает outbox, если задана переменная CODEOWNERS_OUTBOX_PATH, иначе None (уведомления шлются сразу)."""
+    global _outbox
+    path = os.getenv("CODEOWNERS_OUTBOX_PATH")
+    if not path:
+        return None
+    if _outbox is None or _outbox.path != path:
+        _outbox = NotificationOutbox(path)
+    return _outbox
+
+
+def drain_pending(force=False):
+    """Доставляет уведомления из outbox, если он включен. Ошибки логируются и не влияют на результат джобы."""
+    outbox = get_outbox()
+    if outbox is None:
+        return 0
+    # импорт здесь, так как клиенты сами используют outbox
+    import gitLabService as gitlab
+    import matterMostNotificationSender as mm
+    try:
+        return outbox.drain(gitlab.GitLabService(), mm.MMNotificationSender(), force=force)
+    except Exception as e:
+        logging.warning(f"Не удалось доставить уведомления из outbox: {e}")
+        return 0
+
+
+if __name__ == "__main__":
+    # отдельный запуск доставляет все накопившиеся уведомления, в том числе с незакрытым окном дайджеста
+    drain_pending(force=True)
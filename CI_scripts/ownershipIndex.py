@@ -0,0 +1,407 @@
+import threading
+
+# Символы, по которым правило из секции paths считается шаблоном, а не литеральным путем
+GLOB_CHARS = frozenset('*?[\\')
+
+# Предел числа состояний ленивого ДКА, после которого кэш переходов сбрасывается
+MAX_DFA_STATES = 100000
+
+
+def split_rule_path(owner_path):
+    """Разбивает путь правила из секции paths на компоненты.
+    Ведущий и завершающий '/' не учитываются, пустые компоненты отбрасываются.
+    """
+    return [item for item in owner_path.split('/') if item]
+
+
+def is_pattern(owner_path):
+    """Проверяет, является ли правило шаблоном (*, **, ?, [...], экранирование или отрицание '!')."""
+    return owner_path.startswith('!') or any(char in GLOB_CHARS for char in owner_path)
+
+
+def pattern_specificity(owner_path):
+    """Конкретность правила - число компонентов пути, кроме '**'."""
+    return sum(1 for item in split_rule_path(owner_path.lstrip('!')) if item != '**')
+
+
+class OwnershipIndex:
+    """Индекс владельцев по секции paths сodeowners.json.
+
+    Строится один раз, после чего владелец файла определяется за один проход по его пути.
+    Литеральные правила (/Modules/Feature) всегда отсчитываются от корня репозитория
+    и хранятся в префиксном дереве по компонентам пути,
+    шаблоны (*.swift, Modules/**/Tests, **/Package.swift, [ab]?.txt, !docs/**) - в одном общем
+    автомате PatternAutomaton. Любое правило действует и на все файлы внутри совпавшей папки.
+
+    Если путь подходит под несколько правил:
+    1. побеждает самое конкретное - с наибольшим числом компонентов пути, не считая '**'
+       (для литеральных правил это самый длинный префикс);
+    2. при равной конкретности побеждает правило, записанное в конфиге позже;
+    3. если победило правило с отрицанием ('!шаблон'), файл считается файлом без владельца.
+    """
+
+    __slots__ = ('rules', '_root', '_specificity', '_negated', '_patterns')
+
+    def __init__(self, codeowners_paths):
+        # rules - список (путь правила, команды), индекс в списке - идентификатор правила
+        self.rules = []
+        self._specificity = []
+        self._negated = set()
+        # узел дерева - [дочерние узлы {компонент: узел}, идентификатор правила или -1]
+        self._root = [{}, -1]
+        patterns = []
+        for owner_path, teams in codeowners_paths.items():
+            rule_id = len(self.rules)
+            self.rules.append((owner_path, tuple(teams)))
+            self._specificity.append(pattern_specificity(owner_path))
+            if is_pattern(owner_path):
+                if owner_path.startswith('!'):
+                    self._negated.add(rule_id)
+                patterns.append((rule_id, owner_path))
+                continue
+            node = self._root
+            for item in split_rule_path(owner_path):
+                node = node[0].setdefault(item, [{}, -1])
+            node[1] = rule_id
+        self._patterns = PatternAutomaton(patterns, self._specificity) if patterns else None
+
+    def _walk_literal(self, path):
+        """Возвращает (узел дерева для path или None, если его нет, последнее правило на пути)."""
+        node = self._root
+        rule_id = node[1]
+        for item in path.split('/'):
+            node = node[0].get(item)
+            if node is None:
+                break
+            if node[1] != -1:
+                rule_id = node[1]
+        return node, rule_id
+
+    def _lookup_literal(self, path):
+        return self._walk_literal(path)[1]
+
+    def match_rule(self, path):
+        """Возвращает идентификатор победившего для path правила, в том числе правила с отрицанием, или -1."""
+        rule_id = self._lookup_literal(path)
+        if self._patterns is not None:
+            pattern_rule_id = self._patterns.lookup(path)
+            if pattern_rule_id != -1 and (rule_id == -1 or (self._specificity[pattern_rule_id], pattern_rule_id) >
+                                          (self._specificity[rule_id], rule_id)):
+                rule_id = pattern_rule_id
+        return rule_id
+
+    def is_negated(self, rule_id):
+        """Проверяет, является ли правило отрицанием ('!шаблон')."""
+        return rule_id in self._negated
+
+    def lookup(self, path):
+        """Возвращает идентификатор правила, которому принадлежит path, или -1, если владельца нет."""
+        rule_id = self.match_rule(path)
+        if rule_id in self._negated:
+            return -1
+        return rule_id
+
+    def teams_for(self, path):
+        """Возвращает команды-владельцы path (пустой кортеж, если владельца нет)."""
+        rule_id = self.lookup(path)
+        return self.rules[rule_id][1] if rule_id != -1 else ()
+
+    def iter_matches(self, paths):
+        """Для каждого пути из paths возвращает пару (путь, результат match_rule).
+        Проход по папке, общей с предыдущим путем, не повторяется, поэтому отсортированные пути
+        (git ls-files, diff) сопоставляются быстрее, чем отдельными вызовами match_rule.
+        """
+        patterns = self._patterns
+        pattern_cache = [None, None, 1]
+        cached_directory = None
+        directory_node = directory_rule_id = None
+        for path in paths:
+            directory, _, name = path.rpartition('/')
+            if directory != cached_directory:
+                cached_directory = directory
+                if directory:
+                    directory_node, directory_rule_id = self._walk_literal(directory)
+                else:
+                    directory_node, directory_rule_id = self._root, self._root[1]
+            rule_id = directory_rule_id
+            if directory_node is not None:
+                node = directory_node[0].get(name)
+                if node is not None and node[1] != -1:
+                    rule_id = node[1]
+            if patterns is not None:
+                pattern_rule_id = patterns.lookup_cached(directory, name, pattern_cache)
+                if pattern_rule_id != -1 and (rule_id == -1 or (self._specificity[pattern_rule_id], pattern_rule_id) >
+                                              (self._specificity[rule_id], rule_id)):
+                    rule_id = pattern_rule_id
+            yield path, rule_id
+
+    def match_paths(self, paths):
+        """Соотносит пачку путей с командами. paths может быть любым итерируемым объектом, в том числе генератором.
+        Возвращает множество найденных команд и список путей без владельцев.
+        """
+        found_teams = set()
+        not_found_paths = []
+        matched_rules = set()
+        for path, rule_id in self.iter_matches(paths):
+            if rule_id == -1 or rule_id in self._negated:
+                not_found_paths.append(path)
+            elif rule_id not in matched_rules:
+                matched_rules.add(rule_id)
+                found_teams.update(self.rules[rule_id][1])
+        return found_teams, not_found_paths
+
+
+#
+# ШАБЛОНЫ
+#
+
+# Условия переходов НКА: ('c', символ), ('n',) - любой символ кроме '/', ('a',) - любой символ,
+# ('k', отрицание, символы, диапазоны) - класс символов [...] (никогда не совпадает с '/')
+
+def _match_condition(condition, char):
+    kind = condition[0]
+    if kind == 'c':
+        return char == condition[1]
+    if kind == 'n':
+        return char != '/'
+    if kind == 'a':
+        return True
+    if char == '/':
+        return False
+    _, negate, chars, ranges = condition
+    found = char in chars or any(low <= char <= high for low, high in ranges)
+    return found != negate
+
+
+def _parse_class(pattern, start):
+    """Разбирает класс символов, начинающийся с '[' в позиции start.
+    Возвращает (условие, позиция после ']') или None, если класс не закрыт.
+    """
+    position = start + 1
+    negate = position < len(pattern) and pattern[position] in '!^'
+    if negate:
+        position += 1
+    chars = set()
+    ranges = []
+    first = True
+    while position < len(pattern):
+        char = pattern[position]
+        if char == ']' and not first:
+            return ('k', negate, frozenset(chars), tuple(ranges)), position + 1
+        if char == '\\' and position + 1 < len(pattern):
+            position += 1
+            char = pattern[position]
+        if position + 2 < len(pattern) and pattern[position + 1] == '-' and pattern[position + 2] != ']':
+            ranges.append((char, pattern[position + 2]))
+            position += 3
+        else:
+            chars.add(char)
+            position += 1
+        first = False
+    return None
+
+
+class PatternAutomaton:
+    """Все шаблоны секции paths, скомпилированные в один автомат.
+
+    Шаблоны переводятся в общий недетерминированный автомат над символами пути, который лениво
+    детерминизируется при сопоставлении: каждое состояние ДКА - множество состояний НКА, переходы
+    кэшируются. Поэтому время сопоставления линейно по длине пути и не зависит от числа шаблонов,
+    а для каждого состояния ДКА победившее правило вычисляется один раз.
+
+    Синтаксис как в .gitignore/CODEOWNERS: '*' и '?' не пересекают '/', '**' - любое число папок,
+    [...] - класс символов ([!...] или [^...] - отрицание), '\\' экранирует следующий символ,
+    '!' в начале - отрицание. Шаблон без '/' в начале или середине (например, *.swift) действует
+    на любой глубине, шаблон, оканчивающийся на '/', совпадает только с папками.
+    """
+
+    def __init__(self, patterns, specificity):
+        self._specificity = specificity
+        self._edges = []
+        self._epsilon = []
+        self._accepts = []
+        start = self._new_state()
+        for rule_id, pattern in patterns:
+            self._epsilon[start].append(self._compile(rule_id, pattern))
+        self._start_closure = self._closure({start})
+        self._reset_dfa()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    #
+    # ПОСТРОЕНИЕ НКА
+    #
+
+    def _new_state(self):
+        self._edges.append([])
+        self._epsilon.append([])
+        self._accepts.append(-1)
+        return len(self._edges) - 1
+
+    def _add_edge(self, source, condition):
+        target = self._new_state()
+        self._edges[source].append((condition, target))
+        return target
+
+    def _compile(self, rule_id, pattern):
+        pattern = pattern[1:] if pattern.startswith('!') else pattern
+        directory_only = pattern.endswith('/')
+        anchored = '/' in pattern.rstrip('/')
+        components = split_rule_path(pattern)
+        if components and components[-1] == '**':
+            # 'папка/**' - все внутри папки, но не сама папка
+            components.pop()
+            directory_only = True
+        if not anchored:
+            components.insert(0, '**')
+
+        start = self._new_state()
+        current = start
+        previous_is_globstar = False
+        for index, component in enumerate(components):
+            if component == '**':
+                if index > 0 and not previous_is_globstar:
+                    current = self._add_edge(current, ('c', '/'))
+                # ноль или более папок: цикл "[^/]+/" с возвратом в текущее состояние
+                loop = self._add_edge(current, ('n',))
+                self._edges[loop].append((('n',), loop))
+                self._edges[loop].append((('c', '/'), current))
+                previous_is_globstar = True
+                continue
+            if index > 0 and not previous_is_globstar:
+                current = self._add_edge(current, ('c', '/'))
+            current = self._compile_component(current, component)
+            previous_is_globstar = False
+
+        if not directory_only:
+            self._accepts[current] = rule_id
+        # правило действует и на все файлы внутри совпавшей папки
+        inside = self._add_edge(current, ('c', '/'))
+        self._edges[inside].append((('a',), inside))
+        self._accepts[inside] = rule_id
+        return start
+
+    def _compile_component(self, current, component):
+        position = 0
+        while position < len(component):
+            char = component[position]
+            if char == '*':
+                star = self._new_state()
+                self._epsilon[current].append(star)
+                self._edges[star].append((('n',), star))
+                current = star
+            elif char == '?':
+                current = self._add_edge(current, ('n',))
+            elif char == '[' and _parse_class(component, position) is not None:
+                condition, position = _parse_class(component, position)
+                current = self._add_edge(current, condition)
+                continue
+            else:
+                if char == '\\' and position + 1 < len(component):
+                    position += 1
+                    char = component[position]
+                current = self._add_edge(current, ('c', char))
+            position += 1
+        return current
+
+    def _closure(self, states):
+        stack = list(states)
+        closure = set(states)
+        while stack:
+            for target in self._epsilon[stack.pop()]:
+                if target not in closure:
+                    closure.add(target)
+                    stack.append(target)
+        return frozenset(closure)
+
+    #
+    # ЛЕНИВЫЙ ДКА
+    #
+
+    def _reset_dfa(self):
+        # ДКА хранится одним кортежем (множества НКА -> id, id -> множество НКА, переходы, победители),
+        # чтобы сброс кэша был атомарным для параллельных сопоставлений.
+        # Состояние 0 - тупиковое (пустое множество), 1 - начальное.
+        self._dfa = ({}, [], [], [])
+        self._dfa_state(self._dfa, frozenset())
+        self._dfa_state(self._dfa, self._start_closure)
+
+    def _dfa_state(self, dfa, nfa_states):
+        ids, sets, transitions, winners = dfa
+        dfa_id = ids.get(nfa_states)
+        if dfa_id is None:
+            winner = -1
+            for state in nfa_states:
+                rule_id = self._accepts[state]
+                if rule_id != -1 and (winner == -1 or (self._specificity[rule_id], rule_id) >
+                                      (self._specificity[winner], winner)):
+                    winner = rule_id
+            dfa_id = len(sets)
+            ids[nfa_states] = dfa_id
+            sets.append(nfa_states)
+            transitions.append({})
+            winners.append(winner)
+        return dfa_id
+
+    def _step(self, dfa, dfa_id, char):
+        """Вычисляет и кэширует переход ДКА. Возвращает None, если кэш был сброшен и проход нужно повторить."""
+        with self._lock:
+            if dfa is not self._dfa:
+                return None
+            if len(dfa[1]) > MAX_DFA_STATES:
+                self._reset_dfa()
+                return None
+            moved = set()
+            for state in dfa[1][dfa_id]:
+                for condition, next_state in self._edges[state]:
+                    if _match_condition(condition, char):
+                        moved.add(next_state)
+            target = self._dfa_state(dfa, self._closure(moved))
+            dfa[2][dfa_id][char] = target
+            return target
+
+    def _walk(self, dfa, dfa_id, text):
+        """Проходит ДКА по text из состояния dfa_id. Возвращает None, если кэш был сброшен и проход нужно повторить."""
+        transitions = dfa[2]
+        for char in text:
+            target = transitions[dfa_id].get(char)
+            if target is None:
+                target = self._step(dfa, dfa_id, char)
+                if target is None:
+                    return None
+            if target == 0:
+                return 0
+            dfa_id = target
+        return dfa_id
+
+    def lookup(self, path):
+        """Возвращает идентификатор победившего правила-шаблона для path или -1."""
+        while True:
+            dfa = self._dfa
+            dfa_id = self._walk(dfa, 1, path)
+            if dfa_id is not None:
+                return dfa[3][dfa_id]
+
+    def lookup_cached(self, directory, name, cache):
+        """lookup для пути directory/name (directory может быть пустым).
+        cache - список [папка, ДКА, состояние], передаваемый между вызовами: если папка совпадает
+        с предыдущей, проход по ней не повторяется.
+        """
+        dfa = self._dfa
+        if cache[0] != directory or cache[1] is not dfa:
+            dfa_id = self._walk(dfa, 1, directory + '/') if directory else 1
+            if dfa_id is None:
+                return self.lookup(f"{directory}/{name}")
+            cache[:] = [directory, dfa, dfa_id]
+        dfa_id = self._walk(dfa, cache[2], name)
+        if dfa_id is None:
+            return self.lookup(f"{directory}/{name}" if directory else name)
+        return dfa[3][dfa_id]
@@ -0,0 +1,63 @@
+from ownershipIndex import OwnershipIndex
+
+
+def build_bitmasks(team_members):
+    """Назначает каждому участнику команд номер бита и строит битовые маски команд.
+    Возвращает ({username: номер бита}, {команда: маска}).
+    """
+    user_bits = {}
+    for members in team_members.values():
+        for member in sorted(members):
+            if member not in user_bits:
+                user_bits[member] = len(user_bits)
+    team_masks = {}
+    for team_name, members in team_members.items():
+        mask = 0
+        for member in members:
+            mask |= 1 << user_bits[member]
+        team_masks[team_name] = mask
+    return user_bits, team_masks
+
+
+class OwnershipModel:
+    """Индексированное представление сodeowners.json.
+
+    Строится один раз за запуск, после чего все выборки по командам и пользователям выполняются за O(1):
+    - index - OwnershipIndex по секции paths;
+    - team_members - {команда: frozenset(участники)};
+    - user_ids - {username: gitlab_id};
+    - user_teams - {username: frozenset(команды)};
+    - all_members - все участники всех команд;
+    - user_bits - {username: номер бита} для каждого участника команд;
+    - team_masks - {команда: битовая маска участников} (используются в approvalEngine).
+    """
+
+    __slots__ = ('index', 'team_members', 'user_ids', 'user_teams', 'all_members', 'user_bits', 'team_masks')
+
+    def __init__(self, codeowners_data):
+        self.index = OwnershipIndex(codeowners_data['paths'])
+
+        self.team_members = {}
+        for team in codeowners_data['teams']:
+            self.team_members[team['name']] = frozenset(team['team'])
+
+        user_teams = {}
+        for team_name, members in self.team_members.items():
+            for member in members:
+                user_teams.setdefault(member, set()).add(team_name)
+        self.user_teams = {member: frozenset(teams) for member, teams in user_teams.items()}
+        self.all_members = frozenset(self.user_teams)
+        self.user_bits, self.team_masks = build_bitmasks(self.team_members)
+
+        self.user_ids = {user['username']: user['gitlab_id'] for user in codeowners_data['users']}
+
+    def members_of(self, team_name):
+        """Возвращает участников команды (пустое множество для неизвестной команды)."""
+        return self.team_members.get(team_name, frozenset())
+
+    def members_outside_teams(self, excluded_teams):
+        """Возвращает участников, входящих хотя бы в одну команду не из excluded_teams."""
+        excluded_teams = frozenset(excluded_teams)
+        if not excluded_teams:
+            return set(self.all_members)
+        return {member for member, teams in self.user_teams.items() if not teams <= excluded_teams}
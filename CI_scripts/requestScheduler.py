@@ -0,0 +1,202 @@
+"""Планировщик HTTP-запросов с учетом ограничений частоты запросов (rate limit) на стороне сервера.
+
+Для каждого хоста ведется бюджет по схеме token bucket. Его скорость и остаток берутся из заголовков
+RateLimit-Limit/RateLimit-Remaining/RateLimit-Reset, которые возвращает GitLab, или задаются
+CODEOWNERS_HTTP_RATE_LIMIT. Ответ 429 приостанавливает запросы к хосту на время из Retry-After.
+Запросы, ожидающие бюджета, выполняются в порядке приоритета: сначала проверка апрувов,
+затем остальные запросы, последними уведомления. Время ожидания в очереди накапливается в статистике.
+"""
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+
+PRIORITY_APPROVALS = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_NOTIFICATIONS = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_APPROVALS: "approvals",
+    PRIORITY_DEFAULT: "default",
+    PRIORITY_NOTIFICATIONS: "notifications",
+}
+
+# GitLab задает лимиты в запросах в минуту
+RATE_LIMIT_PERIOD = 60
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _header_number(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers):
+    """Возвращает паузу из заголовка Retry-After (секунды или HTTP-дата) или None."""
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostBudget:
+    """Token bucket одного хоста. rate - токенов в секунду (None - без ограничения), burst - емкость."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiters = []
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        else:
+            self.tokens = float(self.burst)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько секунд осталось до момента, когда можно отправить запрос."""
+        self.refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    """Выдает разрешения на запросы к хостам с учетом их бюджетов и приоритетов.
+
+    - acquire(host, priority) блокирует поток, пока запрос не станет первым по приоритету в очереди хоста
+      и у хоста не появится токен;
+    - observe(host, response) обновляет бюджет по заголовкам ответа.
+    Пауза по Retry-After или до RateLimit-Reset ограничена max_wait секундами,
+    чтобы одна ошибка сервера не останавливала джобу надолго.
+    """
+
+    def __init__(self, rate=None, burst=None, max_wait=None):
+        self.rate = rate if rate is not None else float(os.getenv("CODEOWNERS_HTTP_RATE_LIMIT", "0"))
+        self.burst = burst or int(os.getenv("CODEOWNERS_HTTP_RATE_BURST", "10"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("CODEOWNERS_HTTP_MAX_WAIT", "60"))
+        self._condition = threading.Condition()
+        self._budgets = {}
+        self._sequence = itertools.count()
+        # {приоритет: [запросов, суммарное ожидание, максимальное ожидание]}
+        self._waits = {priority: [0, 0.0, 0.0] for priority in PRIORITY_NAMES}
+        # {хост: число ответов 429}
+        self._throttled = {}
+
+    def _budget(self, host):
+        budget = self._budgets.get(host)
+        if budget is None:
+            budget = self._budgets[host] = HostBudget(self.rate or None, self.burst)
+        return budget
+
+    def acquire(self, host, priority=PRIORITY_DEFAULT):
+        """Ждет разрешения на запрос к host. Возвращает время ожидания в секундах."""
+        started = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            budget = self._budget(host)
+            heapq.heappush(budget.waiters, ticket)
+            try:
+                while True:
+                    delay = budget.delay(time.monotonic())
+                    if budget.waiters[0] != ticket:
+                        # запрос с более высоким приоритетом (или пришедший раньше) идет первым
+                        self._condition.wait()
+                    elif delay > 0:
+                        self._condition.wait(delay)
+                    else:
+                        break
+            finally:
+                budget.waiters.remove(ticket)
+                heapq.heapify(budget.waiters)
+                self._condition.notify_all()
+            budget.tokens -= 1
+
+            waited = time.monotonic() - started
+            stats = self._waits.setdefault(priority, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += waited
+            stats[2] = max(stats[2], waited)
+        if waited >= 1:
+            logging.debug(f"Запрос к {host} ждал в очереди {waited:.1f} с (приоритет {priority})")
+        return waited
+
+    def observe(self, host, response):
+        """Обновляет бюджет хоста по заголовкам RateLimit-* и Retry-After ответа."""
+        headers = response.headers
+        limit = _header_number(headers, 'RateLimit-Limit')
+        remaining = _header_number(headers, 'RateLimit-Remaining')
+        reset = _header_number(headers, 'RateLimit-Reset')
+        with self._condition:
+            budget = self._budget(host)
+            now = time.monotonic()
+            budget.refill(now)
+            if limit:
+                rate = limit / RATE_LIMIT_PERIOD
+                budget.rate = min(rate, self.rate) if self.rate else rate
+            if remaining is not None:
+                budget.tokens = min(budget.tokens, remaining)
+                if remaining <= 0 and reset:
+                    # бюджет окна исчерпан, ждем его сброса
+                    pause = min(max(0.0, reset - time.time()), self.max_wait)
+                    budget.blocked_until = max(budget.blocked_until, now + pause)
+            if response.status_code == 429:
+                self._throttled[host] = self._throttled.get(host, 0) + 1
+                pause = retry_after_seconds(headers)
+                if pause is None:
+                    pause = 1.0
+                budget.tokens = min(budget.tokens, 0.0)
+                budget.blocked_until = max(budget.blocked_until, now + min(pause, self.max_wait))
+                logging.warning(f"{host} ответил 429, запросы приостановлены на {min(pause, self.max_wait):.1f} с")
+            self._condition.notify_all()
+
+    def wait_stats(self):
+        """Возвращает {имя приоритета: (запросов, суммарное ожидание, максимальное ожидание)}."""
+        with self._condition:
+            return {PRIORITY_NAMES.get(priority, str(priority)): tuple(stats)
+                    for priority, stats in self._waits.items() if stats[0]}
+
+    def throttled(self):
+        """Возвращает {хост: число ответов 429}."""
+        with self._condition:
+            return dict(self._throttled)
+
+
+def get_scheduler():
+    """Возвращает общий для всех сессий планировщик, создавая его при первом обращении."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def log_scheduler_stats():
+    if _scheduler is None:
+        return
+    for name, (count, total, longest) in _scheduler.wait_stats().items():
+        # очередь упоминается в логе, только если запросы в ней действительно ждали
+        if longest >= 0.1:
+            logging.info(f"HTTP queue {name}: requests={count}, wait={total:.2f}s, max_wait={longest:.2f}s")
+    for host, count in _scheduler.throttled().items():
+        logging.info(f"HTTP {host}: throttled (429)={count}")
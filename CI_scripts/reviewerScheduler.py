@@ -0,0 +1,221 @@
+"""Выбор дополнительных ревьюверов с учетом их текущей нагрузки.
+
+Вместо случайной выборки из всех участников команд назначаются наименее загруженные кандидаты:
+нагрузка - число открытых МР (во всех проектах), где пользователь уже ревьювер. Она запрашивается
+для всех кандидатов сразу (get_reviewer_loads) и недолго хранится в файловом кэше, поэтому джобы соседних МР
+не запрашивают ее повторно. Через GraphQL это один запрос на 100 кандидатов, через REST - отдельный запрос
+на каждого кандидата без свежей записи в кэше. Кэш лежит в CODEOWNERS_CACHE_DIR, и если этот каталог
+не сохраняется между джобами (кэш CI), каждая джоба запрашивает нагрузку заново. Поэтому нагрузка
+запрашивается не более чем для CODEOWNERS_REVIEWER_MAX_CANDIDATES кандидатов, отобранных случайно по зерну.
+Среди одинаково загруженных кандидатов порядок определяется генератором случайных чисел
+с фиксированным зерном, поэтому при тех же данных выбор повторяется.
+
+Настройки:
+- CODEOWNERS_REVIEWER_STRATEGY - `load` (по умолчанию) или `random` (прежняя случайная выборка без запросов);
+- CODEOWNERS_REVIEWER_UNAVAILABLE - список недоступных ревьюверов, например "['user1', 'user2']";
+- CODEOWNERS_REVIEWER_MAX_LOAD - кандидаты с таким и большим числом открытых ревью не назначаются
+  (0 - без ограничения);
+- CODEOWNERS_REVIEWER_TEAM_DIVERSITY - сначала выбирать кандидатов из команд, которых еще нет среди ревьюверов
+  (по умолчанию True);
+- CODEOWNERS_REVIEWER_MAX_CANDIDATES - для скольких кандидатов запрашивается нагрузка (по умолчанию 10,
+  0 - для всех); кандидаты из команд, которых еще нет среди ревьюверов, отбираются первыми;
+- CODEOWNERS_REVIEWER_SEED - зерно выбора среди одинаково загруженных кандидатов;
+- CODEOWNERS_REVIEW_LOAD_TTL - сколько секунд хранится нагрузка в кэше (по умолчанию 300);
+- CODEOWNERS_REVIEW_LOAD_CACHE_PATH - файл кэша (по умолчанию review-load-<хост GitLab>.json в CODEOWNERS_CACHE_DIR).
+Пользователи GitLab со статусом "Занят" (только при CODEOWNERS_GITLAB_API=graphql) также не назначаются.
+"""
+import os
+import ast
+import json
+import time
+import heapq
+import random
+import logging
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+STRATEGY_LOAD = "load"
+STRATEGY_RANDOM = "random"
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def default_cache_path(gitlab_url):
+    cache_dir = os.getenv("CODEOWNERS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "codeowners"))
+    host = urlsplit(gitlab_url).netloc.replace(":", "_") or "gitlab"
+    return os.path.join(cache_dir, f"review-load-{host}.json")
+
+
+def read_unavailable():
+    value = os.getenv("CODEOWNERS_REVIEWER_UNAVAILABLE")
+    if not value:
+        return frozenset()
+    try:
+        return frozenset(ast.literal_eval(value))
+    except (ValueError, SyntaxError):
+        # допускается и простой список через запятую
+        return frozenset(username.strip() for username in value.split(",") if username.strip())
+
+
+class ReviewerScheduler:
+    """Выбирает count наименее загруженных кандидатов за O(n + k log n).
+
+    Кандидаты укладываются в кучу по (нагрузка, случайный ключ из зерна). При включенном разнообразии команд
+    кандидат, все команды которого уже представлены среди ревьюверов, откладывается и назначается,
+    только если кандидатов из новых команд не хватило. Нагрузка назначенных ревьюверов сразу
+    увеличивается в кэше, чтобы следующие МР в пределах TTL учитывали новые назначения.
+    """
+
+    def __init__(self, gitlab_service, strategy=None, unavailable=None, max_load=None, team_diversity=None,
+                 seed=None, ttl=None, cache_path=None, max_candidates=None):
+        self.gitlab_service = gitlab_service
+        self.strategy = strategy or os.getenv("CODEOWNERS_REVIEWER_STRATEGY", STRATEGY_LOAD)
+        self.unavailable = frozenset(unavailable) if unavailable is not None else read_unavailable()
+        self.max_load = max_load if max_load is not None else int(os.getenv("CODEOWNERS_REVIEWER_MAX_LOAD", "0"))
+        if team_diversity is None:
+            team_diversity = os.getenv("CODEOWNERS_REVIEWER_TEAM_DIVERSITY", "True").lower() in ("true", "1", "yes")
+        self.team_diversity = team_diversity
+        self.max_candidates = (max_candidates if max_candidates is not None
+                               else int(os.getenv("CODEOWNERS_REVIEWER_MAX_CANDIDATES", "10")))
+        self.seed = seed if seed is not None else os.getenv("CODEOWNERS_REVIEWER_SEED", "")
+        self.ttl = ttl if ttl is not None else int(os.getenv("CODEOWNERS_REVIEW_LOAD_TTL", "300"))
+        self.cache_path = (cache_path or os.getenv("CODEOWNERS_REVIEW_LOAD_CACHE_PATH")
+                           or default_cache_path(gitlab_service.gitlab_url))
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self._entries = None
+
+    #
+    # НАГРУЗКА
+    #
+
+    def _load_cache(self):
+        if self._entries is None:
+            try:
+                with open(self.cache_path, encoding='utf-8') as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save_cache(self):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(directory, exist_ok=True)
+            # атомарная замена, чтобы параллельные джобы не читали недописанный файл
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(self._entries, file, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить кэш нагрузки ревьюверов: {e}")
+
+    def loads(self, usernames):
+        """Возвращает {username: {'open_reviews', 'busy'}}. Нагрузка, которой нет в кэше или которая старше ttl,
+        запрашивается у GitLab одним вызовом. Если GitLab недоступен, open_reviews неизвестных кандидатов - None.
+        """
+        with self._lock:
+            entries = self._load_cache()
+            now = time.time()
+            missing = [username for username in usernames
+                       if now - entries.get(username, {}).get("fetched_at", 0) >= self.ttl]
+            if missing:
+                try:
+                    loads = self.gitlab_service.get_reviewer_loads(missing)
+                except Exception as e:
+                    logging.warning(f"Не удалось запросить нагрузку ревьюверов: {e}")
+                    loads = {}
+                self.lookups += len(missing)
+                for username, load in loads.items():
+                    entries[username] = dict(load, fetched_at=now)
+                self._save_cache()
+            return {username: entries.get(username, {'open_reviews': None, 'busy': False}) for username in usernames}
+
+    def record_assignment(self, usernames):
+        """Учитывает в кэше только что назначенные ревью."""
+        with self._lock:
+            entries = self._load_cache()
+            changed = False
+            for username in usernames:
+                entry = entries.get(username)
+                if entry is not None and entry.get('open_reviews') is not None:
+                    entry['open_reviews'] += 1
+                    changed = True
+            if changed:
+                self._save_cache()
+
+    #
+    # ВЫБОР
+    #
+
+    def _limit_candidates(self, candidates, rng, user_teams, covered_teams):
+        """Оставляет не более max_candidates кандидатов, выбранных случайно по зерну rng.
+        Кандидаты, которые добавят новую команду, отбираются раньше остальных.
+        """
+        if not self.max_candidates or len(candidates) <= self.max_candidates:
+            return candidates
+        covered = set(covered_teams)
+        new_teams, others = [], []
+        for username in candidates:
+            teams = user_teams.get(username, frozenset())
+            (others if teams and teams <= covered else new_teams).append(username)
+        rng.shuffle(new_teams)
+        rng.shuffle(others)
+        return sorted((new_teams + others)[:self.max_candidates])
+
+    def select(self, candidates, count, user_teams=None, covered_teams=(), seed=None):
+        """Выбирает до count ревьюверов из candidates (если подходящих меньше, возвращает всех подходящих).
+        user_teams - {username: команды} (OwnershipModel.user_teams) для разнообразия команд,
+        covered_teams - команды, уже представленные среди ревьюверов МР,
+        seed - дополнительное зерно (например, номер МР), чтобы разные МР не получали одинаковый порядок.
+        """
+        candidates = sorted(set(candidates) - self.unavailable)
+        if count <= 0 or not candidates:
+            return []
+        rng = random.Random(f"{self.seed}:{seed}")
+        if self.strategy == STRATEGY_RANDOM:
+            return rng.sample(candidates, min(count, len(candidates)))
+
+        user_teams = user_teams if self.team_diversity and user_teams else {}
+        candidates = self._limit_candidates(candidates, rng, user_teams, covered_teams)
+        loads = self.loads(candidates)
+        known = [load['open_reviews'] for load in loads.values() if load['open_reviews'] is not None]
+        # кандидаты с неизвестной нагрузкой считаются загруженными средне
+        default_load = sum(known) / len(known) if known else 0
+        heap = []
+        for username in candidates:
+            load = loads[username]
+            open_reviews = load['open_reviews'] if load['open_reviews'] is not None else default_load
+            if load.get('busy') or (self.max_load and open_reviews >= self.max_load):
+                continue
+            heap.append((open_reviews, rng.random(), username))
+        heapq.heapify(heap)
+
+        covered = set(covered_teams)
+        selected = []
+        deferred = []
+        while heap and len(selected) < count:
+            open_reviews, _, username = heapq.heappop(heap)
+            teams = user_teams.get(username, frozenset())
+            if teams and teams <= covered:
+                deferred.append(username)
+                continue
+            selected.append(username)
+            covered.update(teams)
+        # кандидатов из новых команд не хватило: добираем наименее загруженных из отложенных
+        selected.extend(deferred[:count - len(selected)])
+
+        logging.info("Нагрузка выбранных ревьюверов: " + ", ".join(
+            f"{username}={loads[username]['open_reviews']}" for username in selected))
+        return selected
+
+
+def get_scheduler(gitlab_service):
+    """Возвращает общий ReviewerScheduler для экземпляра GitLab, создавая его при первом обращении."""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(gitlab_service.gitlab_url)
+        if scheduler is None:
+            scheduler = _schedulers[gitlab_service.gitlab_url] = ReviewerScheduler(gitlab_service)
+        return scheduler
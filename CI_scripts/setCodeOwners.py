@@ -1,34 +1,72 @@
 import sharedCodeOwners as shared
 import gitLabService as gitlab
 import matterMostNotificationSender as mm
+import evaluationContext as evaluation
+import contextArtifact
+import instrumentation
+import userResolver
+import reviewerScheduler
+import notificationOutbox as outbox
 # import json
 import sys
 import os
-import random
+
+
+def read_team_excludes():
+    """Читает список команд, исключаемых из назначения случайных ревьюверов (CODEOWNERS_TEAM_EXCLUDE)."""
+    try:
+        team_excludes = eval(os.getenv("CODEOWNERS_TEAM_EXCLUDE"))
+        if team_excludes is None:
+            raise EnvironmentError(shared.color_text(
+                "Не обнаружена переменная окружения 'CODEOWNERS_TEAM_EXCLUDE'", "red"))
+    except EnvironmentError as e:
+        print(shared.color_text(f"{e}", "red"))
+        exit(1)
+
+    print(team_excludes)
+    return team_excludes
 
 
 def main(repo_path):
 
     # инициализация сервисов
     notification_sender = mm.MMNotificationSender()
-    gitlab_service = gitlab.GitLabService()
+    gitlab_service = gitlab.create_service()
 
     # получение общих данных
     source_branch_name = os.getenv("CI_MERGE_REQUEST_SOURCE_BRANCH_NAME")
-    merge_request = gitlab_service.get_merge_requests_by_branch(source_branch_name)[0]
     job_name = os.getenv("CI_JOB_NAME")
+    team_excludes = read_team_excludes()
 
+    # МР, конфиг и diff запрашиваются параллельно
+    # пути из diff (локальный git или GitLab API) сразу передаются в сопоставление с командами
+    # список измененных файлов сохраняется только для артефакта контекста
+    context_path = os.getenv("CODEOWNERS_CONTEXT_PATH")
     try:
-        team_excludes = eval(os.getenv("CODEOWNERS_TEAM_EXCLUDE"))
-        if team_excludes is None:
-            raise EnvironmentError(shared.color_text(
-                "Не обнаружена переменная окружения 'CODEOWNERS_TEAM_EXCLUDE'", "red"))
-    except EnvironmentError as e:
-        print(shared.color_text(f"{e}", "red"))
+        context = evaluation.prefetch_context(gitlab_service, source_branch_name, repo_path, print_diff=True,
+                                              collect_paths=bool(context_path),
+                                              target_branch=os.getenv("CI_MERGE_REQUEST_TARGET_BRANCH_NAME"))
+    except KeyError:
+        print(shared.color_text("Не удалось получить конфиг", "red"))
         exit(1)
 
-    print(team_excludes)
-    merge_author = merge_request['author']['username']
+    code = assign_reviewers(gitlab_service, notification_sender, context, team_excludes, job_name)
+
+    # контекст сохраняется как артефакт для джобы проверки апрувов
+    if context_path:
+        contextArtifact.save_context(context, context_path)
+
+    sys.exit(code)
+
+
+def assign_reviewers(gitlab_service, notification_sender, context, team_excludes, job_name, repeat_comment=True):
+    """Назначает ревьюверов МР по собранному EvaluationContext и уведомляет автора и ревьюверов.
+    При repeat_comment=False, если новых ревьюверов нет, ревьюверы не переустанавливаются и комментарий
+    со списком ревьюверов повторно не публикуется (для периодических перепроверок).
+    Возвращает код завершения джобы.
+    """
+    merge_request = context.merge_request
+    merge_author = context.merge_author
 
     # для draft исключаем возможность назначения ревьюверов
     if merge_request['draft']:
@@ -39,12 +77,7 @@ def main(repo_path):
                 draft_message
             )
         print(shared.color_text(draft_message, "red"))
-        sys.exit(0)
-
-    # Загружаем данные об измененных файлах
-    diff = gitlab_service.get_merge_request_changes(merge_request['iid'])
-    print(shared.color_text("В данном МР изменены следующие файлы: ", "yellow"))
-    print(diff)
+        return 0
 
     # текущий список ревьюверов
     # они могли быть назначены ранее
@@ -60,35 +93,26 @@ def main(repo_path):
     # добавляем текущих ревьюверов в список всех ревьюверов
     all_reviewers.update(exists_reviewers)
 
-    # загружаем данные о кодоунерах
-    try:
-        codeowners_data = gitlab_service.get_codeowners_conf(source_branch_name)
-    except KeyError:
-        print(shared.color_text("Не удалось получить конфиг", "red"))
-        exit(1)
-
-    codeowners_paths = codeowners_data['paths']
-    codeowners_teams = codeowners_data['teams']
-    codeowner_users = codeowners_data['users']
-
-    # Соотнесение путей с командами
+    # Соотнесение путей с командами выполнено при сборе контекста
     # _teams - команды которые нашлись по диффу
     # not_found_paths - пути из диффа, для которых нет команд
-    _teams, not_found_paths = shared.get_teams_owners_and_unowned_paths(diff, codeowners_paths)
+    model = context.model
+    _teams, not_found_paths = context.responsible_teams, context.not_found_paths
 
     # Функция get_members_of_teams возвращает словарь {команда: { пользователи }} для найденных команд
-    teams_for_review = shared.get_members_of_teams(_teams, codeowners_teams)
+    with instrumentation.span("membership"):
+        teams_for_review = shared.get_members_of_teams(_teams, model)
+
+        # удаляем автора МР и при необходимости пустые команды
+        clean_teams_for_review = {
+            team: members - {merge_author}   # Удаляем ник из множества
+            for team, members in teams_for_review.items()
+            if members - {merge_author}     # Сохраняем только, если множество непустое
+        }
     if len(teams_for_review) > 0:
         print(shared.color_text("Сырые данные найденных команд. Далее будет произведена очистка", "yellow"))
         print(teams_for_review)
 
-    # удаляем автора МР и при необходимости пустые команды
-    clean_teams_for_review = {
-        team: members - {merge_author}   # Удаляем ник из множества
-        for team, members in teams_for_review.items()
-        if members - {merge_author}     # Сохраняем только, если множество непустое
-    }
-
     reviewers_from_teams = set()
 
     if not clean_teams_for_review:
@@ -119,42 +143,59 @@ def main(repo_path):
     need_random_reviewers_count = need_reviewers_for_mr - len(all_reviewers)
 
     random_reviewers = []
-    if need_random_reviewers_count <= 0:
-        print(shared.color_text("Назначение случайных ревьюверов не требуется", "yellow"))
-    else:
-        message = "Требуется назначить %d случайных ревьюверов" % need_random_reviewers_count
-        print(shared.color_text(message, "yellow"))
+    with instrumentation.span("reviewer_selection"):
+        if need_random_reviewers_count <= 0:
+            print(shared.color_text("Назначение дополнительных ревьюверов не требуется", "yellow"))
+        else:
+            message = "Требуется назначить %d дополнительных ревьюверов" % need_random_reviewers_count
+            print(shared.color_text(message, "yellow"))
 
-        # удаляем команды, которые не должны попадать в случайные ревьюверы
-        teams_for_random_reviewers = [team for team in codeowners_teams if team['name'] not in team_excludes]
-        print(f"teams_for_random_reviewers: {teams_for_random_reviewers}")
-        unique_team_members = set(owner for team in teams_for_random_reviewers for owner in team['team'])
-        print(f"unique_team_members: {unique_team_members}")
+            # удаляем команды, которые не должны попадать в случайные ревьюверы
+            unique_team_members = model.members_outside_teams(team_excludes)
+            print(f"unique_team_members: {unique_team_members}")
 
-        # удаляем автора МР
-        if merge_author in unique_team_members:
-            unique_team_members.remove(merge_author)
+            # удаляем автора МР
+            if merge_author in unique_team_members:
+                unique_team_members.remove(merge_author)
 
-        # удаляем уже назначенных ревьюверов + ревьюверов из найденных команд
-        unique_team_members.difference_update(all_reviewers)
+            # удаляем уже назначенных ревьюверов + ревьюверов из найденных команд
+            unique_team_members.difference_update(all_reviewers)
 
-        print(shared.color_text("Список разработчиков случайного определения ревьюверов:", "yellow"))
-        print(unique_team_members)
+            print(shared.color_text("Кандидаты в дополнительные ревьюверы:", "yellow"))
+            print(unique_team_members)
 
-        random_reviewers = random.sample(list(unique_team_members), need_random_reviewers_count)
-        print(shared.color_text("Итоговый список случайных ревьюверов:", "yellow"))
-        print(random_reviewers)
+            # наименее загруженные кандидаты, по возможности из команд, которых еще нет среди ревьюверов
+            covered_teams = set().union(*(model.user_teams.get(reviewer, ()) for reviewer in all_reviewers))
+            random_reviewers = reviewerScheduler.get_scheduler(gitlab_service).select(
+                unique_team_members, need_random_reviewers_count, model.user_teams, covered_teams,
+                seed=f"{gitlab_service.project_id}:{merge_request['iid']}")
+            print(shared.color_text("Итоговый список дополнительных ревьюверов (наименее загруженные):", "yellow"))
+            print(random_reviewers)
 
-        all_reviewers.update(random_reviewers)
+            all_reviewers.update(random_reviewers)
 
     print(shared.color_text("Итоговый список всех ревьюверов:", "yellow"))
     print(all_reviewers)
 
+    # сохраняем результат в контексте, чтобы джоба проверки апрувов могла не вычислять его заново
+    context.review_teams = clean_teams_for_review
+    context.reviewers = all_reviewers
+
+    # определяем, есть ли среди назначенных ревьюверов новые
+    notifiable_reviewers = all_reviewers.difference(exists_reviewers)
+    if not notifiable_reviewers and not repeat_comment:
+        print(shared.color_text("Новых ревьюверов нет, комментарий и уведомления не отправляются", "yellow"))
+        return 0
+
     # получаем ID все ревьюверов
-    reviewers_ids = shared.extract_ids_by_usernames(codeowner_users, all_reviewers)
+    reviewers_ids = shared.extract_ids_by_usernames(model, all_reviewers, userResolver.get_resolver(gitlab_service))
 
     # устанавливаем ревьюверов в MR
-    gitlab_service.set_approvers(merge_request['iid'], list(reviewers_ids))
+    with instrumentation.span("assign"):
+        gitlab_service.set_approvers(merge_request['iid'], list(reviewers_ids))
+    reviewerScheduler.get_scheduler(gitlab_service).record_assignment(set(all_reviewers) - set(exists_reviewers))
+    instrumentation.increment("reviewers_assigned", len(all_reviewers))
+    instrumentation.increment("random_reviewers", len(random_reviewers))
 
     #
     # КОММЕНТАРИИ И УВЕДОМЛЕНИЯ АВТОРА
@@ -167,13 +208,14 @@ def main(repo_path):
 
     if len(clean_teams_for_review) > 0:
         footer_reviewers_message = footer_reviewers_message + "- C каждой команды не менее 1 аппрува\n"
-        for team_name, members in clean_teams_for_review.items():
-            team_members_with_at = ['@' + member for member in members]
+        # команды и участники сортируются, чтобы при тех же ревьюверах текст комментария не менялся
+        for team_name, members in sorted(clean_teams_for_review.items()):
+            team_members_with_at = ['@' + member for member in sorted(members)]
             table_reviewers_message = table_reviewers_message + f"| {team_name} | {' '.join(team_members_with_at)} |\n"
 
     # смотрим всех оставшихся ревьюверов
     other_reviewers = [reviewer for reviewer in exists_reviewers if reviewer not in reviewers_from_teams]
-    other_reviewers = other_reviewers + random_reviewers
+    other_reviewers = sorted(set(other_reviewers + random_reviewers))
     if len(other_reviewers) > 0:
         print(shared.color_text("Ревьюверы вне групп:", "yellow"))
         print(other_reviewers)
@@ -185,13 +227,11 @@ def main(repo_path):
 
     # оставляем комментарий
     comment_title_reviewers_message = "**Список ревьюверов для данного МР**\n\n"
-    gitlab_service.create_comment(
-        merge_request['iid'],
-        comment_title_reviewers_message + table_reviewers_message + footer_reviewers_message
-    )
-
-    # определяем, есть ли среди назначенных ревьюверов новые
-    notifiable_reviewers = all_reviewers.difference(exists_reviewers)
+    with instrumentation.span("notify"):
+        gitlab_service.create_comment(
+            merge_request['iid'],
+            comment_title_reviewers_message + table_reviewers_message + footer_reviewers_message
+        )
 
     # посылаем сообщение в ММ ревьюверам
     # отправка происходит только в том случае, если есть новые ревьюверы
@@ -200,33 +240,47 @@ def main(repo_path):
     if len(notifiable_reviewers) > 0:
 
         title_reviewers_message = f"[{merge_request['title']}]({merge_request['web_url']})\n\n"
-        # отправка сообщения автору
-        notification_sender.send_interactive_message(
+        # сообщение автору
+        notifications = [notification_sender.interactive_message_payload(
                 merge_author,
                 "Назначены ревьюверы для вашего Merge request",
                 "",
                 "#787878",
                 title_reviewers_message + table_reviewers_message + footer_reviewers_message
-            )
+            )]
 
-        # отправка сообщений ревьюверам
+        # сообщения ревьюверам
         for reviewer in notifiable_reviewers:
             reviewers_notification = (f"Merge Request: [{merge_request['title']}]({merge_request['web_url']})\n" +
                                       f"Автор: @{merge_author}\n\n" +
                                       "[Посмотреть все МР, которые необходимо ревьювить]" +
                                       f"(URL_TO_GITLAB_REPO/-/merge_requests?scope=all&state=opened&reviewer_username={reviewer})")  # noqa: E501
-            notification_sender.send_interactive_message(
+            notifications.append(notification_sender.interactive_message_payload(
                 reviewer,
                 "Требуется ревью",
                 "",
                 "#0086d4",
                 reviewers_notification
-            )
+            ))
+
+        # отправка всех сообщений одной пачкой, ошибки по отдельным получателям не прерывают джобу
+        with instrumentation.span("notify"):
+            results = notification_sender.send_batch(notifications, merge_request_iid=merge_request['iid'])
+        failed_recipients = [
+            username for username, result in results.items()
+            if isinstance(result, Exception) or not result.ok
+        ]
+        if failed_recipients:
+            print(shared.color_text(f"Не удалось отправить сообщения в ММ: {failed_recipients}", "yellow"))
     else:
         print(shared.color_text("Отправка сообщений в ММ не будет производиться", "green"))
 
-    sys.exit(0)
+    return 0
 
 
 if __name__ == "__main__":
-    main(sys.argv[1])
+    try:
+        main(sys.argv[1])
+    finally:
+        # доставка уведомлений, поставленных в outbox (если он включен)
+        outbox.drain_pending()
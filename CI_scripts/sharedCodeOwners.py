@@ -1,58 +1,114 @@
 # import subprocess
 # import requests
 # import json
-# import os
+import os
+
+import compiledIndex
+import localGitDiff
+from ownershipIndex import OwnershipIndex
+from ownershipModel import OwnershipModel
+from configCache import ConfigCache
 
 
 def get_teams_owners_and_unowned_paths(diff_paths, codeowners_paths):
     """Соотносит измененные файлы с командами, указанными в CODEOWNERS, и возвращает список команд,
     ответственных за файлы, а также список файлов, для которых команды не найдены.
+    Вторым параметром передается секция paths из сodeowners.json или заранее построенный индекс
+    (OwnershipIndex или MappedIndex из бинарного индекса).
     """
-    found_teams = set()
-    not_found_paths = []
-    for path in diff_paths:
-        components = path.split('/')
-        team_found = False
-        for owner_path in codeowners_paths.keys():
-            owner_path_items = owner_path[1:].split('/')
-            for module_item, owner_item in zip(components, owner_path_items):
-                if module_item != owner_item:
-                    break
-            else:
-                found_teams.update(codeowners_paths[owner_path])
-                team_found = True
-                break
-        if not team_found:
-            not_found_paths.append(path)
-    return found_teams, not_found_paths
-
-
-def get_members_of_teams(teams, codeowners_teams):
+    if isinstance(codeowners_paths, dict):
+        codeowners_paths = OwnershipIndex(codeowners_paths)
+    return codeowners_paths.match_paths(diff_paths)
+
+
+def get_members_of_teams(teams, model):
     """ Возвращает словарь {команда: { пользователи }}, включающий команды из teams
-    вторым параметром передаются данные о командах из сodeowners.json.
+    вторым параметром передается OwnershipModel, построенная по сodeowners.json.
     """
     return {
-        team: set(team_data['team'])
+        team: model.team_members[team]
         for team in teams
-        for team_data in codeowners_teams
-        if team_data['name'] == team
+        if team in model.team_members
     }
 
 
-def extract_ids_by_usernames(user_list, usernames):
-    """Находит GitLab ID пользователей по их именам из переданного списка пользователей
-    переданный список грузится из сodeowners.json.
+def extract_ids_by_usernames(model, usernames, resolver=None):
+    """Находит GitLab ID пользователей по их именам
+    первым параметром передается OwnershipModel, построенная по сodeowners.json.
+    Если передан userResolver.UserResolver, ID пользователей, которых нет в секции users,
+    запрашиваются у GitLab (или берутся из кэша резолвера), иначе такие пользователи пропускаются.
+    Вместе с ними тем же запросом в кэш резолвера попадают все участники команд без ID в секции users.
     """
-    return {
-        user['gitlab_id']
-        for user in filter(lambda u: u['username'] in usernames, user_list)
-    }
+    if resolver is None:
+        return {
+            model.user_ids[username]
+            for username in usernames
+            if username in model.user_ids
+        }
+    user_ids = resolver.resolve(usernames, model.user_ids, warm=model.all_members)
+    not_found = sorted(set(usernames) - set(user_ids))
+    if not_found:
+        print(color_text(f"Пользователи не найдены в GitLab и не будут назначены: {', '.join(not_found)}", "red"))
+    return set(user_ids.values())
+
+
+def load_ownership_model(gitlab_service, ref, cache=None, blob_id=None):
+    """Загружает OwnershipModel для конфига из ref - целевой ветки МР (исходная ветка не используется:
+    изменения codeowners.json в МР не должны влиять на проверку этого же МР).
+    Если конфиг с текущим blob SHA уже есть в локальном кэше (или модель - в памяти процесса), он не скачивается.
+    Если blob SHA уже известен, он передается в blob_id и повторно не запрашивается.
+    Если задан CODEOWNERS_INDEX_PATH и индекс собран из того же конфига (compileCodeOwners.py),
+    модель открывается прямо из бинарного индекса.
+    При ошибке получения конфига, как и раньше, выбрасывается KeyError.
+    """
+    cache = cache or ConfigCache()
+    blob_id = blob_id or gitlab_service.get_codeowners_conf_blob_id(ref)
+    index_path = os.getenv("CODEOWNERS_INDEX_PATH")
+    if index_path and os.path.exists(index_path):
+        model = compiledIndex.load_model(index_path)
+        if model.blob_id == blob_id:
+            return model
+        print(color_text(f"Индекс {index_path} собран из другой версии конфига и не используется", "yellow"))
+        model.index.close()
+    if not blob_id:
+        return OwnershipModel(gitlab_service.get_codeowners_conf(ref))
+    # одновременные запросы одного конфига (например, МР разных проектов в sweepCodeOwners) скачивают его один раз
+    return cache.get_or_create(blob_id, lambda: gitlab_service.get_codeowners_conf_raw(ref))
+
+
+def iter_diff_paths(repo_path, gitlab_service, merge_request):
+    """Возвращает генератор путей, измененных в МР.
+
+    Режим задается переменной CODEOWNERS_DIFF_SOURCE:
+    - auto (по умолчанию) - diff по локальному репозиторию repo_path, при невозможности - через GitLab API;
+    - local - только локальный репозиторий;
+    - api - только GitLab API.
+    Если repo_path не передан (например, в режиме сервиса), используется GitLab API.
+    """
+    diff_source = os.getenv("CODEOWNERS_DIFF_SOURCE", "auto") if repo_path else "api"
+    if diff_source != "api":
+        target_branch = os.getenv("CI_MERGE_REQUEST_TARGET_BRANCH_NAME") or merge_request['target_branch']
+        try:
+            return localGitDiff.iter_changed_paths(repo_path, target_branch, merge_request['sha'])
+        except localGitDiff.LocalDiffUnavailable as e:
+            if diff_source == "local":
+                raise
+            print(color_text(f"Локальный diff недоступен ({e}), пути будут получены через GitLab API", "yellow"))
+    return gitlab_service.iter_merge_request_diff_paths(merge_request['iid'])
+
+
+def print_paths(paths):
+    """Печатает пути по мере их получения и передает их дальше, не накапливая в памяти."""
+    for path in paths:
+        print(path)
+        yield path
 
 
 def format_teams_to_mm(team_owners):
     table_str = ""
-    for command, usernames in team_owners.items():
-        formatted_usernames = ', '.join(f"@{username}" for username in usernames)
+    # сортировка делает текст стабильным между запусками (нужно для дедупликации уведомлений в outbox)
+    for command, usernames in sorted(team_owners.items()):
+        formatted_usernames = ', '.join(f"@{username}" for username in sorted(usernames))
         table_str += f"{command:<7} - {formatted_usernames}\n"
 
     return table_str
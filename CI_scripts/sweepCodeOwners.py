@@ -0,0 +1,136 @@
+"""Назначение ревьюверов и проверка апрувов для всех открытых МР нескольких проектов за один запуск.
+
+Заменяет отдельные CI-джобы на каждый МР при ночной перепроверке: все проекты обрабатываются
+общим пулом потоков с одним пулом соединений и одним кэшем конфигов, а число одновременно
+обрабатываемых МР каждого проекта ограничено, чтобы не нагружать один репозиторий.
+
+Запуск: python CI_scripts/sweepCodeOwners.py <project_id> [<project_id> ...] [--workers 16] [--per-project 4]
+        [--skip-assign] [--skip-check]
+"""
+import argparse
+import logging
+import os
+import sys
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import sharedCodeOwners as shared
+import gitLabService as gitlab
+import matterMostNotificationSender as mm
+import mergeRequestProcessor as processor
+import notificationOutbox as outbox
+import setCodeOwners
+from configCache import ConfigCache
+
+RESULT_LIST_ERROR = "list_error"
+RESULT_ERROR = "error"
+
+
+class Sweep:
+    """Обход открытых МР нескольких проектов.
+
+    Сначала параллельно запрашиваются списки открытых МР всех проектов (draft МР пропускаются),
+    затем МР раздаются пулу из workers потоков так, чтобы у каждого проекта одновременно
+    обрабатывалось не больше per_project МР. Модели конфигов кэшируются по blob SHA,
+    поэтому МР с одинаковым конфигом (в том числе из разных проектов) используют одну модель.
+    Комментарий со списком ревьюверов и уведомления отправляются только для МР, которым назначены новые ревьюверы,
+    чтобы регулярный запуск не повторял их в каждом МР.
+    """
+
+    def __init__(self, project_ids, workers=None, per_project=None, assign=True, check=True):
+        self.project_ids = [str(project_id) for project_id in project_ids]
+        self.workers = workers or int(os.getenv("CODEOWNERS_SWEEP_WORKERS", "16"))
+        self.per_project = per_project or int(os.getenv("CODEOWNERS_SWEEP_PER_PROJECT", "4"))
+        self.assign = assign
+        self.check = check
+        self.team_excludes = setCodeOwners.read_team_excludes()
+        self.job_name = os.getenv("CI_JOB_NAME", "codeowners")
+
+        # в памяти держится хотя бы по две модели на проект (например, конфиг основной ветки и измененный в МР)
+        self.config_cache = ConfigCache(memory_entries=2 * len(self.project_ids))
+        self.notification_sender = mm.MMNotificationSender()
+        self.gitlab_services = {project_id: gitlab.create_service(project_id=project_id)
+                                for project_id in self.project_ids}
+
+    def _list_merge_requests(self, project_id):
+        return [merge_request for merge_request in self.gitlab_services[project_id].iter_open_merge_requests()
+                if not merge_request['draft']]
+
+    def _process(self, project_id, merge_request):
+        return processor.process_merge_request(self.gitlab_services[project_id], self.notification_sender,
+                                               merge_request, self.config_cache, self.team_excludes, self.job_name,
+                                               self.assign, self.check, repeat_comment=False)
+
+    def run(self):
+        """Обрабатывает все МР. Возвращает {project_id: Counter(результат: число МР)}."""
+        summary = {project_id: Counter() for project_id in self.project_ids}
+        lanes = {}
+        in_flight = Counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            listings = {executor.submit(self._list_merge_requests, project_id): project_id
+                        for project_id in self.project_ids}
+            running = {}
+            pending = set(listings)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in listings:
+                        project_id = listings[future]
+                        try:
+                            lanes[project_id] = deque(future.result())
+                            logging.info(f"Проект {project_id}: открытых МР - {len(lanes[project_id])}")
+                        except Exception:
+                            logging.exception(f"Не удалось получить список МР проекта {project_id}")
+                            summary[project_id][RESULT_LIST_ERROR] += 1
+                        continue
+                    project_id, merge_request = running.pop(future)
+                    in_flight[project_id] -= 1
+                    try:
+                        summary[project_id][future.result()] += 1
+                    except Exception:
+                        logging.exception(f"Ошибка обработки МР {project_id}!{merge_request['iid']}")
+                        summary[project_id][RESULT_ERROR] += 1
+
+                for project_id, lane in lanes.items():
+                    while lane and in_flight[project_id] < self.per_project:
+                        merge_request = lane.popleft()
+                        future = executor.submit(self._process, project_id, merge_request)
+                        running[future] = (project_id, merge_request)
+                        in_flight[project_id] += 1
+                        pending.add(future)
+        return summary
+
+
+def print_summary(summary):
+    results = [processor.RESULT_APPROVED, processor.RESULT_NOT_APPROVED, processor.RESULT_ASSIGNED,
+               processor.RESULT_CONFIG_ERROR, RESULT_ERROR, RESULT_LIST_ERROR]
+    print(f"{'project':<12}" + "".join(f"{result:>14}" for result in results))
+    for project_id, counts in summary.items():
+        line = f"{project_id:<12}" + "".join(f"{counts[result]:>14}" for result in results)
+        failed = counts[processor.RESULT_CONFIG_ERROR] or counts[RESULT_ERROR] or counts[RESULT_LIST_ERROR]
+        print(shared.color_text(line, "red" if failed else "green"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("project_ids", nargs="+")
+    parser.add_argument("--workers", type=int, help="размер общего пула потоков")
+    parser.add_argument("--per-project", type=int, help="максимум одновременно обрабатываемых МР одного проекта")
+    parser.add_argument("--skip-assign", action="store_true", help="не назначать ревьюверов")
+    parser.add_argument("--skip-check", action="store_true", help="не проверять апрувы")
+    args = parser.parse_args()
+
+    sweep = Sweep(args.project_ids, args.workers, args.per_project, not args.skip_assign, not args.skip_check)
+    summary = sweep.run()
+    print_summary(summary)
+
+    errors = (RESULT_ERROR, RESULT_LIST_ERROR, processor.RESULT_CONFIG_ERROR)
+    sys.exit(1 if any(counts[result] for counts in summary.values() for result in errors) else 0)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        # доставка уведомлений, поставленных в outbox (если он включен)
+        outbox.drain_pending()
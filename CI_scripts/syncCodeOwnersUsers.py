@@ -0,0 +1,94 @@
+"""Обновляет секцию users в codeowners.json по данным GitLab.
+
+Запуск: python CI_scripts/syncCodeOwnersUsers.py codeowners.json [--check] [--prune]
+
+Для всех участников команд одним обращением запрашиваются GitLab ID (через userResolver, REST API
+или GraphQL при CODEOWNERS_GITLAB_API=graphql), после чего:
+- участники без записи в users добавляются с gitlab_id и именем из GitLab;
+- у записей с устаревшим gitlab_id он исправляется, имена существующих записей не меняются;
+- с --prune удаляются записи пользователей, которые не входят ни в одну команду или не найдены в GitLab.
+С --check файл не изменяется, а джоба завершается с ошибкой, если секция users устарела.
+Файл записывается в том же формате, что и RaifMagic (сортировка ключей, отступ 2, " : ").
+Нужны CI_SERVER_URL и PRIVATE_TOKEN.
+"""
+import argparse
+import json
+import sys
+
+import sharedCodeOwners as shared
+import gitLabService as gitlab
+import userResolver
+
+
+def sync_users(codeowners_data, lookup, prune=False):
+    """Возвращает (новая секция users, список изменений). lookup - {username: запись UserResolver}."""
+    members = {member for team in codeowners_data['teams'] for member in team['team']}
+    changes = []
+    users = []
+    for user in codeowners_data['users']:
+        username = user['username']
+        entry = lookup.get(username)
+        if entry is not None and entry['id'] is None:
+            if prune:
+                changes.append(f"удален {username}: не найден в GitLab")
+                continue
+            changes.append(f"{username} не найден в GitLab")
+        elif username not in members and prune:
+            changes.append(f"удален {username}: не входит ни в одну команду")
+            continue
+        if entry is not None and entry['id'] is not None and entry['id'] != user.get('gitlab_id'):
+            changes.append(f"{username}: gitlab_id {user.get('gitlab_id')} -> {entry['id']}")
+            user = dict(user, gitlab_id=entry['id'])
+        users.append(user)
+
+    listed = {user['username'] for user in codeowners_data['users']}
+    for username in sorted(members - listed):
+        entry = lookup.get(username)
+        if entry is None or entry['id'] is None:
+            changes.append(f"{username} не найден в GitLab, запись не добавлена")
+            continue
+        users.append({'gitlab_id': entry['id'], 'name': entry['name'] or username, 'username': username})
+        changes.append(f"добавлен {username} (gitlab_id {entry['id']})")
+    return users, changes
+
+
+def dump_config(codeowners_data):
+    """Сериализует конфиг так же, как RaifMagic, чтобы синхронизация не меняла форматирование файла."""
+    text = json.dumps(codeowners_data, indent=2, sort_keys=True, ensure_ascii=False, separators=(',', ' : '))
+    return text.replace("/", "\\/") + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("config", help="путь к codeowners.json")
+    parser.add_argument("--check", action="store_true", help="не менять файл, завершиться с ошибкой при расхождениях")
+    parser.add_argument("--prune", action="store_true",
+                        help="удалить пользователей вне команд и не найденных в GitLab")
+    args = parser.parse_args()
+
+    with open(args.config, encoding='utf-8') as file:
+        codeowners_data = json.load(file)
+
+    members = {member for team in codeowners_data['teams'] for member in team['team']}
+    listed = {user['username'] for user in codeowners_data['users']}
+    resolver = userResolver.UserResolver(gitlab.create_service())
+    lookup = resolver.lookup(members | listed, refresh=True)
+    users, changes = sync_users(codeowners_data, lookup, args.prune)
+
+    for change in changes:
+        print(shared.color_text(change, "yellow"))
+    updated = users != codeowners_data['users']
+    if not updated:
+        print(shared.color_text("Секция users актуальна", "green"))
+    elif args.check:
+        print(shared.color_text("Секция users устарела, запустите syncCodeOwnersUsers.py без --check", "red"))
+        sys.exit(1)
+    else:
+        codeowners_data['users'] = users
+        with open(args.config, 'w', encoding='utf-8') as file:
+            file.write(dump_config(codeowners_data))
+        print(f"Секция users обновлена: {len(users)} пользователей, запрошено в GitLab {resolver.lookups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Определение GitLab ID пользователей, которых нет в секции users сodeowners.json.
+
+Ревьюверы без записи в users раньше молча пропускались при назначении. UserResolver находит их ID
+одним обращением на все недостающие имена (gitLabService.GitLabService.get_gitlab_users) и сохраняет
+результат в файловый кэш, в том числе для имен, которых в GitLab нет, поэтому повторные джобы
+не обращаются к GitLab за пользователями:
+- CODEOWNERS_USER_CACHE_PATH - файл кэша (по умолчанию users-<хост GitLab>.json в CODEOWNERS_CACHE_DIR);
+- CODEOWNERS_USER_CACHE_TTL - сколько секунд хранится найденный пользователь (по умолчанию неделя);
+- CODEOWNERS_USER_CACHE_NEGATIVE_TTL - сколько секунд хранится отсутствие пользователя (по умолчанию сутки);
+- CODEOWNERS_USER_LOOKUP_WORKERS - число параллельных запросов REST API (по умолчанию 8).
+Секцию users в самом конфиге обновляет syncCodeOwnersUsers.py.
+"""
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def default_cache_path(gitlab_url):
+    cache_dir = os.getenv("CODEOWNERS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "codeowners"))
+    host = urlsplit(gitlab_url).netloc.replace(":", "_") or "gitlab"
+    return os.path.join(cache_dir, f"users-{host}.json")
+
+
+class UserResolver:
+    """Находит GitLab ID пользователей по именам с кэшированием в памяти и в файле.
+
+    Записи кэша: {username: {"id": ID или None, "name": имя, "fetched_at": время запроса}}.
+    Запись с id None означает, что пользователя в GitLab нет, она живет negative_ttl секунд.
+    """
+
+    def __init__(self, gitlab_service, cache_path=None, ttl=None, negative_ttl=None, max_workers=None):
+        self.gitlab_service = gitlab_service
+        self.cache_path = (cache_path or os.getenv("CODEOWNERS_USER_CACHE_PATH")
+                           or default_cache_path(gitlab_service.gitlab_url))
+        self.ttl = ttl if ttl is not None else int(os.getenv("CODEOWNERS_USER_CACHE_TTL", str(7 * 24 * 3600)))
+        self.negative_ttl = (negative_ttl if negative_ttl is not None
+                             else int(os.getenv("CODEOWNERS_USER_CACHE_NEGATIVE_TTL", str(24 * 3600))))
+        self.max_workers = max_workers or int(os.getenv("CODEOWNERS_USER_LOOKUP_WORKERS", "8"))
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.cache_path, encoding='utf-8') as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _fresh(self, entry, now):
+        ttl = self.ttl if entry.get("id") is not None else self.negative_ttl
+        return now - entry.get("fetched_at", 0) < ttl
+
+    def _save(self):
+        """Записывает кэш, добавляя записи, которые за это время сохранили параллельные джобы."""
+        try:
+            with open(self.cache_path, encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            stored = {}
+        for username, entry in self._entries.items():
+            if entry.get("fetched_at", 0) >= stored.get(username, {}).get("fetched_at", 0):
+                stored[username] = entry
+        self._entries = stored
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(directory, exist_ok=True)
+            # атомарная замена, чтобы параллельные джобы не читали недописанный файл
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(stored, file, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить кэш пользователей: {e}")
+
+    def lookup(self, usernames, refresh=False):
+        """Возвращает {username: запись кэша} для всех usernames.
+        Устаревшие и отсутствующие в кэше имена запрашиваются у GitLab одним вызовом get_gitlab_users,
+        с refresh=True запрашиваются все имена.
+        """
+        usernames = set(usernames)
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            missing = sorted(username for username in usernames
+                             if refresh or username not in entries or not self._fresh(entries[username], now))
+            if missing:
+                users = self.gitlab_service.get_gitlab_users(missing, max_workers=self.max_workers)
+                self.lookups += len(missing)
+                for username in missing:
+                    user = users.get(username)
+                    entries[username] = {"id": user['id'] if user else None,
+                                         "name": user.get('name') if user else None, "fetched_at": now}
+                self._save()
+                entries = self._entries
+                logging.info(f"Пользователи GitLab: запрошено {len(missing)}, из кэша {len(usernames) - len(missing)}")
+            return {username: entries[username] for username in usernames}
+
+    def resolve(self, usernames, known_ids=None, warm=()):
+        """Возвращает {username: gitlab_id} для usernames. ID из known_ids (секция users конфига)
+        используются без запросов, неизвестные GitLab имена в результат не попадают.
+        Имена из warm, которых нет в known_ids, запрашиваются тем же вызовом и только сохраняются в кэше,
+        чтобы следующие МР с другими ревьюверами не обращались к GitLab.
+        """
+        known_ids = known_ids or {}
+        result = {username: known_ids[username] for username in usernames if username in known_ids}
+        unresolved = [username for username in usernames if username not in known_ids]
+        if unresolved:
+            try:
+                entries = self.lookup(set(unresolved).union(warm).difference(known_ids))
+            except Exception as e:
+                # без ответа GitLab назначаются только пользователи из секции users, как раньше
+                logging.warning(f"Не удалось запросить пользователей GitLab: {e}")
+                return result
+            for username in unresolved:
+                if entries[username]["id"] is not None:
+                    result[username] = entries[username]["id"]
+        return result
+
+
+def get_resolver(gitlab_service):
+    """Возвращает общий UserResolver для экземпляра GitLab, создавая его при первом обращении."""
+    with _resolvers_lock:
+        resolver = _resolvers.get(gitlab_service.gitlab_url)
+        if resolver is None:
+            resolver = _resolvers[gitlab_service.gitlab_url] = UserResolver(gitlab_service)
+        return resolver
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    project TEXT NOT NULL,
+    merge_request TEXT NOT NULL,
+    head_sha TEXT NOT NULL,
+    config_sha TEXT NOT NULL,
+    context TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (project, merge_request, head_sha, config_sha)
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    project TEXT NOT NULL,
+    merge_request TEXT NOT NULL,
+    head_sha TEXT NOT NULL,
+    config_sha TEXT NOT NULL,
+    approvers TEXT NOT NULL,
+    code INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (project, merge_request, head_sha, config_sha, approvers)
+);
+"""
+
+
+class VerdictStore:
+    """Локальное хранилище результатов проверки апрувов на SQLite.
+
+    - evaluations - сериализованный EvaluationContext (ответственные команды и их состав) для
+      (проект, МР, SHA коммита, SHA конфига): пока они не меняются, diff и конфиг не нужны;
+    - verdicts - код завершения проверки для того же ключа и отсортированного набора апруверов:
+      повторная проверка с тем же набором апрувов не нужна вовсе.
+    Записи старше CODEOWNERS_VERDICT_RETENTION часов удаляются.
+    """
+
+    def __init__(self, path, retention_hours=None):
+        self.path = path
+        self.retention = 3600 * (retention_hours if retention_hours is not None else
+                                 float(os.getenv("CODEOWNERS_VERDICT_RETENTION", "168")))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+        self._purge()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _purge(self):
+        expired = time.time() - self.retention
+        with self._connect() as connection:
+            connection.execute("DELETE FROM evaluations WHERE created_at < ?", (expired,))
+            connection.execute("DELETE FROM verdicts WHERE created_at < ?", (expired,))
+
+    @staticmethod
+    def approvers_key(approvers):
+        return json.dumps(sorted(set(approvers)), ensure_ascii=False)
+
+    def get_evaluation(self, key):
+        """Возвращает сохраненный словарь контекста для key = (проект, МР, SHA коммита, SHA конфига) или None."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT context FROM evaluations WHERE project = ? AND merge_request = ? AND head_sha = ? "
+                "AND config_sha = ?", tuple(map(str, key))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_evaluation(self, key, context_data):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO evaluations (project, merge_request, head_sha, config_sha, context, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (*map(str, key), json.dumps(context_data, ensure_ascii=False), time.time()))
+
+    def get_verdict(self, key, approvers):
+        """Возвращает код завершения проверки для key и набора апруверов или None."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT code FROM verdicts WHERE project = ? AND merge_request = ? AND head_sha = ? "
+                "AND config_sha = ? AND approvers = ?", (*map(str, key), self.approvers_key(approvers))).fetchone()
+        return row[0] if row else None
+
+    def put_verdict(self, key, approvers, code):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO verdicts (project, merge_request, head_sha, config_sha, approvers, code, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*map(str, key), self.approvers_key(approvers), code, time.time()))
+        logging.debug(f"Вердикт для {key} сохранен: {code}")
+
+
+_store = None
+
+
+def get_store():
+    """Возвращает хранилище, если задана переменная CODEOWNERS_VERDICT_STORE, иначе None (проверка всегда полная)."""
+    global _store
+    path = os.getenv("CODEOWNERS_VERDICT_STORE")
+    if not path:
+        return None
+    if _store is None or _store.path != path:
+        _store = VerdictStore(path)
+    return _store
@@ -0,0 +1,214 @@
+"""Долгоживущий сервис CodeOwners, обрабатывающий вебхуки GitLab вместо отдельной CI-джобы на каждый МР.
+
+Сервис принимает "Merge Request Hook" (в том числе события approved/unapproved), назначает ревьюверов
+и проверяет апрувы (см. mergeRequestProcessor.py), а результат проверки публикует статусом коммита.
+Модель конфига и пул соединений живут в памяти между событиями.
+Без CODEOWNERS_WEBHOOK_SECRET сервис запускается только с флагом --insecure.
+
+Запуск: python CI_scripts/webhookService.py [--host 0.0.0.0] [--port 8080] [--insecure]
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gitLabService as gitlab
+import matterMostNotificationSender as mm
+import notificationOutbox as outbox
+import mergeRequestProcessor as processor
+import setCodeOwners
+from configCache import ConfigCache
+
+# действия вебхука, после которых нужно заново назначить ревьюверов
+ASSIGN_ACTIONS = {"open", "reopen", "update"}
+# действия вебхука, после которых нужно заново проверить апрувы
+CHECK_ACTIONS = {"open", "reopen", "update", "approved", "unapproved", "approval", "unapproval"}
+# максимальный размер тела вебхука по умолчанию, для больших запросов сервис отвечает 413
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookService:
+    """Очередь событий МР с объединением повторных событий и ограниченным числом обработчиков.
+
+    Пока событие МР ждет обработки, новые события того же МР не ставятся в очередь повторно,
+    а лишь дополняют уже ожидающее (например, к проверке апрувов добавляется назначение ревьюверов).
+    Один МР никогда не обрабатывается двумя обработчиками одновременно.
+    """
+
+    def __init__(self, workers=None, queue_size=None, secret=None, insecure=False, max_body_size=None):
+        self.workers = workers or int(os.getenv("CODEOWNERS_WEBHOOK_WORKERS", "4"))
+        self.queue_size = queue_size or int(os.getenv("CODEOWNERS_WEBHOOK_QUEUE_SIZE", "1000"))
+        self.secret = secret if secret is not None else os.getenv("CODEOWNERS_WEBHOOK_SECRET")
+        if not self.secret and not insecure:
+            # без секрета любой, кто может обратиться к сервису, запускает назначение ревьюверов и уведомления
+            raise ValueError("не задан CODEOWNERS_WEBHOOK_SECRET (для запуска без проверки токена нужен --insecure)")
+        self.max_body_size = max_body_size or int(os.getenv("CODEOWNERS_WEBHOOK_MAX_BODY_SIZE", str(MAX_BODY_SIZE)))
+        self.team_excludes = setCodeOwners.read_team_excludes()
+        self.job_name = os.getenv("CI_JOB_NAME", "codeowners")
+
+        self.config_cache = ConfigCache()
+        self.notification_sender = mm.MMNotificationSender()
+        self._gitlab_services = {}
+        self._gitlab_services_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        self._queue = None
+        self._pending = {}
+        self._in_progress = set()
+
+    def _gitlab_service(self, project_id):
+        with self._gitlab_services_lock:
+            if project_id not in self._gitlab_services:
+                self._gitlab_services[project_id] = gitlab.create_service(project_id=project_id)
+            return self._gitlab_services[project_id]
+
+    #
+    # ОЧЕРЕДЬ
+    #
+
+    def submit(self, project_id, merge_request_iid, assign, check):
+        """Добавляет событие МР. Возвращает False, если очередь переполнена."""
+        key = (str(project_id), merge_request_iid)
+        if key in self._pending:
+            pending_assign, pending_check = self._pending[key]
+            self._pending[key] = (pending_assign or assign, pending_check or check)
+            logging.debug(f"Событие МР {key} объединено с ожидающим")
+            return True
+        if self._queue.full():
+            return False
+        self._pending[key] = (assign, check)
+        if key not in self._in_progress:
+            self._queue.put_nowait(key)
+        return True
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key = await self._queue.get()
+            assign, check = self._pending.pop(key)
+            self._in_progress.add(key)
+            try:
+                await loop.run_in_executor(self._executor, self.process, key[0], key[1], assign, check)
+            except Exception:
+                logging.exception(f"Ошибка обработки МР {key}")
+            finally:
+                self._in_progress.discard(key)
+                # пока МР обрабатывался, для него могли прийти новые события
+                if key in self._pending:
+                    try:
+                        self._queue.put_nowait(key)
+                    except asyncio.QueueFull:
+                        logging.warning(f"Очередь переполнена, событие МР {key} отброшено")
+                        self._pending.pop(key)
+                self._queue.task_done()
+
+    #
+    # ОБРАБОТКА
+    #
+
+    def process(self, project_id, merge_request_iid, assign, check):
+        """Выполняет назначение ревьюверов и/или проверку апрувов одного МР (в потоке пула)."""
+        gitlab_service = self._gitlab_service(project_id)
+        merge_request = gitlab_service.get_merge_request(merge_request_iid)
+        if merge_request.get('state') != 'opened':
+            return
+
+        processor.process_merge_request(gitlab_service, self.notification_sender, merge_request, self.config_cache,
+                                        self.team_excludes, self.job_name, assign, check)
+        outbox.drain_pending()
+
+    #
+    # HTTP
+    #
+
+    def handle_event(self, event, payload):
+        """Разбирает вебхук GitLab и ставит МР в очередь. Возвращает HTTP-код ответа."""
+        if event != "Merge Request Hook":
+            return 204
+        attributes = payload.get("object_attributes", {})
+        action = attributes.get("action")
+        changes = payload.get("changes") or {}
+        draft_toggled = "draft" in changes or "work_in_progress" in changes
+        if action == "update":
+            # update без новых коммитов (смена описания, меток и т.п.) не влияет на ревьюверов, кроме снятия
+            # или установки draft; для draft МР назначение лишь публикует комментарий, поэтому новые коммиты
+            # в draft МР его не повторяют
+            draft = attributes.get("draft", attributes.get("work_in_progress"))
+            assign = draft_toggled or ("oldrev" in attributes and not draft)
+        else:
+            assign = action in ASSIGN_ACTIONS
+        check = action in CHECK_ACTIONS
+        if not (assign or check):
+            return 204
+        project_id = payload.get("project", {}).get("id") or attributes.get("target_project_id")
+        if not self.submit(project_id, attributes["iid"], assign, check):
+            return 503
+        return 202
+
+    async def _handle_connection(self, reader, writer):
+        status = 400
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            content_length = int(headers.get("content-length", "0"))
+
+            # тело читается только после проверки токена и размера
+            if not request_line.startswith(b"POST"):
+                status = 405
+            elif self.secret and not hmac.compare_digest(headers.get("x-gitlab-token", "").encode(),
+                                                         self.secret.encode()):
+                status = 401
+            elif content_length > self.max_body_size:
+                status = 413
+            elif content_length >= 0:
+                payload = json.loads(await reader.readexactly(content_length) or b"{}")
+                if isinstance(payload, dict):
+                    status = self.handle_event(headers.get("x-gitlab-event"), payload)
+        except (ValueError, KeyError, AttributeError, TypeError, asyncio.IncompleteReadError) as e:
+            logging.warning(f"Некорректный вебхук: {e}")
+        writer.write(f"HTTP/1.1 {status} -\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        logging.info(f"CodeOwners webhook service слушает {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("CODEOWNERS_WEBHOOK_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("CODEOWNERS_WEBHOOK_PORT", "8080")))
+    parser.add_argument("--insecure", action="store_true",
+                        help="разрешить запуск без CODEOWNERS_WEBHOOK_SECRET (вебхуки принимаются без проверки токена)")
+    args = parser.parse_args()
+    try:
+        service = WebhookService(insecure=args.insecure)
+    except ValueError as e:
+        parser.error(str(e))
+    asyncio.run(service.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()